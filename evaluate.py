@@ -118,11 +118,21 @@ def evaluate_final_screenshot(guideline):
 
 def run_test_case(objective, guideline, model):
     """Returns True if the result of the test with the given prompt meets the given guideline for the given model."""
-    # Run `operate` with the model to evaluate and the test case prompt
-    subprocess.run(
-        ["operate", "-m", model, "--prompt", f'"{objective}"'],
-        stdout=subprocess.DEVNULL,
-    )
+    server = os.getenv("OPERATE_SERVER")
+    if server:
+        # Reuse a resident `operate serve` instead of starting a process per test case
+        from operate.serve import ServeClient
+
+        client = ServeClient(server)
+        session = client.submit(objective, model)
+        for _ in client.events(session["id"]):
+            pass
+    else:
+        # Run `operate` with the model to evaluate and the test case prompt
+        subprocess.run(
+            ["operate", "-m", model, "--prompt", f'"{objective}"'],
+            stdout=subprocess.DEVNULL,
+        )
 
     try:
         result = evaluate_final_screenshot(guideline)
@@ -0,0 +1,438 @@
+"""
+Batch runs.
+
+`operate --batch tasks.jsonl` runs every objective of a JSON lines file:
+
+    {"id": "login", "prompt": "Log in to Github", "model": "gpt-4-with-ocr", "max_steps": 15, "max_cost": 0.5, "timeout": 300}
+
+Only `prompt` (or `objective`) is required; the other fields default to the
+command line. The budget fields of `operate.utils.budget` (`max_steps`,
+`max_seconds`, `max_input_tokens`, `max_output_tokens`, `max_cost`) end a
+task with the `budget` outcome. A timed out task is stopped before its next
+step.
+
+Every finished task is appended to the results file with its outcome, step
+count, wall time, token usage and per-stage latency, so a partial batch
+keeps its results.
+
+Tasks drive a desktop, so by default they run one after another in this
+process and reuse its warm models and provider clients. With
+`--displays :1,:2`, one worker process per X display runs tasks
+concurrently and keeps its own models warm; `--concurrency` caps the number
+of workers. `--xvfb N` starts N virtual displays instead (see
+`operate.utils.displays`) and restarts the display of a worker that had to
+be killed. With `--shared-inference` the workers share one OCR/YOLO server
+(see `operate.utils.inference`) instead of loading the models each.
+"""
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from operate.config import Config
+from operate.utils.budget import Budget, estimate_cost
+from operate.utils.displays import DEFAULT_SIZE, DisplayPool
+from operate.utils.inference import inference_address, start_server
+from operate.utils.style import ANSI_BLUE, ANSI_GREEN, ANSI_RED, ANSI_RESET
+from operate.utils.timing import start_recording, stop_recording
+
+# Load configuration
+config = Config()
+
+# extra time a worker gets past the task timeout before it is killed
+KILL_GRACE = 60
+
+
+def load_tasks(path, model, budget=None, timeout=None):
+    """
+    Read the tasks of a JSON lines file and fill in the defaults
+    """
+    tasks = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {e}")
+            prompt = entry.get("prompt") or entry.get("objective")
+            if not prompt:
+                raise ValueError(f"{path}:{number}: `prompt` is required")
+            try:
+                limits = Budget.from_dict(entry, default=budget).to_dict()
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+            tasks.append(
+                {
+                    "id": str(entry.get("id", number)),
+                    "prompt": prompt,
+                    "model": entry.get("model") or model,
+                    **limits,
+                    "timeout": entry.get("timeout", timeout),
+                }
+            )
+    return tasks
+
+
+def run_task(task, on_event=None):
+    """
+    Run one task in this process and return its result record
+    """
+    from operate.operate import run_objective
+
+    cancel_event = threading.Event()
+    timer = None
+    if task.get("timeout"):
+        timer = threading.Timer(float(task["timeout"]), cancel_event.set)
+        timer.daemon = True
+        timer.start()
+
+    recorder = start_recording()
+    start_time = time.perf_counter()
+    try:
+        result = run_objective(
+            task["model"],
+            task["prompt"],
+            Budget.from_dict(task),
+            on_event=on_event,
+            cancel_event=cancel_event,
+        )
+    finally:
+        stop_recording()
+        if timer is not None:
+            timer.cancel()
+
+    if result["outcome"] == "cancelled" and cancel_event.is_set():
+        result["outcome"] = "timeout"
+    return {
+        "id": task.get("id"),
+        "prompt": task["prompt"],
+        "model": task["model"],
+        **result,
+        "wall": round(time.perf_counter() - start_time, 3),
+        "display": os.getenv("DISPLAY"),
+        "usage": dict(recorder.counters),
+        "cost": estimate_cost(task["model"], recorder.counters),
+        "stages": recorder.summary(),
+    }
+
+
+class BatchWorker:
+    """
+    `python -m operate.batch --worker` on one display. Tasks go in on stdin
+    and result records come back on stdout, one JSON object per line.
+
+    `display` is a display name or a `VirtualDisplay` of `pool`, which is
+    restarted along with the worker when the worker has to be killed.
+    """
+
+    def __init__(self, display, log_path=None, trace=None, verbose=False, pool=None):
+        self.display = display
+        self.log_path = log_path
+        self.trace = trace
+        self.verbose = verbose
+        self.pool = pool
+        self._process = None
+        self._lines = None
+        self._log = None
+
+    @property
+    def display_name(self):
+        return getattr(self.display, "name", self.display)
+
+    def _start(self):
+        env = dict(os.environ, DISPLAY=self.display_name)
+        if self.trace:
+            env["OPERATE_TRACE"] = self.trace
+        command = [sys.executable, "-m", "operate.batch", "--worker"]
+        if self.verbose:
+            command.append("--verbose")
+        if self.log_path:
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        self._process = subprocess.Popen(
+            command,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._log,
+            text=True,
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=_read_lines,
+            args=(self._process.stdout, self._lines),
+            name=f"batch-worker-{self.display_name}",
+            daemon=True,
+        ).start()
+
+    def run(self, task):
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+        deadline = float(task["timeout"]) + KILL_GRACE if task.get("timeout") else None
+        display_name = self.display_name
+        try:
+            self._process.stdin.write(json.dumps(task) + "\n")
+            self._process.stdin.flush()
+            line = self._lines.get(timeout=deadline)
+        except queue.Empty:
+            self._kill()
+            return _failed(task, "timeout", "worker did not stop in time", display_name)
+        except (BrokenPipeError, OSError) as e:
+            self._kill()
+            return _failed(task, "error", f"worker failed: {e}", display_name)
+        if line is None:
+            self._kill()
+            return _failed(task, "error", "worker exited", display_name)
+        return json.loads(line)
+
+    def _kill(self):
+        self.close(kill=True)
+        if self.pool is not None:
+            # the next task gets a clean screen
+            self.pool.recycle(self.display)
+
+    def close(self, kill=False):
+        if self._process is not None:
+            if kill:
+                self._process.kill()
+            else:
+                self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+def run_batch(
+    path,
+    model,
+    output=None,
+    displays=None,
+    concurrency=None,
+    budget=None,
+    timeout=None,
+    trace=None,
+    verbose=False,
+    xvfb=0,
+    resolution=DEFAULT_SIZE,
+    shared_inference=False,
+):
+    """
+    Run the tasks of `path` and append their results to `output`.
+    Returns the number of tasks that did not finish with `done`.
+    """
+    tasks = load_tasks(path, model, budget, timeout)
+    if output is None:
+        output = os.path.splitext(path)[0] + ".results.jsonl"
+    displays = [display for display in (displays or []) if display]
+    available = xvfb or len(displays)
+    if concurrency and concurrency > 1 and available < concurrency:
+        raise ValueError(
+            f"--concurrency {concurrency} needs as many displays, got {available}"
+        )
+
+    config.verbose = verbose
+    for task_model in sorted({task["model"] for task in tasks}):
+        config.validation(task_model, False)
+
+    print(
+        f"{ANSI_GREEN}[operate batch]{ANSI_RESET} {len(tasks)} tasks from {path}, results in {output}"
+    )
+    pool = None
+    if xvfb:
+        count = min(xvfb, concurrency or xvfb, len(tasks))
+        pool = DisplayPool(count, resolution, verbose=verbose).start()
+        displays = [pool.acquire() for _ in range(count)]
+        print(
+            f"{ANSI_GREEN}[operate batch]{ANSI_RESET} started virtual displays {', '.join(pool.names())}"
+        )
+    elif concurrency:
+        displays = displays[:concurrency]
+
+    results = []
+    lock = threading.Lock()
+
+    def record(result):
+        with lock:
+            results.append(result)
+            with open(output, "a", encoding="utf-8") as file:
+                file.write(json.dumps(result, default=str) + "\n")
+            color = ANSI_GREEN if result["outcome"] == "done" else ANSI_RED
+            print(
+                f"{ANSI_BLUE}[operate batch]{ANSI_RESET} {result['id']}: {color}{result['outcome']}{ANSI_RESET} "
+                f"in {result['steps']} steps, {result.get('wall', 0):.1f}s"
+            )
+
+    inference = None
+    try:
+        if len(displays) > 1:
+            if shared_inference and not inference_address():
+                inference = _start_inference(tasks, output, verbose)
+            _run_pooled(tasks, displays, output, trace, verbose, record, pool)
+        else:
+            _run_sequential(tasks, displays, trace, verbose, record)
+    finally:
+        if inference is not None:
+            inference.terminate()
+            inference.wait()
+            os.environ.pop("OPERATE_INFERENCE", None)
+        if pool is not None:
+            pool.close()
+
+    print_summary(results)
+    return sum(1 for result in results if result["outcome"] != "done")
+
+
+def _run_sequential(tasks, displays, trace, verbose, record):
+    from operate.utils import tracing
+    from operate.utils.warmup import warm_up
+
+    if displays:
+        os.environ["DISPLAY"] = getattr(displays[0], "name", displays[0])
+    if trace:
+        tracing.configure(trace, verbose=verbose)
+    for task_model in sorted({task["model"] for task in tasks}):
+        warm_up(task_model, verbose=verbose)
+    try:
+        for task in tasks:
+            try:
+                record(run_task(task))
+            except Exception as e:
+                record(_failed(task, "error", str(e), os.getenv("DISPLAY")))
+    finally:
+        tracing.shutdown()
+
+
+def _start_inference(tasks, output, verbose):
+    from operate.utils.warmup import OCR_MODELS, YOLO_MODELS
+
+    models = {task["model"] for task in tasks}
+    preload = [
+        name
+        for name, names in (("ocr", OCR_MODELS), ("yolo", YOLO_MODELS))
+        if models & names
+    ]
+    base = os.path.splitext(output)[0]
+    address = f"{base}.inference.sock"
+    process = start_server(address, preload, log_path=f"{base}.inference.log", verbose=verbose)
+    # the workers inherit the environment
+    os.environ["OPERATE_INFERENCE"] = address
+    print(f"{ANSI_GREEN}[operate batch]{ANSI_RESET} shared inference server on unix:{address}")
+    return process
+
+
+def _run_pooled(tasks, displays, output, trace, verbose, record, pool=None):
+    pending = queue.Queue()
+    for task in tasks:
+        pending.put(task)
+    base = os.path.splitext(output)[0]
+
+    def work(index, display):
+        worker = BatchWorker(
+            display,
+            log_path=f"{base}.worker{index}.log",
+            trace=f"{os.path.splitext(trace)[0]}.worker{index}.jsonl" if trace else None,
+            verbose=verbose,
+            pool=pool,
+        )
+        try:
+            while True:
+                try:
+                    task = pending.get_nowait()
+                except queue.Empty:
+                    return
+                record(worker.run(task))
+        finally:
+            worker.close()
+
+    threads = [
+        threading.Thread(target=work, args=(index, display), name=f"batch-worker{index}")
+        for index, display in enumerate(displays)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def print_summary(results):
+    outcomes = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    tokens = sum(
+        result.get("usage", {}).get("input_tokens", 0)
+        + result.get("usage", {}).get("output_tokens", 0)
+        for result in results
+    )
+    cost = sum(result.get("cost") or 0 for result in results)
+    counts = ", ".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items()))
+    print(
+        f"{ANSI_GREEN}[operate batch]{ANSI_RESET} {len(results)} tasks: {counts}; {tokens} tokens, ~${cost:.2f}"
+    )
+
+
+def worker_main(verbose=False):
+    """
+    Serve tasks from stdin until it closes. Everything the agent loop prints
+    goes to stderr so stdout only carries result records.
+    """
+    from operate.utils import tracing
+    from operate.utils.warmup import warm_up
+
+    results = sys.stdout
+    sys.stdout = sys.stderr
+    config.verbose = verbose
+    tracing.configure_from_env()
+    warmed = set()
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            task = json.loads(line)
+            try:
+                if task["model"] not in warmed:
+                    config.validation(task["model"], False)
+                    warm_up(task["model"], verbose=verbose)
+                    warmed.add(task["model"])
+                result = run_task(task)
+            except Exception as e:
+                result = _failed(task, "error", str(e), os.getenv("DISPLAY"))
+            results.write(json.dumps(result, default=str) + "\n")
+            results.flush()
+    finally:
+        tracing.shutdown()
+    return 0
+
+
+def _read_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def _failed(task, outcome, summary, display):
+    return {
+        "id": task.get("id"),
+        "prompt": task.get("prompt"),
+        "model": task.get("model"),
+        "outcome": outcome,
+        "steps": 0,
+        "summary": summary,
+        "wall": 0,
+        "display": display,
+        "usage": {},
+        "cost": None,
+        "stages": {},
+    }
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        sys.exit(worker_main(verbose="--verbose" in sys.argv))
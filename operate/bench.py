@@ -0,0 +1,481 @@
+"""
+End-to-end and micro benchmarks for the agent pipeline.
+
+`operate bench` runs synthetic scenarios (see `operate.mock.desktop`) against
+the local mock provider, or replays recorded cassettes, through the real
+`run_objective` loop and reports the time spent in every pipeline stage.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from operate.config import Config
+from operate.utils.style import (
+    ANSI_BLUE,
+    ANSI_BRIGHT_MAGENTA,
+    ANSI_GREEN,
+    ANSI_RED,
+    ANSI_RESET,
+)
+from operate.utils.budget import Budget
+from operate.utils.timing import StageRecorder, start_recording, stop_recording, summarize
+
+# Load configuration
+config = Config()
+
+DEFAULT_THRESHOLD = 0.2
+# Differences below this many seconds are noise, whatever the ratio
+MIN_DELTA = 0.005
+# Seconds a fresh interpreter may take to import the CLI
+STARTUP_BUDGET = 1.0
+STARTUP_COMMANDS = {
+    "import operate.operate": ["-c", "import operate.operate"],
+    "operate --help": ["-m", "operate.main", "--help"],
+}
+
+
+class NullOperatingSystem:
+    """
+    Accepts operations without executing them, for replaying recorded sessions
+    """
+
+    def __init__(self):
+        self.operations = []
+
+    def write(self, content):
+        self.operations.append(("write", content))
+
+    def press(self, keys):
+        self.operations.append(("press", keys))
+
+    def mouse(self, click_detail):
+        self.operations.append(("mouse", click_detail))
+
+    def window_title(self):
+        return None
+
+    def windows(self):
+        return []
+
+    def open_url(self, url):
+        self.operations.append(("open_url", url))
+        return f"opened {url}", []
+
+    def launch_app(self, name):
+        self.operations.append(("launch_app", name))
+        return f"launched `{name}`", []
+
+    def focus_window(self, query):
+        self.operations.append(("focus_window", query))
+        return f"focused `{query}`", []
+
+
+class CassetteCapture:
+    """
+    Capture backend that plays back the frames a recorded session saw
+    """
+
+    # every capture advances the playback, so frames cannot be sampled
+    sampling = False
+
+    def __init__(self, cassette):
+        self.cassette = cassette
+        self.digests = cassette.captured_frames()
+        self.index = 0
+
+    def __call__(self, file_path):
+        digest = self.digests[min(self.index, len(self.digests) - 1)]
+        self.index += 1
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, "wb") as file:
+            file.write(self.cassette.get_frame(digest))
+
+
+def run_synthetic(scenario, model, max_steps):
+    from operate.mock.desktop import SyntheticDesktop, install_desktop, uninstall_desktop
+    from operate.mock.policies import ScriptedPolicy
+    from operate.mock.server import MockLLMServer
+    from operate.operate import run_objective
+
+    server = MockLLMServer(("127.0.0.1", 0), ScriptedPolicy(scenario["script"]))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    environment = {
+        "OPENAI_API_BASE_URL": f"{base_url}/v1",
+        "QWEN_API_BASE_URL": f"{base_url}/v1",
+        "ANTHROPIC_BASE_URL": base_url,
+        "OLLAMA_HOST": base_url,
+    }
+    previous = {key: os.environ.get(key) for key in environment}
+    os.environ.update(environment)
+    for key in ("OPENAI_API_KEY", "QWEN_API_KEY", "ANTHROPIC_API_KEY"):
+        os.environ.setdefault(key, "bench")
+
+    desktop = SyntheticDesktop(scenario)
+    install_desktop(desktop)
+    try:
+        result = _timed_run(run_objective, model, scenario["objective"], max_steps)
+    finally:
+        uninstall_desktop()
+        server.shutdown()
+        server.server_close()
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    result["goal_reached"] = desktop.is_goal_reached()
+    result["screens"] = desktop.history
+    return result
+
+
+def run_recorded(path, model, objective, max_steps):
+    from operate.operate import run_objective, set_operating_system
+    from operate.utils.cassette import Cassette
+    from operate.utils.operating_system import OperatingSystem
+    from operate.utils.screenshot import set_capture_backend
+
+    config.cassette_path = path
+    config.cassette_mode = "replay"
+    config.cassette = Cassette(path, mode="replay", emulate_latency=True)
+    set_capture_backend(CassetteCapture(config.cassette))
+    operating_system = NullOperatingSystem()
+    set_operating_system(operating_system)
+    try:
+        result = _timed_run(run_objective, model, objective, max_steps)
+    finally:
+        set_capture_backend(None)
+        set_operating_system(OperatingSystem())
+        config.cassette_path = None
+        config.cassette = None
+
+    result["operations"] = len(operating_system.operations)
+    return result
+
+
+def _timed_run(run_objective, model, objective, max_steps):
+    recorder = start_recording()
+    start_time = time.perf_counter()
+    try:
+        result = run_objective(model, objective, Budget(max_steps=max_steps))
+    finally:
+        stop_recording()
+    result["wall"] = round(time.perf_counter() - start_time, 6)
+    result["recorder"] = recorder
+    return result
+
+
+def run_micro_benchmarks(repeat):
+    """
+    Time the hot helpers of the pipeline on a rendered synthetic frame
+    """
+    from operate.mock.desktop import SyntheticDesktop, load_scenario
+    from operate.models.apis import clean_json
+    from operate.utils.ocr import get_text_element
+    from operate.utils.screenshot import compress_screenshot
+
+    desktop = SyntheticDesktop(load_scenario("search_weather"))
+    desktop.press(["win"])
+    frame_path = os.path.join("bench", "frame.png")
+    desktop.capture(frame_path)
+
+    response = "```json\n" + json.dumps(
+        [
+            {"thought": "Open the browser", "operation": "press", "keys": ["win"]},
+            {"thought": "Type the name", "operation": "write", "content": "chrome"},
+            {"thought": "Launch it", "operation": "press", "keys": ["enter"]},
+        ],
+        indent=4,
+    ) + "\n```"
+    ocr_result = [
+        ([[0, i * 8], [120, i * 8], [120, i * 8 + 6], [0, i * 8 + 6]], f"element {i}", 0.9)
+        for i in range(200)
+    ] + [([[10, 10], [90, 10], [90, 30], [10, 30]], "Google Chrome", 0.99)]
+
+    benchmarks = {
+        "clean_json": lambda: clean_json(response),
+        "get_text_element": lambda: get_text_element(
+            ocr_result, "Google Chrome", frame_path
+        ),
+        "compress_screenshot": lambda: compress_screenshot(
+            frame_path, os.path.join("bench", "frame.jpeg")
+        ),
+    }
+
+    try:
+        import base64
+
+        import pkg_resources
+
+        from operate.utils.label import add_labels, get_yolo_model
+
+        with open(frame_path, "rb") as img_file:
+            frame_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        weights = pkg_resources.resource_filename("operate.models.weights", "best.pt")
+        if not os.path.exists(weights):
+            raise ImportError(f"no YOLO weights at {weights}")
+        yolo_model = get_yolo_model()
+        benchmarks["add_labels"] = lambda: add_labels(frame_base64, yolo_model)
+    except ImportError as e:
+        print(f"{ANSI_BRIGHT_MAGENTA}[bench] skipping add_labels: {e}{ANSI_RESET}")
+
+    results = {}
+    for name, function in benchmarks.items():
+        function()  # warm up
+        durations = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start_time)
+        results[name] = summarize(durations)
+    return results
+
+
+def measure_startup(repeat):
+    """
+    Time fresh interpreters importing the CLI, which every session pays before
+    its first step
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    python_path = [root, os.environ.get("PYTHONPATH")]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p for p in python_path if p))
+    results = {}
+    for name, args in STARTUP_COMMANDS.items():
+        durations = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            subprocess.run(
+                [sys.executable] + args,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True,
+            )
+            durations.append(time.perf_counter() - start_time)
+        results[name] = summarize(durations)
+    return results
+
+
+def over_budget(startup, budget):
+    return [
+        {"name": name, "p50": stats["p50"], "budget": budget}
+        for name, stats in startup.items()
+        if stats["p50"] > budget
+    ]
+
+
+def compare(results, baseline, threshold):
+    """
+    Return the stages and micro benchmarks slower than `baseline` by more than `threshold`
+    """
+    regressions = []
+    for section, metric in (("stages", "mean"), ("micro", "p50"), ("startup", "p50")):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if not previous or not previous.get(metric):
+                continue
+            delta = current[metric] - previous[metric]
+            if delta > MIN_DELTA and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append(
+                    {
+                        "section": section,
+                        "name": name,
+                        "baseline": previous[metric],
+                        "current": current[metric],
+                        "ratio": round(current[metric] / previous[metric], 3),
+                    }
+                )
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{ANSI_BLUE}[bench] scenarios{ANSI_RESET}")
+    for name, scenario in results["scenarios"].items():
+        status = scenario["outcome"]
+        if "goal_reached" in scenario:
+            status += ", goal reached" if scenario["goal_reached"] else ", goal missed"
+        print(f"  {name:<28} {status:<28} steps={scenario['steps']:<3} wall={scenario['wall']:.2f}s")
+
+    print(f"\n{ANSI_BLUE}[bench] stages{ANSI_RESET} (mean / p95 / count)")
+    for name, stats in results["stages"].items():
+        print(
+            f"  {name:<14} {stats['mean'] * 1000:>10.1f} ms {stats['p95'] * 1000:>10.1f} ms {stats['count']:>6}"
+        )
+
+    if results.get("micro"):
+        print(f"\n{ANSI_BLUE}[bench] micro{ANSI_RESET} (p50 / p95)")
+        for name, stats in results["micro"].items():
+            print(
+                f"  {name:<20} {stats['p50'] * 1000:>10.3f} ms {stats['p95'] * 1000:>10.3f} ms"
+            )
+
+    if results.get("startup"):
+        print(f"\n{ANSI_BLUE}[bench] startup{ANSI_RESET} (p50 / p95)")
+        for name, stats in results["startup"].items():
+            print(
+                f"  {name:<24} {stats['p50'] * 1000:>10.1f} ms {stats['p95'] * 1000:>10.1f} ms"
+            )
+
+
+def main_entry(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="operate bench",
+        description="Benchmark the self-operating-computer pipeline on synthetic or recorded sessions.",
+    )
+    parser.add_argument(
+        "-m",
+        "--model",
+        help="Model whose pipeline is benchmarked",
+        default="gpt-4-with-ocr",
+    )
+    parser.add_argument(
+        "--scenario",
+        help="Synthetic scenario name or path, can be repeated (default: all bundled scenarios)",
+        action="append",
+    )
+    parser.add_argument(
+        "--cassette",
+        help="Recorded cassette to replay, can be repeated",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--objective",
+        help="Objective used when replaying cassettes",
+        default="Replay the recorded session",
+    )
+    parser.add_argument(
+        "--repeat", help="Runs per scenario and micro benchmark", type=int, default=1
+    )
+    parser.add_argument("--max-steps", type=int, default=10)
+    parser.add_argument(
+        "--micro", help="Also run the micro benchmarks", action="store_true"
+    )
+    parser.add_argument(
+        "--micro-only", help="Only run the micro benchmarks", action="store_true"
+    )
+    parser.add_argument(
+        "--startup",
+        help="Also time the CLI import in fresh interpreters (included in --micro)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--startup-budget",
+        help="Fail when the CLI import p50 exceeds this many seconds",
+        type=float,
+        default=STARTUP_BUDGET,
+    )
+    parser.add_argument(
+        "--output", help="Where to write the JSON results", default="bench_results.json"
+    )
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--threshold",
+        help="Allowed slowdown over the baseline before failing, e.g. 0.2 for 20%%",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    from operate.mock.desktop import list_scenarios, load_scenario
+
+    config.verbose = args.verbose
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    cassettes = [os.path.abspath(path) for path in args.cassette]
+    scenarios = []
+    if not args.micro_only:
+        if args.scenario:
+            scenarios = [load_scenario(os.path.abspath(s) if os.path.exists(s) else s) for s in args.scenario]
+        elif not cassettes:
+            scenarios = [load_scenario(path) for path in list_scenarios()]
+
+    # screenshots, labeled images and OCR debug output stay out of the caller's tree
+    workdir = tempfile.mkdtemp(prefix="operate-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    results = {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": args.model,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "scenarios": {},
+        "stages": {},
+    }
+    recorder = StageRecorder()
+    try:
+        runs = [("synthetic", scenario["name"], scenario) for scenario in scenarios]
+        runs += [("recorded", os.path.basename(path), path) for path in cassettes]
+        for kind, name, source in runs:
+            for run in range(args.repeat):
+                key = name if args.repeat == 1 else f"{name}#{run + 1}"
+                print(f"{ANSI_BLUE}[bench]{ANSI_RESET} {kind} {key}")
+                if kind == "synthetic":
+                    result = run_synthetic(source, args.model, args.max_steps)
+                else:
+                    result = run_recorded(source, args.model, args.objective, args.max_steps)
+                scenario_recorder = result.pop("recorder")
+                for stage_name, durations in scenario_recorder.durations.items():
+                    for duration in durations:
+                        recorder.add(stage_name, duration)
+                result["stages"] = scenario_recorder.summary()
+                result["usage"] = dict(scenario_recorder.counters)
+                results["scenarios"][key] = result
+        results["stages"] = recorder.summary()
+
+        if args.micro or args.micro_only:
+            results["micro"] = run_micro_benchmarks(max(args.repeat, 20))
+        if args.startup or args.micro or args.micro_only:
+            results["startup"] = measure_startup(max(args.repeat, 5))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+
+    exit_code = 0
+    slow_startup = over_budget(results.get("startup", {}), args.startup_budget)
+    if slow_startup:
+        exit_code = 1
+        results["startup_over_budget"] = slow_startup
+        print(f"\n{ANSI_RED}[bench] startup over the {args.startup_budget:.2f}s budget{ANSI_RESET}")
+        for entry in slow_startup:
+            print(f"  {entry['name']}: {entry['p50'] * 1000:.1f} ms")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        results["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+            print(f"\n{ANSI_RED}[bench] regressions over {args.threshold:.0%}{ANSI_RESET}")
+            for r in regressions:
+                print(
+                    f"  {r['section']}.{r['name']}: {r['baseline'] * 1000:.1f} ms -> {r['current'] * 1000:.1f} ms (x{r['ratio']})"
+                )
+        else:
+            print(f"\n{ANSI_GREEN}[bench] no regressions against {args.baseline}{ANSI_RESET}")
+
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"{ANSI_BLUE}[bench]{ANSI_RESET} results written to {output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main_entry())
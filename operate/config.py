@@ -1,13 +1,12 @@
 import os
 import sys
+import threading
 
-import google.generativeai as genai
 from dotenv import load_dotenv
-from ollama import Client
-from openai import OpenAI
-import anthropic
 from prompt_toolkit.shortcuts import input_dialog
 
+from operate.utils import tracing
+
 
 class Config:
     """
@@ -18,6 +17,9 @@ class Config:
         openai_api_key (str): API key for OpenAI.
         google_api_key (str): API key for Google.
         ollama_host (str): url to ollama running remotely.
+        cassette_path (str): path of the record/replay cassette, if any.
+        cassette_mode (str): `record` or `replay`.
+        cassette_latency (bool): sleep for the recorded duration when replaying.
     """
 
     _instance = None
@@ -46,6 +48,51 @@ class Config:
         self.qwen_api_key = (
             None  # instance variables are backups in case saving to a `.env` fails
         )
+        if not hasattr(self, "cassette"):
+            # kept across `Config()` calls so a replay does not restart midway
+            self.cassette_path = os.getenv("OPERATE_CASSETTE")
+            self.cassette_mode = os.getenv("OPERATE_CASSETTE_MODE", "replay")
+            self.cassette_latency = os.getenv("OPERATE_CASSETTE_LATENCY") == "1"
+            self.cassette = None
+        if not hasattr(self, "_clients"):
+            # provider clients are reused so their connections stay open across steps
+            self._clients = {}
+            self._clients_lock = threading.Lock()
+
+    def is_replaying(self):
+        return bool(self.cassette_path) and self.cassette_mode == "replay"
+
+    def cached_client(self, provider, settings, create):
+        """
+        Return the client `create()` builds for these settings, creating it
+        only once. Safe to call from the warm-up threads.
+        """
+        key = (provider, settings, self.cassette_path)
+        with self._clients_lock:
+            if key not in self._clients:
+                self._clients[key] = self.wrap_client(create(), provider)
+            return self._clients[key]
+
+    def wrap_client(self, client, provider):
+        """
+        Route the provider client through the cassette when one is configured
+        and through `TracedClient`, which records token usage and traces requests
+        when tracing is on
+        """
+        if self.cassette_path:
+            if self.cassette is None:
+                from operate.utils.cassette import Cassette
+
+                self.cassette = Cassette(
+                    self.cassette_path,
+                    mode=self.cassette_mode,
+                    emulate_latency=self.cassette_latency,
+                    verbose=self.verbose,
+                )
+            from operate.utils.cassette import CassetteClient
+
+            client = CassetteClient(client, provider, self.cassette)
+        return tracing.TracedClient(client, provider)
 
     def initialize_openai(self):
         if self.verbose:
@@ -62,12 +109,23 @@ class Config:
                 )
             api_key = os.getenv("OPENAI_API_KEY")
 
-        client = OpenAI(
-            api_key=api_key,
-        )
-        client.api_key = api_key
-        client.base_url = os.getenv("OPENAI_API_BASE_URL", client.base_url)
-        return client
+        if self.is_replaying():
+            return self.wrap_client(None, "openai")
+
+        base_url = os.getenv("OPENAI_API_BASE_URL")
+
+        def create():
+            # provider SDKs are imported when first used to keep startup fast
+            from openai import OpenAI
+
+            client = OpenAI(
+                api_key=api_key,
+            )
+            client.api_key = api_key
+            client.base_url = base_url or client.base_url
+            return client
+
+        return self.cached_client("openai", (api_key, base_url), create)
 
     def initialize_qwen(self):
         if self.verbose:
@@ -84,13 +142,25 @@ class Config:
                 )
             api_key = os.getenv("QWEN_API_KEY")
 
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        if self.is_replaying():
+            return self.wrap_client(None, "qwen")
+
+        base_url = os.getenv(
+            "QWEN_API_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"
         )
-        client.api_key = api_key
-        client.base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-        return client
+
+        def create():
+            from openai import OpenAI
+
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+            )
+            client.api_key = api_key
+            client.base_url = base_url
+            return client
+
+        return self.cached_client("qwen", (api_key, base_url), create)
 
     def initialize_google(self):
         if self.google_api_key:
@@ -103,10 +173,16 @@ class Config:
                     "[Config][initialize_google] no cached google_api_key, try to get from env."
                 )
             api_key = os.getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=api_key, transport="rest")
-        model = genai.GenerativeModel("gemini-pro-vision")
+        if self.is_replaying():
+            return self.wrap_client(None, "gemini")
+
+        def create():
+            import google.generativeai as genai
 
-        return model
+            genai.configure(api_key=api_key, transport="rest")
+            return genai.GenerativeModel("gemini-pro-vision")
+
+        return self.cached_client("gemini", (api_key,), create)
 
     def initialize_ollama(self):
         if self.ollama_host:
@@ -118,20 +194,40 @@ class Config:
                     "[Config][initialize_ollama] no cached ollama host. Assuming ollama running locally."
                 )
             self.ollama_host = os.getenv("OLLAMA_HOST", None)
-        model = Client(host=self.ollama_host)
-        return model
+        if self.is_replaying():
+            return self.wrap_client(None, "ollama")
+        host = self.ollama_host
+
+        def create():
+            from ollama import Client
+
+            return Client(host=host)
+
+        return self.cached_client("ollama", (host,), create)
 
     def initialize_anthropic(self):
         if self.anthropic_api_key:
             api_key = self.anthropic_api_key
         else:
             api_key = os.getenv("ANTHROPIC_API_KEY")
-        return anthropic.Anthropic(api_key=api_key)
+        if self.is_replaying():
+            return self.wrap_client(None, "anthropic")
+        base_url = os.getenv("ANTHROPIC_BASE_URL")
+
+        def create():
+            import anthropic
+
+            return anthropic.Anthropic(api_key=api_key)
+
+        return self.cached_client("anthropic", (api_key, base_url), create)
 
     def validation(self, model, voice_mode):
         """
         Validate the input parameters for the dialog operation.
         """
+        if self.is_replaying():
+            # Replayed sessions never reach the network so no key is needed
+            return
         self.require_api_key(
             "OPENAI_API_KEY",
             "OpenAI API key",
@@ -12,4 +12,20 @@ class ModelNotRecognizedException(Exception):
         super().__init__(self.message)
 
     def __str__(self):
-        return f"{self.message} : {self.model} "
\ No newline at end of file
+        return f"{self.message} : {self.model} "
+
+class CassetteMissException(Exception):
+    """Exception raised when a replayed request has no recorded response.
+
+    Attributes:
+        provider -- the provider the request was made against
+        message -- explanation of the error
+    """
+
+    def __init__(self, provider, message="No recorded response left in cassette"):
+        self.provider = provider
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message} : {self.provider} "
@@ -2,20 +2,59 @@
 Self-Operating Computer
 """
 import argparse
+import os
+import sys
 from operate.utils.style import ANSI_BRIGHT_MAGENTA
-from operate.operate import main
+from operate.utils.action_timing import (
+    TIMING_PROFILES,
+    default_timing_profile,
+    set_timing_profile,
+)
+from operate.utils.budget import Budget, add_budget_arguments, limits_from_args
+from operate.utils.profiler import default_prefix
+from operate.utils.scope import parse_scope
+
+DEFAULT_MODEL = "gpt-4-with-ocr"
+
+
+def get_version():
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("self-operating-computer")
+    except PackageNotFoundError:
+        return "unknown"
 
 
 def main_entry():
+    # Subcommands
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from operate.bench import main_entry as bench_entry
+
+        sys.exit(bench_entry(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from operate.serve import main_entry as serve_entry
+
+        sys.exit(serve_entry(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "inference":
+        from operate.utils.inference import main_entry as inference_entry
+
+        sys.exit(inference_entry(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(
         description="Run the self-operating-computer with a specified model."
     )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"%(prog)s {get_version()}",
+    )
+
     parser.add_argument(
         "-m",
         "--model",
-        help="Specify the model to use",
+        help="Specify the model to use (default: gpt-4-with-ocr, or the server's with --server)",
         required=False,
-        default="gpt-4-with-ocr",
     )
 
     # Add a voice flag
@@ -40,17 +79,216 @@ def main_entry():
         required=False,
     )
 
+    # Record or replay provider calls
+    parser.add_argument(
+        "--cassette",
+        help="Path of a cassette file to record provider calls to or replay them from",
+        type=str,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--cassette-mode",
+        help="Record new provider calls or replay recorded ones without network access",
+        choices=["record", "replay"],
+        default="replay",
+    )
+
+    parser.add_argument(
+        "--cassette-latency",
+        help="When replaying, wait for the recorded response time of each call",
+        action="store_true",
+    )
+
+    # Structured tracing
+    parser.add_argument(
+        "--trace",
+        help="Write a span for every step and pipeline stage to this JSONL file",
+        type=str,
+        default=os.getenv("OPERATE_TRACE"),
+    )
+
+    parser.add_argument(
+        "--trace-otlp",
+        help="Also export spans to an OTLP/HTTP collector, e.g. http://localhost:4318",
+        type=str,
+        default=os.getenv("OPERATE_TRACE_OTLP"),
+    )
+
+    # Sampling profiler
+    parser.add_argument(
+        "--profile",
+        help="Sample the session and write a flame graph (collapsed stacks and speedscope) to this path prefix",
+        nargs="?",
+        const=default_prefix(),
+        default=None,
+    )
+
+    # Action timing
+    parser.add_argument(
+        "--timing",
+        help="Timing profile of clicks, key presses and waits: demo, normal or fast (no pointer animation)",
+        choices=list(TIMING_PROFILES),
+        default=default_timing_profile(),
+    )
+
+    # Part of the screen the model sees
+    parser.add_argument(
+        "--capture",
+        help="Part of the screen sent to the model: screen, window (the focused window) or a region x,y,width,height in pixels",
+        type=str,
+        default=os.getenv("OPERATE_CAPTURE", "screen"),
+    )
+
+    # Budgets of each objective
+    add_budget_arguments(parser)
+
+    # Skill library
+    parser.add_argument(
+        "--skills",
+        help="JSON file of skills: successful runs are stored there and replayed for matching objectives",
+        type=str,
+        default=os.getenv("OPERATE_SKILLS"),
+    )
+
+    # Thin client for `operate serve`
+    parser.add_argument(
+        "--server",
+        help="Run the objective on a resident `operate serve`, e.g. http://127.0.0.1:8766 or unix:/tmp/operate.sock",
+        type=str,
+        default=os.getenv("OPERATE_SERVER"),
+    )
+
+    # Batch runs
+    parser.add_argument(
+        "--batch",
+        help="Run every objective of a JSONL file, one task per line",
+        type=str,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--batch-output",
+        help="JSONL file the batch results are appended to (default: <tasks>.results.jsonl)",
+        type=str,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--displays",
+        help="Comma-separated X displays, e.g. :1,:2, to run batch tasks on concurrently",
+        type=str,
+        default=os.getenv("OPERATE_DISPLAYS"),
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        help="Maximum number of batch tasks running at once, one per display",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--xvfb",
+        help="Start this many Xvfb displays and run batch tasks on them concurrently",
+        type=int,
+        default=0,
+    )
+
+    parser.add_argument(
+        "--xvfb-size",
+        help="Resolution of the Xvfb displays",
+        type=str,
+        default="1280x800",
+    )
+
+    parser.add_argument(
+        "--shared-inference",
+        help="Start one OCR/YOLO inference server shared by the concurrent batch workers",
+        action="store_true",
+    )
+
     try:
         args = parser.parse_args()
+        # `--server` leaves the model to the server unless one is passed
+        requested_model = args.model
+        args.model = args.model or DEFAULT_MODEL
+        # exported so batch workers and other child processes use it too
+        os.environ["OPERATE_TIMING"] = args.timing
+        set_timing_profile(args.timing)
+        if args.skills:
+            os.environ["OPERATE_SKILLS"] = args.skills
+        try:
+            parse_scope(args.capture)
+        except ValueError as e:
+            parser.error(str(e))
+        os.environ["OPERATE_CAPTURE"] = args.capture
+        if args.batch:
+            run_batch_file(args)
+            return
+        if args.server:
+            run_client(args, requested_model)
+            return
+        # the agent loop and provider SDKs are only imported once a session starts
+        from operate.operate import main
+
         main(
             args.model,
             terminal_prompt=args.prompt,
             voice_mode=args.voice,
-            verbose_mode=args.verbose
+            verbose_mode=args.verbose,
+            cassette=args.cassette,
+            cassette_mode=args.cassette_mode,
+            cassette_latency=args.cassette_latency,
+            trace=args.trace,
+            trace_otlp=args.trace_otlp,
+            profile=args.profile,
+            budget=Budget.from_args(args),
         )
     except KeyboardInterrupt:
         print(f"\n{ANSI_BRIGHT_MAGENTA}Exiting...")
 
 
+def run_batch_file(args):
+    from operate.batch import run_batch
+    from operate.utils.displays import parse_resolution
+
+    try:
+        failed = run_batch(
+            args.batch,
+            args.model,
+            output=args.batch_output,
+            displays=args.displays.split(",") if args.displays else None,
+            concurrency=args.concurrency,
+            budget=Budget.from_args(args),
+            trace=args.trace,
+            verbose=args.verbose,
+            xvfb=args.xvfb,
+            resolution=parse_resolution(args.xvfb_size),
+            shared_inference=args.shared_inference,
+        )
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"[operate batch] {e}")
+        sys.exit(2)
+    if failed:
+        sys.exit(1)
+
+
+def run_client(args, model):
+    from prompt_toolkit import prompt
+
+    from operate.models.prompts import USER_QUESTION
+    from operate.serve import run_remote
+    from operate.utils.style import style
+
+    objective = args.prompt
+    if not objective:
+        print(USER_QUESTION)
+        objective = prompt(style=style)
+    result = run_remote(args.server, model, objective, limits_from_args(args))
+    if not result or result["outcome"] != "done":
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main_entry()
@@ -0,0 +1,385 @@
+"""
+Synthetic desktop for headless end-to-end runs.
+
+Scenarios are JSON files describing a set of screens. Each screen has a window
+title, a list of elements and optional key bindings. Element boxes are
+`[x, y, width, height]` fractions of the screen, the same percent space the
+models answer in. Supported element types:
+
+- `button`, `link`: clicking follows `target`
+- `text_field`: clicking focuses it, `write` types into it and `enter` follows
+  `submit` (optionally only when the value contains `submit_when`)
+- `menu`: clicking opens the `items` list below it; each item has a `target`
+- `label`: static text
+
+A `target` or key binding is either a screen name or a dict with `screen`
+and/or `focus` (an element id). The scenario `goal` names the screen to reach
+and optionally the values fields must contain. The optional `apps` and `urls`
+map application names and URL parts to the targets `launch_app` and
+`open_url` follow. Every application visited (the part of a title after the
+last ` - `) stays open as a window that `focus_window` returns to.
+"""
+import json
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+from operate.utils.windows import find_window
+
+SCENARIOS_DIR = os.path.join(os.path.dirname(__file__), "scenarios")
+
+BACKGROUND = (236, 239, 244)
+TITLE_BAR = (46, 52, 64)
+TITLE_BAR_HEIGHT = 0.05
+
+
+def list_scenarios():
+    """
+    Return the paths of the scenarios bundled with the package
+    """
+    return sorted(
+        os.path.join(SCENARIOS_DIR, name)
+        for name in os.listdir(SCENARIOS_DIR)
+        if name.endswith(".json")
+    )
+
+
+def load_scenario(path):
+    """
+    Load a scenario by path or by the name of a bundled scenario
+    """
+    if not os.path.exists(path):
+        path = os.path.join(SCENARIOS_DIR, f"{path}.json")
+    with open(path, "r", encoding="utf-8") as file:
+        scenario = json.load(file)
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    scenario.setdefault("size", [1280, 800])
+    return scenario
+
+
+class SyntheticDesktop:
+    """
+    State machine over the screens of a scenario, rendered with PIL
+    """
+
+    def __init__(self, scenario, verbose=False):
+        self.scenario = scenario
+        self.verbose = verbose
+        self.width, self.height = scenario["size"]
+        self.screens = scenario["screens"]
+        self.reset()
+
+    def reset(self):
+        self.screen = self.scenario["start"]
+        self.focused = None
+        self.open_menu = None
+        self.values = {}
+        self.history = [self.screen]
+        # last screen of every application visited, by application
+        self.windows = {self.application(self.screen): self.screen}
+
+    @property
+    def title(self):
+        return self.screens[self.screen].get("title", self.screen)
+
+    def application(self, screen):
+        title = self.screens[screen].get("title", screen)
+        return title.rsplit(" - ", 1)[-1]
+
+    def elements(self):
+        return self.screens[self.screen].get("elements", [])
+
+    def is_goal_reached(self):
+        goal = self.scenario.get("goal", {})
+        if goal.get("screen") and goal["screen"] != self.screen:
+            return False
+        for field, expected in goal.get("fields", {}).items():
+            if expected.lower() not in self.values.get(field, "").lower():
+                return False
+        return True
+
+    # Input
+
+    def click(self, x_percent, y_percent):
+        x, y = float(x_percent), float(y_percent)
+
+        if self.open_menu is not None:
+            for item, box in self._menu_items(self.open_menu):
+                if _contains(box, x, y):
+                    self.open_menu = None
+                    self._follow(item.get("target"))
+                    return
+            self.open_menu = None
+
+        for element in self.elements():
+            if not _contains(element["box"], x, y):
+                continue
+            kind = element.get("type", "button")
+            if self.verbose:
+                print("[SyntheticDesktop][click]", kind, element.get("text"))
+            if kind == "text_field":
+                self.focused = element["id"]
+            elif kind == "menu":
+                self.open_menu = element
+            elif kind in ("button", "link"):
+                self._follow(element.get("target"))
+            return
+
+        self.focused = None
+
+    def type(self, text):
+        for part in text.split("\n")[:-1]:
+            self._append(part)
+            self.press(["enter"])
+        self._append(text.split("\n")[-1])
+
+    def press(self, keys):
+        chord = "+".join(key.lower() for key in keys)
+        if self.verbose:
+            print("[SyntheticDesktop][press]", chord)
+        if chord in ("enter", "return"):
+            field = self._focused_element()
+            if field and field.get("submit"):
+                when = field.get("submit_when", "")
+                if when.lower() in self.values.get(field["id"], "").lower():
+                    self._follow(field["submit"])
+            return
+        if chord == "backspace" and self.focused:
+            self.values[self.focused] = self.values.get(self.focused, "")[:-1]
+            return
+        if chord == "esc":
+            self.open_menu = None
+            return
+        bindings = self.screens[self.screen].get("keys", {})
+        bindings = {**self.scenario.get("keys", {}), **bindings}
+        if chord in bindings:
+            self._follow(bindings[chord])
+
+    def launch(self, name):
+        """
+        Follow the target of the application `name`, return whether there is one
+        """
+        apps = {key.lower(): target for key, target in self.scenario.get("apps", {}).items()}
+        target = apps.get(str(name).strip().lower())
+        if target is None:
+            return False
+        self.open_menu = None
+        self._follow(target)
+        return True
+
+    def open_url(self, url):
+        for part, target in self.scenario.get("urls", {}).items():
+            if part.lower() in str(url).lower():
+                self.open_menu = None
+                self._follow(target)
+                return True
+        return False
+
+    def focus(self, screen):
+        self.open_menu = None
+        self._follow(screen)
+
+    def _append(self, text):
+        if self.focused and text:
+            self.values[self.focused] = self.values.get(self.focused, "") + text
+
+    def _focused_element(self):
+        for element in self.elements():
+            if element.get("id") == self.focused:
+                return element
+        return None
+
+    def _follow(self, target):
+        if not target:
+            return
+        if isinstance(target, str):
+            target = {"screen": target}
+        if target.get("screen") and target["screen"] != self.screen:
+            self.screen = target["screen"]
+            self.history.append(self.screen)
+            self.windows[self.application(self.screen)] = self.screen
+            self.focused = None
+            self.open_menu = None
+        if target.get("focus"):
+            self.focused = target["focus"]
+            if target.get("clear"):
+                self.values[self.focused] = ""
+
+    def _menu_items(self, menu):
+        x, y, w, h = menu["box"]
+        return [
+            (item, [x, y + h * (index + 1), max(w, 0.18), h])
+            for index, item in enumerate(menu.get("items", []))
+        ]
+
+    # Rendering
+
+    def render(self):
+        image = Image.new("RGB", (self.width, self.height), BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        bar = int(self.height * TITLE_BAR_HEIGHT)
+        draw.rectangle([(0, 0), (self.width, bar)], fill=TITLE_BAR)
+        draw.text(
+            (12, bar // 2), self.title, fill="white", font=_font(bar // 2), anchor="lm"
+        )
+
+        for element in self.elements():
+            self._draw_element(draw, element)
+        if self.open_menu is not None:
+            for item, box in self._menu_items(self.open_menu):
+                self._draw_element(draw, {"type": "menu_item", "box": box, **item})
+        return image
+
+    def capture(self, file_path):
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.render().save(file_path)
+
+    def _draw_element(self, draw, element):
+        x, y, w, h = element["box"]
+        box = [
+            (int(x * self.width), int(y * self.height)),
+            (int((x + w) * self.width), int((y + h) * self.height)),
+        ]
+        height = box[1][1] - box[0][1]
+        font = _font(max(12, int(height * 0.5)))
+        kind = element.get("type", "button")
+        text = element.get("text", "")
+        center = ((box[0][0] + box[1][0]) // 2, (box[0][1] + box[1][1]) // 2)
+        left = (box[0][0] + 10, center[1])
+
+        if kind in ("button", "menu"):
+            draw.rounded_rectangle(box, radius=6, fill=(94, 129, 172), outline=(59, 66, 82))
+            draw.text(center, text, fill="white", font=font, anchor="mm")
+        elif kind == "menu_item":
+            draw.rectangle(box, fill="white", outline=(180, 180, 180))
+            draw.text(left, text, fill="black", font=font, anchor="lm")
+        elif kind == "text_field":
+            focused = element.get("id") == self.focused
+            draw.rectangle(
+                box,
+                fill="white",
+                outline=(94, 129, 172) if focused else (150, 150, 150),
+                width=3 if focused else 1,
+            )
+            value = self.values.get(element.get("id"), "")
+            if value:
+                draw.text(left, value, fill="black", font=font, anchor="lm")
+            else:
+                draw.text(
+                    left, element.get("placeholder", text), fill=(140, 140, 140), font=font, anchor="lm"
+                )
+        elif kind == "link":
+            draw.text(left, text, fill=(26, 13, 171), font=font, anchor="lm")
+            text_width = draw.textlength(text, font=font)
+            underline = center[1] + font.size // 2 + 2
+            draw.line([(left[0], underline), (left[0] + text_width, underline)], fill=(26, 13, 171))
+        else:
+            draw.text(left, text, fill="black", font=font, anchor="lm")
+
+
+class SyntheticOperatingSystem:
+    """
+    Drop-in replacement for `OperatingSystem` that drives a `SyntheticDesktop`
+    """
+
+    def __init__(self, desktop):
+        self.desktop = desktop
+
+    def write(self, content):
+        try:
+            content = content.replace("\\n", "\n")
+            self.desktop.type(content)
+        except Exception as e:
+            print("[SyntheticOperatingSystem][write] error:", e)
+
+    def press(self, keys):
+        try:
+            self.desktop.press(keys)
+        except Exception as e:
+            print("[SyntheticOperatingSystem][press] error:", e)
+
+    def mouse(self, click_detail):
+        try:
+            self.desktop.click(click_detail.get("x"), click_detail.get("y"))
+        except Exception as e:
+            print("[SyntheticOperatingSystem][mouse] error:", e)
+
+    def window_title(self):
+        return self.desktop.title
+
+    def windows(self):
+        desktop = self.desktop
+        return [
+            {
+                "id": screen,
+                "title": desktop.screens[screen].get("title", screen),
+                "app": app,
+                "x": 0,
+                "y": 0,
+                "width": desktop.width,
+                "height": desktop.height,
+                "active": screen == desktop.screen,
+            }
+            for app, screen in desktop.windows.items()
+        ]
+
+    def open_url(self, url):
+        if not self.desktop.open_url(url):
+            return f"could not open {url}", self.windows()
+        return f"opened {url}", self.windows()
+
+    def launch_app(self, name):
+        window = find_window(self.windows(), name)
+        if window is not None:
+            self.desktop.focus(window["id"])
+            return f"`{name}` was already open, focused `{window['title']}`", self.windows()
+        if not self.desktop.launch(name):
+            return f"no application named `{name}` was found", self.windows()
+        return f"launched `{name}`: `{self.desktop.title}`", self.windows()
+
+    def focus_window(self, query):
+        window = find_window(self.windows(), query)
+        if window is None:
+            return f"no window matches `{query}`", self.windows()
+        self.desktop.focus(window["id"])
+        return f"focused `{window['title']}`", self.windows()
+
+
+def install_desktop(desktop):
+    """
+    Point the capture and the operation executor of `operate` at `desktop`
+    """
+    from operate.operate import set_operating_system
+    from operate.utils.screenshot import set_capture_backend
+
+    operating_system = SyntheticOperatingSystem(desktop)
+    set_capture_backend(desktop.capture, windows=operating_system.windows)
+    set_operating_system(operating_system)
+
+
+def uninstall_desktop():
+    from operate.operate import set_operating_system
+    from operate.utils.operating_system import OperatingSystem
+    from operate.utils.screenshot import set_capture_backend
+
+    set_capture_backend(None)
+    set_operating_system(OperatingSystem())
+
+
+def _contains(box, x, y):
+    bx, by, bw, bh = box
+    return bx <= x <= bx + bw and by <= y <= by + bh
+
+
+_fonts = {}
+
+
+def _font(size):
+    if size not in _fonts:
+        try:
+            _fonts[size] = ImageFont.truetype("DejaVuSans.ttf", size)
+        except OSError:
+            _fonts[size] = ImageFont.load_default(size=size)
+    return _fonts[size]
@@ -0,0 +1,152 @@
+import json
+import math
+import random
+
+from operate.exceptions import CassetteMissException
+
+
+class ScriptedPolicy:
+    """
+    Answers from a fixed script of steps.
+
+    The script file is JSON with a `steps` list. Each step is the list of
+    operations returned for that model call. An operation is either a dict in
+    the prompt format or a shorthand string:
+
+        "click Sign in"      -> click the OCR text "Sign in"
+        "click ~3"           -> click the SoM label `~3`
+        "click 0.42 0.17"    -> click at percent coordinates
+        "write hello world"  -> write "hello world"
+        "press ctrl l"       -> press ["ctrl", "l"]
+        "wait_for Results"   -> wait until the OCR text "Results" shows up
+        "wait_for"           -> wait until the screen changes
+        "open_url docs.new"  -> open the URL in the browser
+        "launch_app Chrome"  -> open or focus the application
+        "focus_window Gmail" -> focus the window with that title or application
+        "done summary text"  -> done
+
+    The server is stateless: the step is picked from the number of assistant
+    messages already in the request, so any number of sessions can share one
+    policy. Once the script runs out the last step is repeated.
+    """
+
+    def __init__(self, steps):
+        if not steps:
+            raise ValueError("A scripted policy needs at least one step")
+        self.steps = [[parse_operation(op) for op in step] for step in steps]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(data["steps"])
+
+    def respond(self, provider, body, messages):
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+        operations = self.steps[min(step, len(self.steps) - 1)]
+        return json.dumps(operations)
+
+
+class CassettePolicy:
+    """
+    Answers with the responses stored in a cassette, see `operate.utils.cassette`
+    """
+
+    def __init__(self, path, verbose=False):
+        from operate.utils.cassette import Cassette
+
+        self.cassette = Cassette(path, mode="replay", verbose=verbose)
+
+    def respond(self, provider, body, messages):
+        request = {"args": [], "kwargs": body}
+        providers = ["openai", "qwen"] if provider == "openai" else [provider]
+        for name in providers + ["openai", "qwen", "anthropic", "ollama", "gemini"]:
+            try:
+                interaction = self.cassette.replay(name, request)
+            except CassetteMissException:
+                continue
+            return response_text(interaction["provider"], interaction["response"])
+        raise CassetteMissException(provider)
+
+
+class LatencyDistribution:
+    """
+    Response delay in seconds, parsed from `kind:params`
+
+        fixed:0.5
+        uniform:0.2,1.5
+        normal:0.8,0.2
+        lognormal:-0.5,0.4
+    """
+
+    def __init__(self, spec="fixed:0", rng=None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency distribution: {spec}")
+
+    def sample(self):
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = self.rng.gauss(*self.params)
+        else:
+            value = math.exp(self.rng.gauss(*self.params))
+        return max(0.0, value)
+
+
+def parse_operation(operation):
+    if isinstance(operation, dict):
+        return operation
+    verb, _, rest = operation.strip().partition(" ")
+    verb = verb.lower()
+    rest = rest.strip()
+    thought = f"Scripted {verb}"
+    if verb == "click":
+        parts = rest.split()
+        if rest.startswith("~"):
+            return {"thought": thought, "operation": "click", "label": rest}
+        if len(parts) == 2 and all(_is_number(p) for p in parts):
+            return {"thought": thought, "operation": "click", "x": parts[0], "y": parts[1]}
+        return {"thought": thought, "operation": "click", "text": rest}
+    if verb == "write":
+        return {"thought": thought, "operation": "write", "content": rest}
+    if verb == "press":
+        return {"thought": thought, "operation": "press", "keys": rest.split()}
+    if verb == "wait_for":
+        if rest:
+            return {"thought": thought, "operation": "wait_for", "text": rest}
+        return {"thought": thought, "operation": "wait_for", "changed": True}
+    if verb in ("open_url", "launch_app", "focus_window"):
+        key = {"open_url": "url", "launch_app": "app", "focus_window": "window"}[verb]
+        return {"thought": thought, "operation": verb, key: rest}
+    if verb == "done":
+        return {"thought": thought, "operation": "done", "summary": rest or "done"}
+    raise ValueError(f"Unknown scripted operation: {operation}")
+
+
+def response_text(provider, response):
+    """
+    Pull the model text out of a recorded raw response
+    """
+    if provider in ("openai", "qwen"):
+        return response["choices"][0]["message"]["content"]
+    if provider == "anthropic":
+        return response["content"][0]["text"]
+    if provider == "ollama":
+        return response["message"]["content"]
+    return response["text"]
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
@@ -0,0 +1,262 @@
+"""
+Local stand-in for the model providers, used for load testing the agent loop.
+
+Speaks the OpenAI chat-completions (`/v1/chat/completions`, also used for
+Qwen), Anthropic messages (`/v1/messages`) and Ollama chat (`/api/chat`)
+protocols. Point the clients at it with:
+
+    OPENAI_API_BASE_URL=http://127.0.0.1:8765/v1
+    QWEN_API_BASE_URL=http://127.0.0.1:8765/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+    OLLAMA_HOST=http://127.0.0.1:8765
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from operate.exceptions import CassetteMissException
+from operate.mock.policies import CassettePolicy, LatencyDistribution, ScriptedPolicy
+from operate.utils.style import ANSI_BRIGHT_MAGENTA, ANSI_GREEN, ANSI_RESET
+
+ROUTES = {
+    "/v1/chat/completions": "openai",
+    "/chat/completions": "openai",
+    "/v1/messages": "anthropic",
+    "/api/chat": "ollama",
+}
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        policy,
+        latency=None,
+        error_rate=0.0,
+        error_status=500,
+        seed=None,
+        verbose=False,
+    ):
+        super().__init__(address, MockLLMHandler)
+        self.policy = policy
+        self.rng = random.Random(seed)
+        self.latency = latency or LatencyDistribution("fixed:0", self.rng)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.verbose = verbose
+        self.stats = {"requests": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        Return the delay and whether to inject an error for one request
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency.sample()
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+        return delay, failed
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path in ("/", "/health", "/api/tags"):
+            self._send_json(200, {"status": "ok", "stats": self.server.stats, "models": []})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        provider = ROUTES.get(path)
+        if provider is None:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        messages = body.get("messages", [])
+
+        delay, failed = self.server.draw()
+        time.sleep(delay)
+        if failed:
+            self._send_error(provider, self.server.error_status, "Injected error")
+            return
+
+        try:
+            text = self.server.policy.respond(provider, body, messages)
+        except CassetteMissException as e:
+            self._send_error(provider, 404, str(e))
+            return
+
+        usage = estimate_usage(messages, text)
+        if self.server.verbose:
+            print(
+                f"{ANSI_GREEN}[operate-mock-llm]{ANSI_RESET} {provider} delay={delay:.2f}s",
+                text,
+            )
+        self._send_json(200, render_response(provider, body.get("model", "mock"), text, usage))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_error(self, provider, status, message):
+        if provider == "anthropic":
+            payload = {"type": "error", "error": {"type": "api_error", "message": message}}
+        elif provider == "ollama":
+            payload = {"error": message}
+        else:
+            payload = {"error": {"message": message, "type": "server_error", "code": status}}
+        self._send_json(status, payload)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def render_response(provider, model, text, usage):
+    """
+    Wrap the model text in the provider's response format
+    """
+    if provider == "anthropic":
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+            },
+        }
+    if provider == "ollama":
+        return {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": text},
+            "done": True,
+            "prompt_eval_count": usage["input_tokens"],
+            "eval_count": usage["output_tokens"],
+        }
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": usage["input_tokens"],
+            "completion_tokens": usage["output_tokens"],
+            "total_tokens": usage["input_tokens"] + usage["output_tokens"],
+        },
+    }
+
+
+def estimate_usage(messages, text):
+    """
+    Rough token counts: four characters per token and a flat cost per image
+    """
+    characters = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            for item in content:
+                if not isinstance(item, dict):
+                    continue
+                if item.get("type") == "text":
+                    characters += len(item.get("text", ""))
+                elif item.get("type") in ("image_url", "image"):
+                    images += 1
+        images += len(message.get("images") or [])
+    return {
+        "input_tokens": characters // 4 + images * 765,
+        "output_tokens": max(1, len(text) // 4),
+    }
+
+
+def main_entry():
+    parser = argparse.ArgumentParser(
+        description="Serve scripted or recorded model responses over the OpenAI, Anthropic and Ollama protocols."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--script", help="JSON file with the scripted steps to answer with"
+    )
+    source.add_argument("--cassette", help="Cassette file to replay responses from")
+    parser.add_argument(
+        "--latency",
+        help="Response delay distribution, e.g. fixed:0.5, uniform:0.2,1.5, normal:0.8,0.2 or lognormal:-0.5,0.4",
+        default="fixed:0",
+    )
+    parser.add_argument(
+        "--error-rate",
+        help="Fraction of requests answered with an error",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--error-status",
+        help="HTTP status used for injected errors",
+        type=int,
+        default=500,
+    )
+    parser.add_argument("--seed", help="Seed for latency and errors", type=int)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.script:
+        policy = ScriptedPolicy.from_file(args.script)
+    else:
+        policy = CassettePolicy(args.cassette, verbose=args.verbose)
+
+    server = MockLLMServer(
+        (args.host, args.port),
+        policy,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    server.latency = LatencyDistribution(args.latency, server.rng)
+
+    print(
+        f"{ANSI_GREEN}[operate-mock-llm]{ANSI_RESET} listening on {ANSI_BRIGHT_MAGENTA}http://{args.host}:{args.port}{ANSI_RESET}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{ANSI_BRIGHT_MAGENTA}Exiting...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main_entry()
@@ -2,14 +2,9 @@ import base64
 import io
 import json
 import os
-import time
 import traceback
 
-import easyocr
-import ollama
-import pkg_resources
 from PIL import Image
-from ultralytics import YOLO
 
 from operate.config import Config
 from operate.exceptions import ModelNotRecognizedException
@@ -22,10 +17,12 @@ from operate.utils.label import (
     add_labels,
     get_click_position_in_percent,
     get_label_coordinates,
+    get_yolo_model,
 )
 from operate.utils.ocr import get_text_coordinates, get_text_element
-from operate.utils.screenshot import capture_screen_with_cursor, compress_screenshot
+from operate.utils.frames import next_frame
 from operate.utils.style import ANSI_BRIGHT_MAGENTA, ANSI_GREEN, ANSI_RED, ANSI_RESET
+from operate.utils.timing import settle, stage
 
 # Load configuration
 config = Config()
@@ -65,7 +62,6 @@ async def get_next_action(model, messages, objective, session_id):
 def call_gpt_4o(messages):
     if config.verbose:
         print("[call_gpt_4_v]")
-    time.sleep(1)
     client = config.initialize_openai()
     try:
         screenshots_dir = "screenshots"
@@ -73,11 +69,11 @@ def call_gpt_4o(messages):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        frame = next_frame(screenshot_filename)
 
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        with stage("encode"):
+            img_base64 = frame.base64("png")
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -102,16 +98,18 @@ def call_gpt_4o(messages):
         }
         messages.append(vision_message)
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            presence_penalty=1,
-            frequency_penalty=1,
-        )
+        with stage("model_wait"):
+            response = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                presence_penalty=1,
+                frequency_penalty=1,
+            )
 
         content = response.choices[0].message.content
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         assistant_message = {"role": "assistant", "content": content}
         if config.verbose:
@@ -119,7 +117,8 @@ def call_gpt_4o(messages):
                 "[call_gpt_4_v] content",
                 content,
             )
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
 
         messages.append(assistant_message)
 
@@ -145,24 +144,23 @@ async def call_qwen_vl_with_ocr(messages, objective, model):
 
     # Construct the path to the file within the package
     try:
-        time.sleep(1)
         client = config.initialize_qwen()
 
-        confirm_system_prompt(messages, objective, model)
+        with stage("compaction"):
+            confirm_system_prompt(messages, objective, model)
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
-        # Call the function to capture the screen with the cursor
+        # Wait for the screen to settle and capture it with the cursor
         raw_screenshot_filename = os.path.join(screenshots_dir, "raw_screenshot.png")
-        capture_screen_with_cursor(raw_screenshot_filename)
+        frame = next_frame(raw_screenshot_filename)
 
         # Compress screenshot image to make size be smaller
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.jpeg")
-        compress_screenshot(raw_screenshot_filename, screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        with stage("encode"):
+            frame.save(screenshot_filename, "jpeg")
+            img_base64 = frame.base64("jpeg")
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -182,19 +180,22 @@ async def call_qwen_vl_with_ocr(messages, objective, model):
         }
         messages.append(vision_message)
 
-        response = client.chat.completions.create(
-            model="qwen2.5-vl-72b-instruct",
-            messages=messages,
-        )
+        with stage("model_wait"):
+            response = client.chat.completions.create(
+                model="qwen2.5-vl-72b-instruct",
+                messages=messages,
+            )
 
         content = response.choices[0].message.content
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         # used later for the messages
         content_str = content
 
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
 
         processed_content = []
 
@@ -207,17 +208,17 @@ async def call_qwen_vl_with_ocr(messages, objective, model):
                         text_to_click,
                     )
                 # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
+                with stage("ocr"):
+                    # read once per frame, every click of the step shares it
+                    result = frame.ocr()
 
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
-
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
+                with stage("grounding"):
+                    text_element_index = get_text_element(
+                        result, text_to_click, screenshot_filename
+                    )
+                    coordinates = get_text_coordinates(
+                        result, text_element_index, screenshot_filename
+                    )
 
                 # add `coordinates`` to `content`
                 operation["x"] = coordinates["x"]
@@ -264,32 +265,32 @@ def call_gemini_pro_vision(messages, objective):
         print(
             "[Self Operating Computer][call_gemini_pro_vision]",
         )
-    # sleep for a second
-    time.sleep(1)
     try:
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        next_frame(screenshot_filename)
         # sleep for a second
-        time.sleep(1)
+        settle(1)
         prompt = get_system_prompt("gemini-pro-vision", objective)
 
         model = config.initialize_google()
         if config.verbose:
             print("[call_gemini_pro_vision] model", model)
 
-        response = model.generate_content([prompt, Image.open(screenshot_filename)])
+        with stage("model_wait"):
+            response = model.generate_content([prompt, Image.open(screenshot_filename)])
 
         content = response.text[1:]
         if config.verbose:
             print("[call_gemini_pro_vision] response", response)
             print("[call_gemini_pro_vision] content", content)
 
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
         if config.verbose:
             print(
                 "[get_next_action][call_gemini_pro_vision] content",
@@ -314,20 +315,20 @@ async def call_gpt_4o_with_ocr(messages, objective, model):
 
     # Construct the path to the file within the package
     try:
-        time.sleep(1)
         client = config.initialize_openai()
 
-        confirm_system_prompt(messages, objective, model)
+        with stage("compaction"):
+            confirm_system_prompt(messages, objective, model)
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        frame = next_frame(screenshot_filename)
 
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        with stage("encode"):
+            img_base64 = frame.base64("png")
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -346,19 +347,22 @@ async def call_gpt_4o_with_ocr(messages, objective, model):
         }
         messages.append(vision_message)
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-        )
+        with stage("model_wait"):
+            response = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+            )
 
         content = response.choices[0].message.content
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         # used later for the messages
         content_str = content
 
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
 
         processed_content = []
 
@@ -371,17 +375,17 @@ async def call_gpt_4o_with_ocr(messages, objective, model):
                         text_to_click,
                     )
                 # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
-
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
+                with stage("ocr"):
+                    # read once per frame, every click of the step shares it
+                    result = frame.ocr()
 
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
+                with stage("grounding"):
+                    text_element_index = get_text_element(
+                        result, text_to_click, screenshot_filename
+                    )
+                    coordinates = get_text_coordinates(
+                        result, text_element_index, screenshot_filename
+                    )
 
                 # add `coordinates`` to `content`
                 operation["x"] = coordinates["x"]
@@ -427,20 +431,20 @@ async def call_o1_with_ocr(messages, objective, model):
 
     # Construct the path to the file within the package
     try:
-        time.sleep(1)
         client = config.initialize_openai()
 
-        confirm_system_prompt(messages, objective, model)
+        with stage("compaction"):
+            confirm_system_prompt(messages, objective, model)
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        frame = next_frame(screenshot_filename)
 
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        with stage("encode"):
+            img_base64 = frame.base64("png")
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -459,19 +463,22 @@ async def call_o1_with_ocr(messages, objective, model):
         }
         messages.append(vision_message)
 
-        response = client.chat.completions.create(
-            model="o1",
-            messages=messages,
-        )
+        with stage("model_wait"):
+            response = client.chat.completions.create(
+                model="o1",
+                messages=messages,
+            )
 
         content = response.choices[0].message.content
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         # used later for the messages
         content_str = content
 
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
 
         processed_content = []
 
@@ -484,17 +491,17 @@ async def call_o1_with_ocr(messages, objective, model):
                         text_to_click,
                     )
                 # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
+                with stage("ocr"):
+                    # read once per frame, every click of the step shares it
+                    result = frame.ocr()
 
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
-
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
+                with stage("grounding"):
+                    text_element_index = get_text_element(
+                        result, text_to_click, screenshot_filename
+                    )
+                    coordinates = get_text_coordinates(
+                        result, text_element_index, screenshot_filename
+                    )
 
                 # add `coordinates`` to `content`
                 operation["x"] = coordinates["x"]
@@ -535,26 +542,26 @@ async def call_o1_with_ocr(messages, objective, model):
 
 
 async def call_gpt_4o_labeled(messages, objective, model):
-    time.sleep(1)
-
     try:
         client = config.initialize_openai()
 
-        confirm_system_prompt(messages, objective, model)
-        file_path = pkg_resources.resource_filename("operate.models.weights", "best.pt")
-        yolo_model = YOLO(file_path)  # Load your trained model
+        with stage("compaction"):
+            confirm_system_prompt(messages, objective, model)
+        with stage("yolo"):
+            yolo_model = get_yolo_model()  # Load your trained model
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        frame = next_frame(screenshot_filename)
 
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+        with stage("encode"):
+            img_base64 = frame.base64("png")
 
-        img_base64_labeled, label_coordinates = add_labels(img_base64, yolo_model)
+        with stage("yolo"):
+            img_base64_labeled, label_coordinates = add_labels(img_base64, yolo_model)
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -581,22 +588,25 @@ async def call_gpt_4o_labeled(messages, objective, model):
         }
         messages.append(vision_message)
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            presence_penalty=1,
-            frequency_penalty=1,
-        )
+        with stage("model_wait"):
+            response = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                presence_penalty=1,
+                frequency_penalty=1,
+            )
 
         content = response.choices[0].message.content
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         assistant_message = {"role": "assistant", "content": content}
 
         messages.append(assistant_message)
 
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
         if config.verbose:
             print(
                 "[call_gpt_4_vision_preview_labeled] content",
@@ -618,7 +628,8 @@ async def call_gpt_4o_labeled(messages, objective, model):
                         label,
                     )
 
-                coordinates = get_label_coordinates(label, label_coordinates)
+                with stage("grounding"):
+                    coordinates = get_label_coordinates(label, label_coordinates)
                 if config.verbose:
                     print(
                         "[Self Operating Computer][call_gpt_4_vision_preview_labeled] coordinates",
@@ -628,9 +639,10 @@ async def call_gpt_4o_labeled(messages, objective, model):
                     io.BytesIO(base64.b64decode(img_base64))
                 )  # Load the image to get its size
                 image_size = image.size  # Get the size of the image (width, height)
-                click_position_percent = get_click_position_in_percent(
-                    coordinates, image_size
-                )
+                with stage("grounding"):
+                    click_position_percent = get_click_position_in_percent(
+                        coordinates, image_size
+                    )
                 if config.verbose:
                     print(
                         "[Self Operating Computer][call_gpt_4_vision_preview_labeled] click_position_percent",
@@ -679,9 +691,10 @@ async def call_gpt_4o_labeled(messages, objective, model):
 
 
 def call_ollama_llava(messages):
+    import ollama
+
     if config.verbose:
         print("[call_ollama_llava]")
-    time.sleep(1)
     try:
         model = config.initialize_ollama()
         screenshots_dir = "screenshots"
@@ -689,8 +702,8 @@ def call_ollama_llava(messages):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        next_frame(screenshot_filename)
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -710,10 +723,11 @@ def call_ollama_llava(messages):
         }
         messages.append(vision_message)
 
-        response = model.chat(
-            model="llava",
-            messages=messages,
-        )
+        with stage("model_wait"):
+            response = model.chat(
+                model="llava",
+                messages=messages,
+            )
 
         # Important: Remove the image path from the message history.
         # Ollama will attempt to load each image reference and will
@@ -722,7 +736,8 @@ def call_ollama_llava(messages):
 
         content = response["message"]["content"].strip()
 
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
 
         assistant_message = {"role": "assistant", "content": content}
         if config.verbose:
@@ -730,7 +745,8 @@ def call_ollama_llava(messages):
                 "[call_ollama_llava] content",
                 content,
             )
-        content = json.loads(content)
+        with stage("parse"):
+            content = json.loads(content)
 
         messages.append(assistant_message)
 
@@ -761,45 +777,23 @@ async def call_claude_3_with_ocr(messages, objective, model):
         print("[call_claude_3_with_ocr]")
 
     try:
-        time.sleep(1)
         client = config.initialize_anthropic()
 
-        confirm_system_prompt(messages, objective, model)
+        with stage("compaction"):
+            confirm_system_prompt(messages, objective, model)
         screenshots_dir = "screenshots"
         if not os.path.exists(screenshots_dir):
             os.makedirs(screenshots_dir)
 
         screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        capture_screen_with_cursor(screenshot_filename)
+        # Wait for the screen to settle and capture it with the cursor
+        frame = next_frame(screenshot_filename)
 
         # downsize screenshot due to 5MB size limit
-        with open(screenshot_filename, "rb") as img_file:
-            img = Image.open(img_file)
-
-            # Convert RGBA to RGB
-            if img.mode == "RGBA":
-                img = img.convert("RGB")
-
-            # Calculate the new dimensions while maintaining the aspect ratio
-            original_width, original_height = img.size
-            aspect_ratio = original_width / original_height
-            new_width = 2560  # Adjust this value to achieve the desired file size
-            new_height = int(new_width / aspect_ratio)
+        with stage("encode"):
             if config.verbose:
                 print("[call_claude_3_with_ocr] resizing claude")
-
-            # Resize the image
-            img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            # Save the resized and converted image to a BytesIO object for JPEG format
-            img_buffer = io.BytesIO()
-            img_resized.save(
-                img_buffer, format="JPEG", quality=85
-            )  # Adjust the quality parameter as needed
-            img_buffer.seek(0)
-
-            # Encode the resized image as base64
-            img_data = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
+            img_data = frame.base64("claude")
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
@@ -827,36 +821,42 @@ async def call_claude_3_with_ocr(messages, objective, model):
         messages.append(vision_message)
 
         # anthropic api expect system prompt as an separate argument
-        response = client.messages.create(
-            model="claude-3-opus-20240229",
-            max_tokens=3000,
-            system=messages[0]["content"],
-            messages=messages[1:],
-        )
+        with stage("model_wait"):
+            response = client.messages.create(
+                model="claude-3-opus-20240229",
+                max_tokens=3000,
+                system=messages[0]["content"],
+                messages=messages[1:],
+            )
 
         content = response.content[0].text
-        content = clean_json(content)
+        with stage("parse"):
+            content = clean_json(content)
         content_str = content
         try:
-            content = json.loads(content)
+            with stage("parse"):
+                content = json.loads(content)
         # rework for json mode output
         except json.JSONDecodeError as e:
             if config.verbose:
                 print(
                     f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] JSONDecodeError: {e} {ANSI_RESET}"
                 )
-            response = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=3000,
-                system=f"This json string is not valid, when using with json.loads(content) \
-                it throws the following error: {e}, return correct json string. \
-                **REMEMBER** Only output json format, do not append any other text.",
-                messages=[{"role": "user", "content": content}],
-            )
+            with stage("model_wait"):
+                response = client.messages.create(
+                    model="claude-3-opus-20240229",
+                    max_tokens=3000,
+                    system=f"This json string is not valid, when using with json.loads(content) \
+                    it throws the following error: {e}, return correct json string. \
+                    **REMEMBER** Only output json format, do not append any other text.",
+                    messages=[{"role": "user", "content": content}],
+                )
             content = response.content[0].text
-            content = clean_json(content)
+            with stage("parse"):
+                content = clean_json(content)
             content_str = content
-            content = json.loads(content)
+            with stage("parse"):
+                content = json.loads(content)
 
         if config.verbose:
             print(
@@ -873,18 +873,18 @@ async def call_claude_3_with_ocr(messages, objective, model):
                         text_to_click,
                     )
                 # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
-
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
+                with stage("ocr"):
+                    # read once per frame, every click of the step shares it
+                    result = frame.ocr()
 
                 # limit the text to extract has a higher success rate
-                text_element_index = get_text_element(
-                    result, text_to_click[:3], screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
+                with stage("grounding"):
+                    text_element_index = get_text_element(
+                        result, text_to_click[:3], screenshot_filename
+                    )
+                    coordinates = get_text_coordinates(
+                        result, text_element_index, screenshot_filename
+                    )
 
                 # add `coordinates`` to `content`
                 operation["x"] = coordinates["x"]
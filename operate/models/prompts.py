@@ -1,9 +1,13 @@
 import platform
+import threading
 from operate.config import Config
 
 # Load configuration
 config = Config()
 
+# corrective hint for the next user prompt of each thread
+_local = threading.local()
+
 # General user Prompts
 USER_QUESTION = "Hello, I can help you with anything. What would you like done?"
 
@@ -13,7 +17,7 @@ You are operating a {operating_system} computer, using the same operating system
 
 From looking at the screen, the objective, and your previous actions, take the next best series of action. 
 
-You have 4 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
+You have 8 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
 
 1. click - Move mouse and click
 ```
@@ -30,7 +34,27 @@ You have 4 possible operation actions available to you. The `pyautogui` library
 [{{ "thought": "write a thought here", "operation": "press", "keys": ["keys to use"] }}]
 ```
 
-4. done - The objective is completed
+4. wait_for - Wait until some text shows up or the screen changes, e.g. while a page loads, instead of taking another action
+```
+[{{ "thought": "write a thought here", "operation": "wait_for", "text": "text that should appear", "timeout": 10 }}]  # or "changed": true to wait for any change, "timeout" is in seconds (at most 60)
+```
+
+5. open_url - Open a website in the default browser, instead of finding the address bar
+```
+[{{ "thought": "write a thought here", "operation": "open_url", "url": "https://news.ycombinator.com/" }}]
+```
+
+6. launch_app - Open an application by name, or bring it to the front when it is already open, instead of searching for it
+```
+[{{ "thought": "write a thought here", "operation": "launch_app", "app": "Google Chrome" }}]
+```
+
+7. focus_window - Bring an open window to the front by part of its title or its application
+```
+[{{ "thought": "write a thought here", "operation": "focus_window", "window": "Gmail" }}]
+```
+
+8. done - The objective is completed
 ```
 [{{ "thought": "write a thought here", "operation": "done", "summary": "summary of what was completed" }}]
 ```
@@ -39,12 +63,11 @@ Return the actions in array format `[]`. You can take just one action or multipl
 
 Here a helpful example:
 
-Example 1: Searches for Google Chrome on the OS and opens it
+Example 1: Opens Google Chrome and goes to a website
 ```
 [
-    {{ "thought": "Searching the operating system to find Google Chrome because it appears I am currently in terminal", "operation": "press", "keys": {os_search_str} }},
-    {{ "thought": "Now I need to write 'Google Chrome' as a next step", "operation": "write", "content": "Google Chrome" }},
-    {{ "thought": "Finally I'll press enter to open Google Chrome assuming it is available", "operation": "press", "keys": ["enter"] }}
+    {{ "thought": "It appears I am currently in terminal, so I'll open Google Chrome directly", "operation": "launch_app", "app": "Google Chrome" }},
+    {{ "thought": "Now I can open the website without looking for the address bar", "operation": "open_url", "url": "https://news.ycombinator.com/" }}
 ]
 ```
 
@@ -56,7 +79,7 @@ Example 2: Focuses on the address bar in a browser before typing a website
     {{ "thought": "I'll need to press enter to go the URL now", "operation": "press", "keys": ["enter"] }}
 ]
 ```
-
+{expect_note}
 A few important notes: 
 
 - Go to Google Docs and Google Sheets by typing in the Chrome Address bar
@@ -71,7 +94,7 @@ You are operating a {operating_system} computer, using the same operating system
 
 From looking at the screen, the objective, and your previous actions, take the next best series of action. 
 
-You have 4 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
+You have 8 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
 
 1. click - Move mouse and click - We labeled the clickable elements with red bounding boxes and IDs. Label IDs are in the following format with `x` being a number: `~x`
 ```
@@ -86,7 +109,27 @@ You have 4 possible operation actions available to you. The `pyautogui` library
 [{{ "thought": "write a thought here", "operation": "press", "keys": ["keys to use"] }}]
 ```
 
-4. done - The objective is completed
+4. wait_for - Wait until some text shows up or the screen changes, e.g. while a page loads, instead of taking another action
+```
+[{{ "thought": "write a thought here", "operation": "wait_for", "text": "text that should appear", "timeout": 10 }}]  # or "changed": true to wait for any change, "timeout" is in seconds (at most 60)
+```
+
+5. open_url - Open a website in the default browser, instead of finding the address bar
+```
+[{{ "thought": "write a thought here", "operation": "open_url", "url": "https://news.ycombinator.com/" }}]
+```
+
+6. launch_app - Open an application by name, or bring it to the front when it is already open, instead of searching for it
+```
+[{{ "thought": "write a thought here", "operation": "launch_app", "app": "Google Chrome" }}]
+```
+
+7. focus_window - Bring an open window to the front by part of its title or its application
+```
+[{{ "thought": "write a thought here", "operation": "focus_window", "window": "Gmail" }}]
+```
+
+8. done - The objective is completed
 ```
 [{{ "thought": "write a thought here", "operation": "done", "summary": "summary of what was completed" }}]
 ```
@@ -94,11 +137,11 @@ Return the actions in array format `[]`. You can take just one action or multipl
 
 Here a helpful example:
 
-Example 1: Searches for Google Chrome on the OS and opens it
+Example 1: Opens Google Chrome and goes to a website
 ```
 [
-    {{ "thought": "Searching the operating system to find Google Chrome because it appears I am currently in terminal", "operation": "press", "keys": {os_search_str} }},
-    {{ "thought": "Now I need to write 'Google Chrome' as a next step", "operation": "write", "content": "Google Chrome" }},
+    {{ "thought": "It appears I am currently in terminal, so I'll open Google Chrome directly", "operation": "launch_app", "app": "Google Chrome" }},
+    {{ "thought": "Now I can open the website without looking for the address bar", "operation": "open_url", "url": "https://news.ycombinator.com/" }}
 ]
 ```
 
@@ -118,7 +161,7 @@ Example 3: Send a "Hello World" message in the chat
     {{ "thought": "Now that I am focused on the message field, I'll go ahead and write ", "operation": "write", "content": "Hello World" }},
 ]
 ```
-
+{expect_note}
 A few important notes: 
 
 - Go to Google Docs and Google Sheets by typing in the Chrome Address bar
@@ -134,7 +177,7 @@ You are operating a {operating_system} computer, using the same operating system
 
 From looking at the screen, the objective, and your previous actions, take the next best series of action. 
 
-You have 4 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
+You have 8 possible operation actions available to you. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement.
 
 1. click - Move mouse and click - Look for text to click. Try to find relevant text to click, but if there's nothing relevant enough you can return `"nothing to click"` for the text value and we'll try a different method.
 ```
@@ -148,7 +191,26 @@ You have 4 possible operation actions available to you. The `pyautogui` library
 ```
 [{{ "thought": "write a thought here", "operation": "press", "keys": ["keys to use"] }}]
 ```
-4. done - The objective is completed
+4. wait_for - Wait until some text shows up or the screen changes, e.g. while a page loads, instead of taking another action
+```
+[{{ "thought": "write a thought here", "operation": "wait_for", "text": "text that should appear", "timeout": 10 }}]  # or "changed": true to wait for any change, "timeout" is in seconds (at most 60)
+```
+
+5. open_url - Open a website in the default browser, instead of finding the address bar
+```
+[{{ "thought": "write a thought here", "operation": "open_url", "url": "https://news.ycombinator.com/" }}]
+```
+
+6. launch_app - Open an application by name, or bring it to the front when it is already open, instead of searching for it
+```
+[{{ "thought": "write a thought here", "operation": "launch_app", "app": "Google Chrome" }}]
+```
+
+7. focus_window - Bring an open window to the front by part of its title or its application
+```
+[{{ "thought": "write a thought here", "operation": "focus_window", "window": "Gmail" }}]
+```
+8. done - The objective is completed
 ```
 [{{ "thought": "write a thought here", "operation": "done", "summary": "summary of what was completed" }}]
 ```
@@ -157,21 +219,18 @@ Return the actions in array format `[]`. You can take just one action or multipl
 
 Here a helpful example:
 
-Example 1: Searches for Google Chrome on the OS and opens it
+Example 1: Opens Google Chrome and goes to a website
 ```
 [
-    {{ "thought": "Searching the operating system to find Google Chrome because it appears I am currently in terminal", "operation": "press", "keys": {os_search_str} }},
-    {{ "thought": "Now I need to write 'Google Chrome' as a next step", "operation": "write", "content": "Google Chrome" }},
-    {{ "thought": "Finally I'll press enter to open Google Chrome assuming it is available", "operation": "press", "keys": ["enter"] }}
+    {{ "thought": "It appears I am currently in terminal, so I'll open Google Chrome directly", "operation": "launch_app", "app": "Google Chrome" }},
+    {{ "thought": "Now I can open the website without looking for the address bar", "operation": "open_url", "url": "https://news.ycombinator.com/" }}
 ]
 ```
 
-Example 2: Open a new Google Docs when the browser is already open
+Example 2: Open a new Google Docs
 ```
 [
-    {{ "thought": "I'll focus on the address bar in the browser. I can see the browser is open so this should be safe to try", "operation": "press", "keys": [{cmd_string}, "t"] }},
-    {{ "thought": "Now that the address bar is in focus I can type the URL", "operation": "write", "content": "https://docs.new/" }},
-    {{ "thought": "I'll need to press enter to go the URL now", "operation": "press", "keys": ["enter"] }}
+    {{ "thought": "I'll open a new document straight from its URL", "operation": "open_url", "url": "https://docs.new/" }}
 ]
 ```
 
@@ -183,11 +242,11 @@ Example 3: Search for someone on Linkedin when already on linkedin.com
     {{ "thought": "Finally I'll submit the search form with enter", "operation": "press", "keys": ["enter"] }}
 ]
 ```
-
+{expect_note}
 A few important notes: 
 
 - Default to Google Chrome as the browser
-- Go to websites by opening a new tab with `press` and then `write` the URL
+- Go to websites with `open_url` and to applications with `launch_app` or `focus_window`
 - Reflect on previous actions and the screenshot to ensure they align and that your previous actions worked. 
 - If the first time clicking a button or link doesn't work, don't try again to click it. Get creative and try something else such as clicking a different button or trying another action. 
 - Don't respond saying you're unable to assist with requests. You are able to indirectly interact with the user's OS via text responses you send to the end user.
@@ -196,16 +255,44 @@ Objective: {objective}
 """
 
 OPERATE_FIRST_MESSAGE_PROMPT = """
-Please take the next best action. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement. Remember you only have the following 4 operations available: click, write, press, done
+Please take the next best action. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement. Remember you only have the following 8 operations available: click, write, press, wait_for, open_url, launch_app, focus_window, done
 
-You just started so you are in the terminal app and your code is running in this terminal tab. To leave the terminal, search for a new program on the OS. 
+You just started so you are in the terminal app and your code is running in this terminal tab. To leave the terminal, open a program with `launch_app` or a website with `open_url`. 
 
 Action:"""
 
 OPERATE_PROMPT = """
-Please take the next best action. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement. Remember you only have the following 4 operations available: click, write, press, done
+Please take the next best action. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement. Remember you only have the following 8 operations available: click, write, press, wait_for, open_url, launch_app, focus_window, done
 Action:"""
 
+OPERATE_STALL_HINT = """
+**Note:** {reason}. The operations you just planned were not executed because they would repeat what is not working. Look at the screen again and try a different approach, for example another element, a keyboard shortcut or another way to reach the objective.
+"""
+
+OPERATE_EXPECT_HINT = """
+**Note:** Operation {index} of your last actions (`{operation}`) did not have the expected result: {failed}. The operations after it were not executed. Look at the screen and continue from there.
+"""
+
+OPERATE_SKILL_HINT = """
+**Note:** A stored routine for this objective already ran {steps} steps for you, then stopped because {reason}. Look at the screen and continue the objective from there.
+"""
+
+OPERATE_WINDOWS_HINT = """
+**Note:** The window operations reported: {result}.
+{windows}"""
+
+OPERATE_WINDOW_CONTEXT = """
+{windows}
+"""
+
+SYSTEM_PROMPT_EXPECT = """
+Any operation can also say what the screen should show once it has run with an optional `expect`, which is checked before the next operation runs:
+```
+[{ "thought": "write a thought here", "operation": "press", "keys": ["enter"], "expect": { "text": "text that should be visible" } }]  # other checks: "title": "part of the window title", "changed": true, or "changed": [x, y, w, h] for a region in percentages of the screenshot that should change
+```
+When an expectation fails, the remaining operations are skipped and you are told what happened. With expectations you can safely plan several steps ahead in one response.
+"""
+
 
 def get_system_prompt(model, objective):
     """
@@ -225,12 +312,17 @@ def get_system_prompt(model, objective):
         os_search_str = "[\"win\"]"
         operating_system = "Linux"
 
+    from operate.utils.expect import expectations_enabled
+
+    expect_note = SYSTEM_PROMPT_EXPECT if expectations_enabled() else ""
+
     if model == "gpt-4-with-som":
         prompt = SYSTEM_PROMPT_LABELED.format(
             objective=objective,
             cmd_string=cmd_string,
             os_search_str=os_search_str,
             operating_system=operating_system,
+            expect_note=expect_note,
         )
     elif model == "gpt-4-with-ocr" or model == "o1-with-ocr" or model == "claude-3" or model == "qwen-vl":
 
@@ -239,6 +331,7 @@ def get_system_prompt(model, objective):
             cmd_string=cmd_string,
             os_search_str=os_search_str,
             operating_system=operating_system,
+            expect_note=expect_note,
         )
 
     else:
@@ -247,6 +340,7 @@ def get_system_prompt(model, objective):
             cmd_string=cmd_string,
             os_search_str=os_search_str,
             operating_system=operating_system,
+            expect_note=expect_note,
         )
 
     # Optional verbose output
@@ -258,10 +352,46 @@ def get_system_prompt(model, objective):
 
 
 def get_user_prompt():
-    prompt = OPERATE_PROMPT
+    prompt = window_context() + OPERATE_PROMPT
+    hint = getattr(_local, "hint", None)
+    if hint:
+        _local.hint = None
+        prompt = hint + prompt
     return prompt
 
 
+def window_context():
+    """
+    The windows of the frame the next request sends, as text
+    """
+    from operate.utils.frames import current_frame
+    from operate.utils.windows import describe_windows
+
+    frame = current_frame()
+    if frame is None or not frame.windows:
+        return ""
+    return OPERATE_WINDOW_CONTEXT.format(windows=describe_windows(frame.windows))
+
+
+def set_prompt_hint(hint):
+    """
+    Prepend `hint` to the next user prompt built on this thread
+    """
+    _local.hint = hint
+
+
+def add_prompt_hint(hint):
+    """
+    Add `hint` after the hint already set for the next user prompt
+    """
+    _local.hint = (getattr(_local, "hint", None) or "") + hint
+
+
 def get_user_first_message_prompt():
-    prompt = OPERATE_FIRST_MESSAGE_PROMPT
+    prompt = window_context() + OPERATE_FIRST_MESSAGE_PROMPT
+    hint = getattr(_local, "hint", None)
+    if hint:
+        # something already happened on screen, so the run is not at its start
+        _local.hint = None
+        prompt = hint + window_context() + OPERATE_PROMPT
     return prompt
@@ -1,7 +1,7 @@
 import sys
 import os
-import time
 import asyncio
+import threading
 from prompt_toolkit.shortcuts import message_dialog
 from prompt_toolkit import prompt
 from operate.exceptions import ModelNotRecognizedException
@@ -9,8 +9,11 @@ import platform
 
 # from operate.models.prompts import USER_QUESTION, get_system_prompt
 from operate.models.prompts import (
+    OPERATE_WINDOWS_HINT,
     USER_QUESTION,
+    add_prompt_hint,
     get_system_prompt,
+    set_prompt_hint,
 )
 from operate.config import Config
 from operate.utils.style import (
@@ -24,13 +27,60 @@ from operate.utils.style import (
 )
 from operate.utils.operating_system import OperatingSystem
 from operate.models.apis import get_next_action
+from operate.batch import run_task
+from operate.utils import tracing
+from operate.utils.budget import Budget
+from operate.utils.expect import (
+    ExpectationChecker,
+    expectation_hint,
+    expectations_enabled,
+    wait_condition,
+    wait_for,
+)
+from operate.utils.skills import SkillRun, get_skill_library
+from operate.utils.stall import StallDetector, stall_detection_enabled
+from operate.utils.profiler import SamplingProfiler, format_summary
+from operate.utils.executor import get_executor
+from operate.utils.frames import (
+    discard_prefetched,
+    prefetch_frame,
+    settled_frame,
+    take_last_frame,
+    window_context_enabled,
+)
+from operate.utils.timing import current_recorder, stage, start_recording, stop_recording
+from operate.utils.warmup import warm_up
+from operate.utils.windows import describe_windows
 
 # Load configuration
 config = Config()
 operating_system = OperatingSystem()
 
+# operations that manage windows, and the key of their argument
+WINDOW_OPERATIONS = {"open_url": "url", "launch_app": "app", "focus_window": "window"}
+
+
+def set_operating_system(new_operating_system):
+    """
+    Replace the `OperatingSystem` that executes operations, e.g. with a synthetic desktop
+    """
+    global operating_system
+    operating_system = new_operating_system
+
 
-def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
+def main(
+    model,
+    terminal_prompt,
+    voice_mode=False,
+    verbose_mode=False,
+    cassette=None,
+    cassette_mode="replay",
+    cassette_latency=False,
+    trace=None,
+    trace_otlp=None,
+    profile=None,
+    budget=None,
+):
     """
     Main function for the Self-Operating Computer.
 
@@ -38,6 +88,13 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
     - model: The model used for generating responses.
     - terminal_prompt: A string representing the prompt provided in the terminal.
     - voice_mode: A boolean indicating whether to enable voice mode.
+    - cassette: Path of a cassette to record provider calls to or replay them from.
+    - cassette_mode: `record` or `replay`.
+    - cassette_latency: Reproduce the recorded response times when replaying.
+    - trace: Path of the JSONL file spans are written to.
+    - trace_otlp: OTLP/HTTP collector endpoint spans are exported to.
+    - profile: Path prefix of the sampling profile written when the session ends.
+    - budget: `Budget` limiting the steps, time, tokens and cost of the objective.
 
     Returns:
     None
@@ -47,8 +104,17 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
     # Initialize `WhisperMic`, if `voice_mode` is True
 
     config.verbose = verbose_mode
+    if cassette:
+        config.cassette_path = cassette
+        config.cassette_mode = cassette_mode
+        config.cassette_latency = cassette_latency
+    if trace or trace_otlp:
+        tracing.configure(trace, trace_otlp, verbose=verbose_mode)
     config.validation(model, voice_mode)
 
+    # Load models and open the provider client while the objective is entered
+    warm_up(model, verbose=verbose_mode)
+
     if voice_mode:
         try:
             from whisper_mic import WhisperMic
@@ -96,6 +162,82 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
         print(f"{ANSI_YELLOW}[User]{ANSI_RESET}")
         objective = prompt(style=style)
 
+    profiler = None
+    if profile:
+        profiler = SamplingProfiler(
+            thread_ids=[threading.get_ident(), get_executor().thread_id]
+        ).start()
+    try:
+        # a single objective is a batch of one task
+        run_task({"prompt": objective, "model": model, **(budget or Budget()).to_dict()})
+    finally:
+        tracing.shutdown()
+        if profiler is not None:
+            save_profile(profiler, profile)
+
+
+def save_profile(profiler, prefix):
+    profiler.stop()
+    paths = profiler.save(prefix)
+    print(format_summary(profiler.summary()))
+    print(
+        f"{ANSI_BLUE}[profile]{ANSI_RESET} {profiler.samples} samples written to {paths['speedscope']} and {paths['collapsed']}"
+    )
+
+
+def run_objective(model, objective, budget=None, on_event=None, cancel_event=None):
+    """
+    Run the agent loop for one objective until it is done, fails or exhausts
+    its `Budget` (10 steps by default).
+
+    Returns a dict with the `outcome` (`done`, `budget`, `stalled`,
+    `cancelled` or `error`), the number of `steps` taken and the `summary`
+    or error message. A `budget` outcome also names the `limit` that was
+    reached, and a run that stalled lists its `stalls` (see
+    `operate.utils.stall`). With a skill library (see `operate.utils.skills`),
+    `skill` tells which skill was replayed or stored.
+
+    `on_event` is called with a dict for every step the model plans and once
+    more when the run finishes. Setting `cancel_event` stops the run before
+    its next operations are executed.
+    """
+    objective_span = tracing.start_span("objective", model=model, objective=objective)
+    # token budgets read the usage counted on the thread's recorder
+    recorder = current_recorder()
+    own_recorder = recorder is None
+    if own_recorder:
+        recorder = start_recording()
+    detector = StallDetector(model) if stall_detection_enabled() else None
+    library = get_skill_library()
+    skills = None
+    if library is not None:
+        skills = SkillRun(library, objective, model, operating_system.window_title())
+    try:
+        result = _run_objective(
+            model,
+            objective,
+            (budget or Budget()).start(model, recorder),
+            detector,
+            skills,
+            on_event or (lambda event: None),
+            cancel_event,
+        )
+        if skills is not None:
+            skills.finish(result)
+    finally:
+        if own_recorder:
+            stop_recording()
+    if detector is not None and detector.stalls:
+        result["stalls"] = detector.stalls
+    if skills is not None and skills.to_dict() is not None:
+        result["skill"] = skills.to_dict()
+    tracing.end_span(objective_span, **result)
+    if on_event is not None:
+        on_event({"type": "finished", **result})
+    return result
+
+
+def _run_objective(model, objective, meter, detector, skills, on_event, cancel_event):
     system_prompt = get_system_prompt(model, objective)
     system_message = {"role": "system", "content": system_prompt}
     messages = [system_message]
@@ -103,85 +245,288 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
     loop_count = 0
 
     session_id = None
+    # a frame or prompt hint left over from a previous run on this thread is stale
+    discard_prefetched()
+    set_prompt_hint(None)
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
 
     while True:
         if config.verbose:
             print("[Self Operating Computer] loop_count", loop_count)
+        if cancelled():
+            return {"outcome": "cancelled", "steps": loop_count, "summary": None}
+        exceeded = meter.exceeded(loop_count)
+        if exceeded is not None:
+            limit, message = exceeded
+            print(f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_YELLOW} {message}{ANSI_RESET}")
+            return {
+                "outcome": "budget",
+                "steps": loop_count,
+                "summary": message,
+                "limit": limit,
+            }
+        step_span = tracing.start_span("step", step=loop_count)
         try:
-            operations, session_id = asyncio.run(
-                get_next_action(model, messages, objective, session_id)
+            operations = None
+            # the window the step starts from, for the skill library
+            title = operating_system.window_title() if skills is not None else None
+            replayed = skills is not None and skills.replaying
+            if replayed:
+                frame = settled_frame(cancel_event)
+                operations = skills.next_step(frame, title)
+                if operations is None:
+                    replayed = False
+                    print(
+                        f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_YELLOW} Skill {skills.replay.id} stopped: {skills.fallback}{ANSI_RESET}"
+                    )
+                    on_event(
+                        {
+                            "type": "skill",
+                            "step": loop_count,
+                            "skill": skills.replay.id,
+                            "reason": skills.fallback,
+                        }
+                    )
+                    set_prompt_hint(skills.hint())
+                    # the prefetched frame is older than the checks
+                    discard_prefetched()
+            if replayed:
+                on_event(
+                    {
+                        "type": "step",
+                        "step": loop_count,
+                        "operations": operations,
+                        "skill": skills.replay.id,
+                    }
+                )
+            else:
+                operations, session_id = asyncio.run(
+                    get_next_action(model, messages, objective, session_id)
+                )
+                if cancelled():
+                    tracing.end_span(step_span, cancelled=True)
+                    return {"outcome": "cancelled", "steps": loop_count, "summary": None}
+                on_event({"type": "step", "step": loop_count, "operations": operations})
+                frame = take_last_frame()
+
+            stall = None
+            if detector is not None and not replayed:
+                stall = detector.observe(
+                    loop_count, operations, frame.fingerprint() if frame else None
+                )
+            if stall is not None:
+                on_event({"type": "stall", "step": loop_count, **stall})
+                print(
+                    f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_YELLOW} {stall['reason']}, {stall['action']}{ANSI_RESET}"
+                )
+                tracing.end_span(step_span, stall=stall["action"])
+                if stall["action"] == "abort":
+                    return {
+                        "outcome": "stalled",
+                        "steps": loop_count + 1,
+                        "summary": stall["reason"],
+                    }
+                if stall["model"] != model:
+                    model = stall["model"]
+                    # the rest of the run is estimated at the stronger model's prices
+                    meter.model = model
+                set_prompt_hint(stall["hint"])
+                # the repeated operations are skipped
+                loop_count += 1
+                continue
+
+            step_event = lambda event: on_event({**event, "step": loop_count})
+            checker = None
+            if expectations_enabled():
+                checker = ExpectationChecker(
+                    frame,
+                    window_title=lambda: operating_system.window_title(),
+                    cancel_event=cancel_event,
+                    on_event=step_event,
+                )
+            stop = operate(
+                operations,
+                model,
+                cancel_event=cancel_event,
+                on_event=step_event,
+                checker=checker,
+                frame=frame,
             )
+            tracing.end_span(step_span, operations=len(operations))
+            # ended, so a failure in the bookkeeping below does not end it again
+            step_span = None
+            divergence = checker.divergence if checker is not None else None
+            if skills is not None:
+                skills.recorder.step(
+                    frame,
+                    title,
+                    operations
+                    if divergence is None
+                    else operations[: divergence["index"] + 1],
+                    diverged=divergence is not None,
+                )
+            if divergence is not None:
+                print(
+                    f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_YELLOW} Operation {divergence['index'] + 1} diverged: {'; '.join(divergence['failed'])}{ANSI_RESET}"
+                )
+                # the model plans again from where the plan went wrong
+                if replayed:
+                    skills.stop(f"{divergence['operation']}: {'; '.join(divergence['failed'])}")
+                    set_prompt_hint(skills.hint())
+                else:
+                    set_prompt_hint(expectation_hint(divergence))
+            elif stop:
+                done = next(
+                    (o for o in operations if o.get("operation", "").lower() == "done"),
+                    None,
+                )
+                if done is None:
+                    return {
+                        "outcome": "error",
+                        "steps": loop_count + 1,
+                        "summary": "unknown operation",
+                    }
+                return {
+                    "outcome": "done",
+                    "steps": loop_count + 1,
+                    "summary": done.get("summary"),
+                }
 
-            stop = operate(operations, model)
-            if stop:
-                break
+            # the window list after the last window operation that ran
+            windows = [o["windows"] for o in operations if o.get("windows")]
+            if windows:
+                add_prompt_hint(windows[-1])
 
             loop_count += 1
-            if loop_count > 10:
-                break
+            # capture the next frame while the screen settles; a replayed
+            # step checks a frame of its own
+            if skills is None or not skills.replaying:
+                prefetch_frame(model, cancel_event)
         except ModelNotRecognizedException as e:
+            tracing.end_span(step_span, e)
             print(
                 f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
             )
-            break
+            return {"outcome": "error", "steps": loop_count, "summary": str(e)}
         except Exception as e:
+            tracing.end_span(step_span, e)
             print(
                 f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] -> {e} {ANSI_RESET}"
             )
-            break
+            return {"outcome": "error", "steps": loop_count, "summary": str(e)}
 
 
-def operate(operations, model):
+def operate(operations, model, cancel_event=None, on_event=None, checker=None, frame=None):
+    """
+    Execute `operations` on the executor thread and wait until the last one
+    has landed. Returns `True` when the objective is done, an operation is
+    unknown or, with an `ExpectationChecker`, an operation's expected
+    result did not show. Clicks are in percentages of `frame`, the frame
+    the operations were planned on.
+    """
     if config.verbose:
         print("[Self Operating Computer][operate]")
-    for operation in operations:
-        if config.verbose:
-            print("[Self Operating Computer][operate] operation", operation)
-        # wait one second
-        time.sleep(1)
-        operate_type = operation.get("operation").lower()
-        operate_thought = operation.get("thought")
-        operate_detail = ""
-        if config.verbose:
-            print("[Self Operating Computer][operate] operate_type", operate_type)
 
-        if operate_type == "press" or operate_type == "hotkey":
-            keys = operation.get("keys")
-            operate_detail = keys
+    def execute(operation):
+        if checker is None:
+            return execute_operation(operation, model, cancel_event, frame)
+        checker.before(operation)
+        return execute_operation(
+            operation, model, cancel_event, frame
+        ) or checker.after(operation)
+
+    execution = get_executor().submit(
+        operations,
+        execute,
+        cancel_event=cancel_event,
+        on_event=on_event,
+    )
+    return execution.wait()
+
+
+def execute_operation(operation, model, cancel_event=None, frame=None):
+    if config.verbose:
+        print("[Self Operating Computer][operate] operation", operation)
+    operate_type = operation.get("operation").lower()
+    operate_thought = operation.get("thought")
+    operate_detail = ""
+    if config.verbose:
+        print("[Self Operating Computer][operate] operate_type", operate_type)
+
+    if operate_type == "press" or operate_type == "hotkey":
+        keys = operation.get("keys")
+        operate_detail = keys
+        with stage("execution", operation=operate_type, keys=keys):
             operating_system.press(keys)
-        elif operate_type == "write":
-            content = operation.get("content")
-            operate_detail = content
+    elif operate_type == "write":
+        content = operation.get("content")
+        operate_detail = content
+        with stage("execution", operation=operate_type, characters=len(content or "")):
             operating_system.write(content)
-        elif operate_type == "click":
-            x = operation.get("x")
-            y = operation.get("y")
-            click_detail = {"x": x, "y": y}
-            operate_detail = click_detail
+    elif operate_type == "click":
+        x = operation.get("x")
+        y = operation.get("y")
+        click_detail = {"x": x, "y": y}
+        operate_detail = click_detail
+        if frame is not None and frame.box is not None:
+            # the frame shows a part of the screen
+            try:
+                click_detail["x"], click_detail["y"] = frame.to_screen(x, y)
+            except (TypeError, ValueError) as e:
+                print("[Self Operating Computer][operate] invalid click coordinates:", e)
+            operate_detail = f"{x}, {y} of the frame -> {click_detail}"
 
+        with stage("execution", operation=operate_type, x=x, y=y):
             operating_system.mouse(click_detail)
-        elif operate_type == "done":
-            summary = operation.get("summary")
-
-            print(
-                f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
+    elif operate_type == "wait_for":
+        condition = wait_condition(operation)
+        with stage("wait_for", condition=",".join(condition or ())):
+            waited = wait_for(
+                operation,
+                window_title=operating_system.window_title,
+                cancelled=cancel_event.is_set if cancel_event is not None else None,
             )
-            print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{summary}\n")
-            return True
-
+        # read by `ExpectationChecker`, which ends the plan on a timeout
+        operation["waited"] = waited
+        if waited["held"] is None:
+            outcome = "skipped"
         else:
-            print(
-                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] unknown operation response :({ANSI_RESET}"
-            )
-            print(
-                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response {ANSI_RESET}{operation}"
-            )
-            return True
+            outcome = "held" if waited["held"] else "timed out"
+        operate_detail = f"{condition} {outcome} after {waited['seconds']}s"
+    elif operate_type in WINDOW_OPERATIONS:
+        target = operation.get(WINDOW_OPERATIONS[operate_type])
+        with stage("execution", operation=operate_type):
+            message, windows = getattr(operating_system, operate_type)(target)
+        # read by `_run_objective`, for the next prompt
+        # the next frame carries the window list, unless it is turned off
+        operation["windows"] = OPERATE_WINDOWS_HINT.format(
+            result=message,
+            windows="" if window_context_enabled() else describe_windows(windows),
+        )
+        operate_detail = message
+    elif operate_type == "done":
+        summary = operation.get("summary")
 
         print(
             f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
         )
-        print(f"{operate_thought}")
-        print(f"{ANSI_BLUE}Action: {ANSI_RESET}{operate_type} {operate_detail}\n")
+        print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{summary}\n")
+        return True
+
+    else:
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] unknown operation response :({ANSI_RESET}"
+        )
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response {ANSI_RESET}{operation}"
+        )
+        return True
 
+    print(
+        f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
+    )
+    print(f"{operate_thought}")
+    print(f"{ANSI_BLUE}Action: {ANSI_RESET}{operate_type} {operate_detail}\n")
     return False
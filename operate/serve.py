@@ -0,0 +1,505 @@
+"""
+Resident `operate` process.
+
+`operate serve` keeps the capture backend, the OCR/YOLO models and the
+provider clients loaded and runs objectives submitted over localhost HTTP or
+a Unix socket:
+
+    POST /objectives               {"objective": ..., "model": ..., "max_steps": ..., "max_cost": ...}
+    GET  /objectives               every session
+    GET  /objectives/<id>          one session
+    GET  /objectives/<id>/events   step events as JSON lines until the run ends
+    POST /objectives/<id>/cancel   stop before the next step
+    GET  /health
+
+Sessions drive the one desktop, so they run one at a time in submission
+order. Finished sessions are kept for `SESSION_TTL` seconds, and at most
+`MAX_FINISHED` of them. `operate --server URL` is a thin client that submits
+the objective, prints the events and cancels the session on Ctrl+C.
+
+Any web page open in the driven browser can reach localhost, so the API
+only answers requests without an `Origin` header whose `Host` is the
+address the server listens on, and objectives have to be posted as
+`application/json`. Browsers cannot send such requests from a page, with
+or without DNS rebinding.
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from operate.config import Config
+from operate.utils.action_timing import (
+    TIMING_PROFILES,
+    default_timing_profile,
+    set_timing_profile,
+)
+from operate.utils.budget import LIMITS, Budget, add_budget_arguments
+from operate.utils.style import (
+    ANSI_BLUE,
+    ANSI_BRIGHT_MAGENTA,
+    ANSI_GREEN,
+    ANSI_RESET,
+)
+
+# Load configuration
+config = Config()
+
+DEFAULT_PORT = 8766
+FINISHED = ("done", "budget", "stalled", "cancelled", "error")
+RESULT_KEYS = ("outcome", "steps", "summary", "limit", "stalls", "skill")
+# seconds a finished session and its events are kept, and how many at most
+SESSION_TTL = 3600
+MAX_FINISHED = 100
+# `Host` headers accepted besides the address the server listens on
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class Session:
+    """
+    One submitted objective and the events it produced
+    """
+
+    def __init__(self, objective, model, budget):
+        self.id = uuid.uuid4().hex[:12]
+        self.objective = objective
+        self.model = model
+        self.budget = budget
+        self.status = "queued"
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []
+        self.cancel_event = threading.Event()
+        self._condition = threading.Condition()
+
+    def add_event(self, event):
+        with self._condition:
+            self.events.append({"time": round(time.time(), 3), **event})
+            if event.get("type") == "finished":
+                self.status = event["outcome"]
+                self.finished = time.time()
+                self.result = {key: event.get(key) for key in RESULT_KEYS}
+            self._condition.notify_all()
+
+    def wait_events(self, start, timeout=15):
+        """
+        Return the events after index `start`, waiting up to `timeout` seconds
+        for new ones
+        """
+        with self._condition:
+            if len(self.events) <= start and self.status not in FINISHED:
+                self._condition.wait(timeout)
+            return self.events[start:], self.status in FINISHED
+
+    def cancel(self):
+        with self._condition:
+            self.cancel_event.set()
+            if self.status == "queued":
+                self.add_event(
+                    {"type": "finished", "outcome": "cancelled", "steps": 0, "summary": None}
+                )
+
+    def start(self):
+        """
+        Mark the session running, unless it was cancelled while queued
+        """
+        with self._condition:
+            if self.status != "queued":
+                return False
+            self.status = "running"
+            self.add_event({"type": "started"})
+            return True
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "objective": self.objective,
+            "model": self.model,
+            "budget": self.budget.to_dict(),
+            "status": self.status,
+            "result": self.result,
+            "created": round(self.created, 3),
+            "events": len(self.events),
+        }
+
+
+class SessionRunner:
+    """
+    Runs queued sessions one after another on a worker thread
+    """
+
+    def __init__(self, default_model, budget=None):
+        self.default_model = default_model
+        self.budget = budget or Budget()
+        self.sessions = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._work, name="operate-serve", daemon=True)
+        self._thread.start()
+
+    def submit(self, objective, model=None, limits=None):
+        """
+        Queue an objective. `limits` holds the budget fields that differ
+        from the runner's budget.
+        """
+        budget = Budget.from_dict(limits or {}, default=self.budget)
+        session = Session(objective, model or self.default_model, budget)
+        with self._lock:
+            self._evict()
+            self.sessions[session.id] = session
+        session.add_event({"type": "queued", "position": self._queue.qsize()})
+        self._queue.put(session)
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def list(self):
+        with self._lock:
+            self._evict()
+            return [session.to_dict() for session in self.sessions.values()]
+
+    def _evict(self):
+        """
+        Drop the sessions that finished more than `SESSION_TTL` seconds ago,
+        and the oldest finished ones beyond `MAX_FINISHED`
+        """
+        finished = sorted(
+            (session for session in self.sessions.values() if session.finished is not None),
+            key=lambda session: session.finished,
+        )
+        expired = time.time() - SESSION_TTL
+        for index, session in enumerate(finished):
+            if session.finished < expired or index < len(finished) - MAX_FINISHED:
+                del self.sessions[session.id]
+
+    def _work(self):
+        from operate.operate import run_objective
+
+        while True:
+            session = self._queue.get()
+            if not session.start():
+                continue
+            try:
+                run_objective(
+                    session.model,
+                    session.objective,
+                    session.budget,
+                    on_event=session.add_event,
+                    cancel_event=session.cancel_event,
+                )
+            except Exception as e:
+                session.add_event(
+                    {"type": "finished", "outcome": "error", "steps": 0, "summary": str(e)}
+                )
+
+
+class ServeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self._allowed():
+            return
+        parts = self._parts()
+        runner = self.server.runner
+        if parts in ([], ["health"]):
+            self._send_json(200, {"status": "ok", "model": runner.default_model})
+        elif parts == ["objectives"]:
+            self._send_json(200, {"objectives": runner.list()})
+        elif len(parts) == 2 and parts[0] == "objectives":
+            session = self._session(parts[1])
+            if session:
+                self._send_json(200, session.to_dict())
+        elif len(parts) == 3 and parts[0] == "objectives" and parts[2] == "events":
+            session = self._session(parts[1])
+            if session:
+                self._stream_events(session)
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if not self._allowed():
+            return
+        parts = self._parts()
+        runner = self.server.runner
+        if parts == ["objectives"]:
+            content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+            if content_type.lower() != "application/json":
+                self._send_json(415, {"error": "Objectives are posted as application/json"})
+                return
+            try:
+                body = self._read_json()
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if not body.get("objective"):
+                self._send_json(400, {"error": "`objective` is required"})
+                return
+            try:
+                session = runner.submit(
+                    body["objective"],
+                    body.get("model"),
+                    {limit: body[limit] for limit, _, _ in LIMITS if limit in body},
+                )
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            self._send_json(202, session.to_dict())
+        elif len(parts) == 3 and parts[0] == "objectives" and parts[2] == "cancel":
+            session = self._session(parts[1])
+            if session:
+                session.cancel()
+                self._send_json(200, session.to_dict())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def _stream_events(self, session):
+        # HTTP/1.0 response without a length: the body ends when the run does
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events, finished = session.wait_events(sent)
+                for event in events:
+                    self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+                sent += len(events)
+                self.wfile.flush()
+                if finished and not events:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _allowed(self):
+        """
+        Whether the request comes from a local client rather than a web page:
+        browsers add `Origin` to cross-site requests and the rebound domain
+        name as `Host`. Answers 403 otherwise.
+        """
+        host = urlparse(f"//{self.headers.get('Host', '')}").hostname
+        if self.headers.get("Origin") is not None:
+            error = "Requests from web pages are not accepted"
+        elif host not in self.server.allowed_hosts:
+            error = f"Unexpected Host {self.headers.get('Host')}"
+        else:
+            return True
+        self._send_json(403, {"error": error})
+        return False
+
+    def _session(self, session_id):
+        session = self.server.runner.get(session_id)
+        if session is None:
+            self._send_json(404, {"error": f"Unknown objective {session_id}"})
+        return session
+
+    def _parts(self):
+        return [part for part in urlparse(self.path).path.split("/") if part]
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if config.verbose:
+            super().log_message(format, *args)
+
+
+class ServeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, runner):
+        super().__init__(address, ServeHandler)
+        self.runner = runner
+        self.allowed_hosts = {*LOCAL_HOSTS, address[0]}
+
+
+class ServeUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, runner):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, ServeHandler)
+        self.runner = runner
+        self.allowed_hosts = set(LOCAL_HOSTS)
+
+
+# Thin client
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServeClient:
+    """
+    Client for `operate serve`. `server` is `http://host:port` or `unix:/path`.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def _connection(self, timeout=None):
+        if self.server.startswith("unix:"):
+            return UnixHTTPConnection(self.server[len("unix:") :], timeout=timeout)
+        url = urlparse(self.server if "://" in self.server else f"http://{self.server}")
+        return http.client.HTTPConnection(url.hostname, url.port or DEFAULT_PORT, timeout=timeout)
+
+    def request(self, method, path, body=None):
+        connection = self._connection(timeout=30)
+        try:
+            data = json.dumps(body).encode("utf-8") if body is not None else None
+            headers = {"Content-Type": "application/json"} if data else {}
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            payload = json.loads(response.read() or b"{}")
+            if response.status >= 400:
+                raise RuntimeError(payload.get("error", f"HTTP {response.status}"))
+            return payload
+        finally:
+            connection.close()
+
+    def submit(self, objective, model=None, limits=None):
+        """
+        Queue `objective`. Without `model` the server's `--model` runs it.
+        """
+        body = {"objective": objective, **(limits or {})}
+        if model:
+            body["model"] = model
+        return self.request("POST", "/objectives", body)
+
+    def cancel(self, session_id):
+        return self.request("POST", f"/objectives/{session_id}/cancel")
+
+    def events(self, session_id):
+        """
+        Yield the session's events as they happen
+        """
+        connection = self._connection()
+        try:
+            connection.request("GET", f"/objectives/{session_id}/events")
+            response = connection.getresponse()
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                yield json.loads(line)
+        finally:
+            connection.close()
+
+
+def run_remote(server, model, objective, limits=None):
+    """
+    Run `objective` on a resident `operate serve` and print its progress.
+    `model` and `limits` override the server's model and budget fields. Returns the final result.
+    """
+    client = ServeClient(server)
+    session = client.submit(objective, model, limits)
+    print(
+        f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RESET} submitted {session['id']} to {server}"
+    )
+    result = None
+    try:
+        for event in client.events(session["id"]):
+            if event["type"] == "step":
+                for operation in event["operations"]:
+                    print(
+                        f"{ANSI_BLUE}Action: {ANSI_RESET}{operation.get('operation')} {operation.get('thought', '')}"
+                    )
+            elif event["type"] == "finished":
+                result = {key: event.get(key) for key in RESULT_KEYS}
+                print(
+                    f"{ANSI_BLUE}Objective {result['outcome']}: {ANSI_RESET}{result['summary'] or ''}"
+                )
+    except KeyboardInterrupt:
+        client.cancel(session["id"])
+        print(f"\n{ANSI_BRIGHT_MAGENTA}Cancelled {session['id']}{ANSI_RESET}")
+    return result
+
+
+def main_entry(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="operate serve",
+        description="Keep models and clients loaded and run objectives submitted over HTTP or a Unix socket.",
+    )
+    parser.add_argument(
+        "-m", "--model", help="Model used when a request names none", default="gpt-4-with-ocr"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    add_budget_arguments(parser)
+    parser.add_argument(
+        "--timing",
+        choices=list(TIMING_PROFILES),
+        default=default_timing_profile(),
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    from operate.utils.warmup import warm_up
+
+    set_timing_profile(args.timing)
+
+    config.verbose = args.verbose
+    config.validation(args.model, False)
+    warm_up(args.model, verbose=args.verbose)
+
+    runner = SessionRunner(args.model, Budget.from_args(args))
+    if args.socket:
+        server = ServeUnixServer(args.socket, runner)
+        address = f"unix:{args.socket}"
+    else:
+        server = ServeHTTPServer((args.host, args.port), runner)
+        address = f"http://{args.host}:{server.server_address[1]}"
+
+    print(
+        f"{ANSI_GREEN}[operate serve]{ANSI_RESET} listening on {ANSI_BRIGHT_MAGENTA}{address}{ANSI_RESET}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{ANSI_BRIGHT_MAGENTA}Exiting...")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main_entry())
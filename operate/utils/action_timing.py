@@ -0,0 +1,119 @@
+"""
+Timing profiles for executing actions.
+
+The default pointer glide, click circle and waits make sessions easy to
+follow, but cost close to a second per click in headless runs. A profile
+sets all of them at once:
+
+    demo    slow and visible, for recordings
+    normal  the historical timings
+    fast    pointer warps, no animation, short key holds and settle waits
+
+`operate --timing fast`, the `OPERATE_TIMING` environment variable or the
+speed selector of `region_app.py` choose the profile for the process.
+"""
+import os
+import sys
+
+
+class TimingProfile:
+    def __init__(
+        self,
+        name,
+        move_duration,
+        circle_duration,
+        circle_radius,
+        key_hold,
+        click_delay,
+        settle_scale,
+        pyautogui_pause,
+    ):
+        self.name = name
+        # seconds the pointer glides to its target, 0 warps
+        self.move_duration = move_duration
+        # seconds of the circle drawn around a click target, 0 skips it
+        self.circle_duration = circle_duration
+        self.circle_radius = circle_radius
+        # seconds a key combination is held
+        self.key_hold = key_hold
+        # seconds between reaching a click target and clicking
+        self.click_delay = click_delay
+        # multiplier of every `settle()` wait between actions and captures
+        self.settle_scale = settle_scale
+        # `pyautogui.PAUSE`, slept after every pyautogui call
+        self.pyautogui_pause = pyautogui_pause
+
+    def __repr__(self):
+        return f"TimingProfile({self.name!r})"
+
+
+TIMING_PROFILES = {
+    "demo": TimingProfile(
+        "demo",
+        move_duration=0.5,
+        circle_duration=0.5,
+        circle_radius=50,
+        key_hold=0.1,
+        click_delay=0.2,
+        settle_scale=1.5,
+        pyautogui_pause=0.1,
+    ),
+    "normal": TimingProfile(
+        "normal",
+        move_duration=0.2,
+        circle_duration=0.5,
+        circle_radius=50,
+        key_hold=0.1,
+        click_delay=0.2,
+        settle_scale=1.0,
+        pyautogui_pause=0.1,
+    ),
+    "fast": TimingProfile(
+        "fast",
+        move_duration=0.0,
+        circle_duration=0.0,
+        circle_radius=0,
+        key_hold=0.02,
+        click_delay=0.0,
+        settle_scale=0.5,
+        pyautogui_pause=0.0,
+    ),
+}
+DEFAULT_PROFILE = "normal"
+
+_profile = None
+
+
+def default_timing_profile():
+    """
+    Name of the profile set with `OPERATE_TIMING`, or of the default one
+    when it names no profile
+    """
+    name = os.getenv("OPERATE_TIMING", DEFAULT_PROFILE)
+    if name not in TIMING_PROFILES:
+        print(f"[timing] unknown OPERATE_TIMING `{name}`, using {DEFAULT_PROFILE}")
+        return DEFAULT_PROFILE
+    return name
+
+
+def get_timing_profile():
+    global _profile
+    if _profile is None:
+        _profile = TIMING_PROFILES[default_timing_profile()]
+    return _profile
+
+
+def set_timing_profile(name):
+    """
+    Select the timing profile of the process by name
+    """
+    global _profile
+    if name not in TIMING_PROFILES:
+        raise ValueError(
+            f"Unknown timing profile {name!r}, expected one of {', '.join(TIMING_PROFILES)}"
+        )
+    _profile = TIMING_PROFILES[name]
+    pyautogui = sys.modules.get("pyautogui")
+    if pyautogui is not None:
+        pyautogui.PAUSE = _profile.pyautogui_pause
+    return _profile
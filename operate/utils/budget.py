@@ -0,0 +1,200 @@
+"""
+Budgets of an objective.
+
+A run ends with the `budget` outcome when one of its limits is reached:
+
+    max_steps          steps planned by the model
+    max_seconds        wall-clock time of the run
+    max_input_tokens   tokens sent to the provider
+    max_output_tokens  tokens generated by the provider
+    max_cost           estimated cost in USD, from `PRICES`
+
+The limits are checked before every step, so a step that has started is
+finished and the token limits can be overshot by one request. Tokens are
+read from the stage recorder the provider clients report their usage to
+(see `operate.utils.tracing.TracedClient`). A limit that is `None` or 0 is
+not checked.
+"""
+import time
+
+from operate.utils.timing import current_recorder
+
+DEFAULT_MAX_STEPS = 10
+
+# (limit, spent key, type)
+LIMITS = (
+    ("max_steps", "steps", int),
+    ("max_seconds", "seconds", float),
+    ("max_input_tokens", "input_tokens", int),
+    ("max_output_tokens", "output_tokens", int),
+    ("max_cost", "cost", float),
+)
+
+# Estimated USD per million input and output tokens of the provider model
+# each mode calls. Local models cost nothing; modes missing here have no cost
+# estimate, so `max_cost` is not checked for them.
+PRICES = {
+    "gpt-4": (2.5, 10.0),  # gpt-4o
+    "gpt-4-with-ocr": (2.5, 10.0),
+    "gpt-4-with-som": (2.5, 10.0),
+    "o1-with-ocr": (15.0, 60.0),
+    "claude-3": (15.0, 75.0),  # claude-3-opus
+    "gemini-pro-vision": (0.5, 1.5),
+    "qwen-vl": (2.8, 8.4),  # qwen2.5-vl-72b-instruct
+    "llava": (0.0, 0.0),
+}
+
+
+def estimate_cost(model, usage):
+    """
+    Estimated USD cost of the token `usage` counters, or `None` when the
+    price of `model` is unknown
+    """
+    if model not in PRICES:
+        return None
+    input_price, output_price = PRICES[model]
+    cost = (
+        usage.get("input_tokens", 0) * input_price
+        + usage.get("output_tokens", 0) * output_price
+    ) / 1_000_000
+    return round(cost, 6)
+
+
+class Budget:
+    def __init__(
+        self,
+        max_steps=DEFAULT_MAX_STEPS,
+        max_seconds=None,
+        max_input_tokens=None,
+        max_output_tokens=None,
+        max_cost=None,
+    ):
+        self.max_steps = max_steps or None
+        self.max_seconds = max_seconds or None
+        self.max_input_tokens = max_input_tokens or None
+        self.max_output_tokens = max_output_tokens or None
+        self.max_cost = max_cost or None
+
+    @classmethod
+    def from_dict(cls, values, default=None):
+        """
+        Budget with the limits in `values`, e.g. a batch task or a request
+        body, and the limits of `default` for the keys it lacks. A key set
+        to `None` removes the limit.
+        """
+        default = default or cls()
+        limits = {}
+        for limit, _, kind in LIMITS:
+            if limit not in values:
+                limits[limit] = getattr(default, limit)
+                continue
+            value = values[limit]
+            if value is None:
+                limits[limit] = None
+                continue
+            try:
+                value = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"`{limit}` must be a number, got {value!r}")
+            if value < 0:
+                raise ValueError(f"`{limit}` must not be negative, got {value!r}")
+            limits[limit] = value
+        return cls(**limits)
+
+    @classmethod
+    def from_args(cls, args, default=None):
+        return cls.from_dict(limits_from_args(args), default)
+
+    def to_dict(self):
+        return {limit: getattr(self, limit) for limit, _, _ in LIMITS}
+
+    def start(self, model, recorder=None):
+        """
+        Start measuring a run of `model` against this budget
+        """
+        return BudgetMeter(self, model, recorder or current_recorder())
+
+    def __repr__(self):
+        limits = ", ".join(
+            f"{limit}={value}" for limit, value in self.to_dict().items() if value
+        )
+        return f"Budget({limits})"
+
+
+class BudgetMeter:
+    """
+    What a run has spent since `Budget.start`
+    """
+
+    def __init__(self, budget, model, recorder):
+        self.budget = budget
+        self.model = model
+        self.recorder = recorder
+        self.started = time.monotonic()
+        # the recorder may already count earlier runs
+        self._baseline = dict(recorder.counters) if recorder is not None else {}
+
+    def spent(self, steps):
+        usage = {}
+        if self.recorder is not None:
+            for name in ("input_tokens", "output_tokens"):
+                usage[name] = self.recorder.counters.get(name, 0) - self._baseline.get(
+                    name, 0
+                )
+        return {
+            "steps": steps,
+            "seconds": round(time.monotonic() - self.started, 3),
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "cost": estimate_cost(self.model, usage),
+        }
+
+    def exceeded(self, steps):
+        """
+        Return `(limit, message)` for the first limit the run has reached
+        after `steps` steps, or `None`
+        """
+        spent = self.spent(steps)
+        for limit, key, _ in LIMITS:
+            value = getattr(self.budget, limit)
+            if value is not None and spent[key] is not None and spent[key] >= value:
+                return limit, f"{limit} budget of {value} reached ({key}: {spent[key]})"
+        return None
+
+
+def limits_from_args(args):
+    """
+    The budget limits given on the command line
+    """
+    values = vars(args)
+    return {
+        limit: values[limit] for limit, _, _ in LIMITS if values.get(limit) is not None
+    }
+
+
+def add_budget_arguments(parser):
+    parser.add_argument(
+        "--max-steps",
+        help=f"Stop an objective after this many steps (default {DEFAULT_MAX_STEPS}, 0: no limit)",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-seconds",
+        help="Stop an objective after this many seconds, checked before each step",
+        type=float,
+    )
+    parser.add_argument(
+        "--max-input-tokens",
+        help="Stop an objective once it has sent this many tokens to the model",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-output-tokens",
+        help="Stop an objective once the model has generated this many tokens",
+        type=int,
+    )
+    parser.add_argument(
+        "--max-cost",
+        help="Stop an objective once its estimated cost reaches this many USD",
+        type=float,
+    )
@@ -0,0 +1,340 @@
+import atexit
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import signal
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+
+from PIL import Image
+
+from operate.exceptions import CassetteMissException
+
+# Method path that issues the request for each provider client
+PROVIDER_METHODS = {
+    "openai": ("chat", "completions", "create"),
+    "qwen": ("chat", "completions", "create"),
+    "anthropic": ("messages", "create"),
+    "gemini": ("generate_content",),
+    "ollama": ("chat",),
+}
+
+FRAME_PLACEHOLDER = "<frame>"
+# the file is written once per session, so speed beats size
+COMPRESSLEVEL = 1
+
+# cassettes with interactions that are not written yet
+_recording = weakref.WeakSet()
+_signals_installed = False
+
+
+class Cassette:
+    """
+    Record/replay store for provider calls.
+
+    A cassette is a single gzip-compressed JSON file. Every interaction keeps the
+    request fingerprint (`prompt_hash`, `frame_hash`), the raw response and the
+    time the provider took to answer. Frames are stored once, keyed by their
+    sha256, so a frame resent with the message history costs nothing extra.
+
+    Recorded interactions are kept in memory and written by `close()`, at
+    exit or on SIGTERM/SIGHUP, so recording adds no latency to model calls.
+    """
+
+    def __init__(self, path, mode="replay", emulate_latency=False, verbose=False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.emulate_latency = emulate_latency
+        self.verbose = verbose
+        self.interactions = []
+        self.frames = {}
+        self._used = set()
+        # reentrant, since a signal handler may flush while `record` holds it
+        self._lock = threading.RLock()
+        self._dirty = False
+
+        if mode == "replay" or os.path.exists(path):
+            self.load()
+        if mode == "record":
+            _recording.add(self)
+            atexit.register(self.close)
+            _install_signal_handlers()
+
+    def load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as file:
+            data = json.load(file)
+        self.interactions = data.get("interactions", [])
+        self.frames = data.get("frames", {})
+        if self.verbose:
+            print(
+                "[Cassette][load] interactions",
+                len(self.interactions),
+                "frames",
+                len(self.frames),
+            )
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        data = {"version": 1, "interactions": self.interactions, "frames": self.frames}
+        tmp_path = self.path + ".tmp"
+        with gzip.open(
+            tmp_path, "wt", encoding="utf-8", compresslevel=COMPRESSLEVEL
+        ) as file:
+            json.dump(data, file, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def record(self, provider, request, response, duration):
+        prompt_hash, frame_hash, digests, frames = fingerprint(request)
+        with self._lock:
+            self.frames.update(frames)
+            self.interactions.append(
+                {
+                    "provider": provider,
+                    "prompt_hash": prompt_hash,
+                    "frame_hash": frame_hash,
+                    "frames": digests,
+                    "response": response,
+                    "duration": round(duration, 4),
+                }
+            )
+            self._dirty = True
+        if self.verbose:
+            print(
+                "[Cassette][record]",
+                provider,
+                prompt_hash[:12],
+                frame_hash[:12],
+                f"{duration:.2f}s",
+            )
+
+    def close(self):
+        """
+        Write the interactions recorded since the last write
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self.save()
+            self._dirty = False
+        if self.verbose:
+            print("[Cassette][close] saved", len(self.interactions), "interactions")
+
+    def replay(self, provider, request):
+        """
+        Find the recorded interaction for `request`. An exact fingerprint match
+        wins, then the first unused interaction with the same prompt, then the
+        next unused interaction for the provider in recording order.
+        """
+        prompt_hash, frame_hash, _, _ = fingerprint(request)
+        with self._lock:
+            candidates = [
+                (index, interaction)
+                for index, interaction in enumerate(self.interactions)
+                if index not in self._used and interaction["provider"] == provider
+            ]
+            match = None
+            for rule in (
+                lambda i: i["prompt_hash"] == prompt_hash
+                and i["frame_hash"] == frame_hash,
+                lambda i: i["prompt_hash"] == prompt_hash,
+                lambda i: True,
+            ):
+                match = next((c for c in candidates if rule(c[1])), None)
+                if match:
+                    break
+            if match is None:
+                raise CassetteMissException(provider)
+            index, interaction = match
+            self._used.add(index)
+
+        if self.verbose:
+            print("[Cassette][replay]", provider, "interaction", index)
+        if self.emulate_latency:
+            time.sleep(interaction.get("duration", 0))
+        return interaction
+
+    def get_frame(self, frame_hash):
+        """
+        Return the raw bytes of a stored frame
+        """
+        return base64.b64decode(self.frames[frame_hash])
+
+    def captured_frames(self):
+        """
+        Return the digest of the newest frame sent with each interaction, in
+        recording order. These are the screens the session saw.
+        """
+        return [i["frames"][-1] for i in self.interactions if i.get("frames")]
+
+
+class CassetteClient:
+    """
+    Proxy around a provider client. Attribute access is forwarded to the real
+    client except for the provider's request method, which goes through the
+    cassette. In replay mode the real client may be `None`.
+    """
+
+    def __init__(self, client, provider, cassette, path=()):
+        self._client = client
+        self._provider = provider
+        self._cassette = cassette
+        self._path = path
+
+    def __getattr__(self, name):
+        path = self._path + (name,)
+        target = PROVIDER_METHODS[self._provider]
+        if path == target:
+            return CassetteClient(
+                self._client, self._provider, self._cassette, path
+            )._call
+        if path == target[: len(path)]:
+            client = getattr(self._client, name, None)
+            return CassetteClient(client, self._provider, self._cassette, path)
+        if self._client is None:
+            raise AttributeError(f"'{name}' is not available while replaying")
+        return getattr(self._client, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        elif self._client is not None:
+            setattr(self._client, name, value)
+
+    def _call(self, *args, **kwargs):
+        request = {"args": list(args), "kwargs": kwargs}
+        if self._cassette.mode == "replay":
+            interaction = self._cassette.replay(self._provider, request)
+            return to_response(self._provider, interaction["response"])
+
+        method = getattr(self._client, self._path[-1])
+        start_time = time.time()
+        response = method(*args, **kwargs)
+        duration = time.time() - start_time
+        self._cassette.record(
+            self._provider, request, from_response(self._provider, response), duration
+        )
+        return response
+
+
+def _install_signal_handlers():
+    """
+    Write the recording cassettes before SIGTERM or SIGHUP end the process,
+    then let the previous handler run
+    """
+    global _signals_installed
+    if _signals_installed or threading.current_thread() is not threading.main_thread():
+        return
+    _signals_installed = True
+    for name in ("SIGTERM", "SIGHUP"):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        previous = signal.getsignal(signum)
+
+        def handler(signum, frame, previous=previous):
+            for cassette in list(_recording):
+                try:
+                    cassette.close()
+                except Exception as e:
+                    print("[Cassette] could not save on signal:", e)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        signal.signal(signum, handler)
+
+
+def fingerprint(request):
+    """
+    Split the frames out of a request and hash both halves.
+
+    Returns the prompt hash (request with every frame replaced by a placeholder),
+    the frame hash, the ordered frame digests and a `{digest: base64}` dict.
+    """
+    frames = {}
+    digests = []
+
+    def strip(value):
+        frame_bytes = _frame_bytes(value)
+        if frame_bytes is not None:
+            digest = hashlib.sha256(frame_bytes).hexdigest()
+            frames[digest] = base64.b64encode(frame_bytes).decode("utf-8")
+            digests.append(digest)
+            return FRAME_PLACEHOLDER
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [strip(item) for item in value]
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        return repr(type(value))
+
+    stripped = strip(request)
+    prompt_hash = hashlib.sha256(
+        json.dumps(stripped, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    frame_hash = hashlib.sha256("".join(digests).encode("utf-8")).hexdigest()
+    return prompt_hash, frame_hash, digests, frames
+
+
+def _frame_bytes(value):
+    """
+    Return the encoded image if `value` is a frame in any provider format:
+    a `data:image` URL (OpenAI/Qwen), an Anthropic base64 source, a PIL image
+    (Gemini) or a screenshot path (Ollama).
+    """
+    if isinstance(value, str):
+        if value.startswith("data:image") and "base64," in value:
+            return base64.b64decode(value.split("base64,", 1)[1])
+        if value.lower().endswith((".png", ".jpg", ".jpeg")) and os.path.isfile(value):
+            with open(value, "rb") as img_file:
+                return img_file.read()
+        return None
+    if isinstance(value, dict) and value.get("type") == "base64" and "data" in value:
+        return base64.b64decode(value["data"])
+    if isinstance(value, Image.Image):
+        buffer = io.BytesIO()
+        value.save(buffer, format="PNG")
+        return buffer.getvalue()
+    return None
+
+
+def from_response(provider, response):
+    """
+    Convert a provider response into plain JSON data
+    """
+    if provider == "gemini":
+        return {"text": response.text}
+    if hasattr(response, "model_dump"):
+        return response.model_dump(mode="json")
+    if isinstance(response, dict):
+        return json.loads(json.dumps(response, default=str))
+    return json.loads(json.dumps(vars(response), default=str))
+
+
+def to_response(provider, data):
+    """
+    Rebuild an object with the same access pattern the call sites use
+    """
+    if provider == "ollama":
+        return data
+    return _to_namespace(data)
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
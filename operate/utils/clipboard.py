@@ -0,0 +1,31 @@
+"""
+Clipboard access for pasting text. pyperclip needs `xclip`, `xsel` or
+`wl-clipboard` on Linux; without them every helper reports failure and the
+text is typed instead.
+"""
+
+
+def read_clipboard():
+    """
+    Return the clipboard text, or `None` when the clipboard cannot be read
+    """
+    try:
+        import pyperclip
+
+        return pyperclip.paste()
+    except Exception:
+        return None
+
+
+def write_clipboard(text):
+    """
+    Put `text` on the clipboard and read it back. Returns whether the
+    clipboard now holds exactly `text`.
+    """
+    try:
+        import pyperclip
+
+        pyperclip.copy(text)
+        return pyperclip.paste() == text
+    except Exception:
+        return False
@@ -0,0 +1,169 @@
+"""
+Pool of virtual X displays.
+
+Capture and input go through `pyautogui` and Xlib, which bind to the
+`DISPLAY` of their process, so concurrent sessions on one host each run in
+their own process on their own Xvfb display. `DisplayPool` starts the
+displays, hands them out to sessions and restarts a display whose session
+crashed or was killed.
+"""
+import os
+import queue
+import select
+import shutil
+import subprocess
+import threading
+
+DEFAULT_SIZE = (1280, 800)
+DEFAULT_DEPTH = 24
+START_TIMEOUT = 10
+
+
+class VirtualDisplay:
+    """
+    One Xvfb server. Xvfb picks a free display number itself (`-displayfd`).
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, depth=DEFAULT_DEPTH, verbose=False):
+        self.size = tuple(size)
+        self.depth = depth
+        self.verbose = verbose
+        self.number = None
+        self._process = None
+
+    @property
+    def name(self):
+        return f":{self.number}" if self.number is not None else None
+
+    def start(self):
+        executable = shutil.which("Xvfb")
+        if executable is None:
+            raise RuntimeError(
+                "Xvfb is required for virtual displays. Please install it, e.g. 'apt install xvfb'"
+            )
+        read_fd, write_fd = os.pipe()
+        try:
+            self._process = subprocess.Popen(
+                [
+                    executable,
+                    "-displayfd",
+                    str(write_fd),
+                    "-screen",
+                    "0",
+                    f"{self.size[0]}x{self.size[1]}x{self.depth}",
+                    "-nolisten",
+                    "tcp",
+                ],
+                pass_fds=(write_fd,),
+                stdout=subprocess.DEVNULL,
+                stderr=None if self.verbose else subprocess.DEVNULL,
+            )
+            os.close(write_fd)
+            write_fd = None
+            number = b""
+            while not number.endswith(b"\n"):
+                ready, _, _ = select.select([read_fd], [], [], START_TIMEOUT)
+                chunk = os.read(read_fd, 16) if ready else b""
+                if not chunk:
+                    self.stop()
+                    raise RuntimeError("Xvfb did not start")
+                number += chunk
+            self.number = int(number)
+        finally:
+            os.close(read_fd)
+            if write_fd is not None:
+                os.close(write_fd)
+        if self.verbose:
+            print(f"[VirtualDisplay][start] {self.name} {self.size[0]}x{self.size[1]}")
+        return self
+
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+        self.number = None
+
+    def restart(self):
+        self.stop()
+        return self.start()
+
+
+class DisplayPool:
+    """
+    Starts `size` virtual displays and hands them out one session at a time
+    """
+
+    def __init__(self, size, resolution=DEFAULT_SIZE, depth=DEFAULT_DEPTH, verbose=False):
+        self.displays = [
+            VirtualDisplay(resolution, depth, verbose=verbose) for _ in range(size)
+        ]
+        self.verbose = verbose
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+
+    def start(self):
+        try:
+            for display in self.displays:
+                display.start()
+                self._free.put(display)
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def names(self):
+        return [display.name for display in self.displays]
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a free display and return it
+        """
+        display = self._free.get(timeout=timeout)
+        if not display.running():
+            self.recycle(display)
+        return display
+
+    def release(self, display, recycle=False):
+        """
+        Give a display back. With `recycle`, or when its Xvfb died, the
+        display is restarted so the next session starts on a clean screen.
+        """
+        if recycle or not display.running():
+            self.recycle(display)
+        self._free.put(display)
+
+    def recycle(self, display):
+        with self._lock:
+            if self.verbose:
+                print(f"[DisplayPool][recycle] {display.name}")
+            display.restart()
+        return display
+
+    def close(self):
+        for display in self.displays:
+            display.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_resolution(value):
+    """
+    `1280x800` -> (1280, 800)
+    """
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid resolution {value!r}, expected WIDTHxHEIGHT")
+    return width, height
@@ -0,0 +1,136 @@
+"""
+Dedicated thread that replays operations.
+
+`operate()` hands each step's validated operations to the executor instead
+of running them on the agent loop's thread. Operations run one after another
+on the executor thread. Each is scheduled a settle delay after the previous
+one landed, and the wait ends early when the run is cancelled. Every
+operation produces an event with its start and end timestamps, and the
+caller learns the moment the last input event has been sent.
+
+Stage timings and spans of the executor thread are attributed to the
+submitting thread's recorder and span.
+"""
+import queue
+import threading
+import time
+
+from operate.utils import tracing
+from operate.utils.timing import current_recorder, settle, start_recording, stop_recording
+
+DEFAULT_DELAY = 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class Execution:
+    """
+    One batch of operations submitted to the executor
+    """
+
+    def __init__(self, operations, execute, delay, cancel_event, on_event):
+        self.operations = operations
+        self.execute = execute
+        self.delay = delay
+        self.cancel_event = cancel_event
+        self.on_event = on_event
+        self.recorder = current_recorder()
+        self.span = tracing.current_span()
+        self.events = []
+        self.stop = False
+        self.cancelled = False
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self._done = threading.Event()
+
+    def emit(self, event):
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the last operation has been executed and return whether
+        the run should stop (`done` or an unknown operation)
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("operations are still running")
+        if self.error is not None:
+            raise self.error
+        return self.stop
+
+
+class ActionExecutor:
+    def __init__(self, name="operate-executor"):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def thread_id(self):
+        return self._thread.ident
+
+    def submit(
+        self, operations, execute, delay=DEFAULT_DELAY, cancel_event=None, on_event=None
+    ):
+        """
+        Queue `operations`. `execute(operation)` runs each of them and
+        returns `True` when the run should stop after it.
+        """
+        execution = Execution(operations, execute, delay, cancel_event, on_event)
+        self._queue.put(execution)
+        return execution
+
+    def _work(self):
+        while True:
+            execution = self._queue.get()
+            start_recording(execution.recorder)
+            try:
+                with tracing.use_span(execution.span):
+                    self._run(execution)
+            except Exception as e:
+                execution.error = e
+            finally:
+                stop_recording()
+                execution.finished = time.time()
+                execution._done.set()
+
+    def _run(self, execution):
+        cancel_event = execution.cancel_event
+        for index, operation in enumerate(execution.operations):
+            if cancel_event is not None and cancel_event.is_set():
+                execution.cancelled = True
+                return
+            if settle(execution.delay, cancel_event):
+                execution.cancelled = True
+                return
+            started = time.time()
+            stop = execution.execute(operation)
+            execution.emit(
+                {
+                    "type": "operation",
+                    "index": index,
+                    "operation": operation.get("operation"),
+                    "started": round(started, 4),
+                    "finished": round(time.time(), 4),
+                }
+            )
+            if stop:
+                execution.stop = True
+                return
+
+
+def get_executor():
+    """
+    Return the process's executor, starting its thread on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ActionExecutor()
+        return _executor
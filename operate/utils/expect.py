@@ -0,0 +1,316 @@
+"""
+Post-conditions of operations.
+
+A model may attach an `expect` dict to any operation to state what the
+screen should show once the operation has landed:
+
+    {"text": "Inbox"}            the text is visible, read with OCR
+    {"title": "Gmail"}           the focused window's title contains it
+    {"changed": true}            the screen changed
+    {"changed": [x, y, w, h]}    the region changed, in percentages of the frame
+
+A string is short for `{"text": ...}`, and every key of a dict has to hold.
+Regions are percentages of the captured frame, the image the model saw, so
+with a capture scope (see `operate.utils.scope`) they are relative to it.
+After such an operation the executor waits for the screen to settle and
+checks the expectation locally. The OCR runs once per frame (see
+`operate.utils.frames.Frame.ocr`), and changes are measured on the frame
+thumbnails. A failed check skips the rest of the plan, and the next prompt
+tells the model where it diverged. A plan of several operations therefore
+costs a single model call as long as it goes as expected.
+
+The `wait_for` operation takes the same keys and a `timeout`. It polls the
+screen until they hold, so a loading page costs no model calls.
+
+`OPERATE_EXPECT=0` turns the checks off. Captures that replay recorded
+frames skip them, since every capture advances the replay.
+"""
+import os
+import time
+
+from operate.config import Config
+from operate.models.prompts import OPERATE_EXPECT_HINT
+from operate.utils.frames import (
+    CHANGE_TOLERANCE,
+    capture_frame,
+    changed_share,
+    settled_frame,
+)
+from operate.utils.screenshot import capture_can_sample
+from operate.utils.stall import action_signature, describe
+from operate.utils.timing import count, stage
+
+# Load configuration
+config = Config()
+
+EXPECT_KEYS = ("text", "title", "changed")
+
+# seconds `wait_for` waits when the model gives no timeout, and at most
+WAIT_TIMEOUT = 10
+MAX_WAIT_TIMEOUT = 60
+# seconds between the captures `wait_for` polls
+WAIT_INTERVAL = 0.25
+
+
+def expectations_enabled():
+    return os.getenv("OPERATE_EXPECT", "1").lower() not in ("0", "false", "no", "off")
+
+
+def parse_expectation(expect):
+    """
+    The `expect` value of an operation as a dict of the keys it checks, or
+    `None` when there is nothing to check
+    """
+    if isinstance(expect, str):
+        expect = {"text": expect}
+    if not isinstance(expect, dict):
+        return None
+    expect = {
+        key: value
+        for key, value in expect.items()
+        if key in EXPECT_KEYS and value not in (None, "", False)
+    }
+    return expect or None
+
+
+def _normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+def changed_region(before, after, region=None):
+    """
+    Share of the thumbnail pixels that differ between two frames, within
+    `region` ([x, y, w, h] in percentages of the frame) when given
+    """
+    previous, current = before.thumbnail(), after.thumbnail()
+    if region is not None and previous.size == current.size:
+        x, y, w, h = (float(value) for value in region)
+        width, height = current.size
+        left = min(max(int(x * width), 0), width - 1)
+        top = min(max(int(y * height), 0), height - 1)
+        right = min(max(int((x + w) * width), left + 1), width)
+        bottom = min(max(int((y + h) * height), top + 1), height)
+        box = (left, top, right, bottom)
+        previous, current = previous.crop(box), current.crop(box)
+    return changed_share(previous, current)
+
+
+def check_expectation(expect, before, after, window_title=None):
+    """
+    Return the descriptions of the parts of `expect` that do not hold on
+    the frame `after`. `before` is the frame before the operation, and
+    `window_title()` reads the focused window's title.
+    """
+    failed = []
+    if "text" in expect:
+        visible = _normalize(" ".join(element[1] for element in after.ocr()))
+        if _normalize(expect["text"]) not in visible:
+            failed.append(f"the text `{expect['text']}` is not visible")
+    if "title" in expect and window_title is not None:
+        title = window_title()
+        # a title that cannot be read is not held against the plan
+        if title is not None and _normalize(expect["title"]) not in _normalize(title):
+            failed.append(f"the window title is `{title}`, not `{expect['title']}`")
+    if "changed" in expect and before is not None:
+        region = expect["changed"]
+        if not isinstance(region, (list, tuple)):
+            region = None
+        if changed_region(before, after, region) <= CHANGE_TOLERANCE:
+            failed.append(
+                "the screen did not change"
+                if region is None
+                else f"the region {list(region)} did not change"
+            )
+    return failed
+
+
+def wait_condition(operation):
+    """
+    The condition of a `wait_for` operation, as an expectation
+    """
+    return parse_expectation({key: operation.get(key) for key in EXPECT_KEYS})
+
+
+def wait_timeout(operation):
+    try:
+        timeout = float(operation.get("timeout", WAIT_TIMEOUT))
+    except (TypeError, ValueError):
+        timeout = WAIT_TIMEOUT
+    return min(max(timeout, 0), MAX_WAIT_TIMEOUT)
+
+
+def wait_for(operation, capture=None, window_title=None, cancelled=None, interval=WAIT_INTERVAL):
+    """
+    Poll the screen until the condition of the `wait_for` `operation` holds
+    or its timeout passes, without calling the model. `capture()` returns a
+    `Frame`, the capture scope by default. Captures are compared on their
+    thumbnails, and only the ones that changed since the last check are
+    read with OCR. Without a condition, it waits for the timeout.
+
+    Returns a dict with whether the condition `held` (`None` when the
+    capture cannot be polled), the checks that `failed` last, the `seconds`
+    waited and the number of `polls`.
+    """
+    condition = wait_condition(operation)
+    timeout = wait_timeout(operation)
+    started = time.monotonic()
+    result = {"held": None, "failed": [], "seconds": 0, "polls": 0}
+    if capture is None:
+        if not capture_can_sample():
+            return result
+        capture = capture_frame
+
+    def elapsed():
+        return time.monotonic() - started
+
+    def sleep(seconds):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            if cancelled is not None and cancelled():
+                return True
+            time.sleep(min(0.05, max(end - time.monotonic(), 0)))
+        return cancelled is not None and cancelled()
+
+    if condition is None:
+        sleep(timeout)
+        result.update(held=True, seconds=round(elapsed(), 3))
+        return result
+
+    # the window title can change without the pixels changing, so it is
+    # checked on every poll and the rest only when the capture changed
+    title = {key: value for key, value in condition.items() if key == "title"}
+    pixels = {key: value for key, value in condition.items() if key != "title"}
+    first = frame = capture()
+    checked = None
+    pixels_failed = title_failed = []
+    while True:
+        result["polls"] += 1
+        thumbnail = frame.thumbnail()
+        try:
+            if checked is None or changed_share(checked, thumbnail) > CHANGE_TOLERANCE:
+                checked = thumbnail
+                pixels_failed = check_expectation(pixels, first, frame)
+            if title:
+                title_failed = check_expectation(title, first, frame, window_title)
+        except Exception as e:
+            result["failed"] = [f"could not check {condition}: {e}"]
+            break
+        result["failed"] = pixels_failed + title_failed
+        if not result["failed"]:
+            result["held"] = True
+            break
+        remaining = timeout - elapsed()
+        if remaining <= 0 or sleep(min(interval, remaining)):
+            break
+        frame = capture()
+    if result["held"] is None:
+        result["held"] = False
+    result["seconds"] = round(elapsed(), 3)
+    return result
+
+
+def expectation_hint(divergence):
+    return OPERATE_EXPECT_HINT.format(
+        index=divergence["index"] + 1,
+        operation=divergence["operation"],
+        failed="; ".join(divergence["failed"]),
+    )
+
+
+class ExpectationChecker:
+    """
+    Checks the expectations of one plan while the executor runs it
+    """
+
+    def __init__(self, frame=None, window_title=None, cancel_event=None, on_event=None):
+        # latest frame of the screen, `None` once an operation made it stale
+        self.frame = frame
+        self.window_title = window_title
+        self.cancel_event = cancel_event
+        self.on_event = on_event or (lambda event: None)
+        self.index = -1
+        # where the plan diverged, see `expectation_hint`
+        self.divergence = None
+
+    def before(self, operation):
+        """
+        Called right before `operation` runs
+        """
+        self.index += 1
+        expect = parse_expectation(operation.get("expect"))
+        if (
+            expect is not None
+            and "changed" in expect
+            and self.frame is None
+            and capture_can_sample()
+        ):
+            with stage("capture", expect=True):
+                self.frame = capture_frame()
+
+    def after(self, operation):
+        """
+        Called once `operation` has landed. Returns `True` when its
+        expectation failed and the rest of the plan is skipped.
+        """
+        before, self.frame = self.frame, None
+        if str(operation.get("operation", "")).lower() == "wait_for":
+            return self._waited(operation)
+        expect = parse_expectation(operation.get("expect"))
+        if expect is None or not capture_can_sample():
+            return False
+        started = time.monotonic()
+        with stage("settle", expect=True):
+            after = settled_frame(self.cancel_event)
+        self.frame = after
+        with stage("verify", keys=",".join(expect)):
+            try:
+                failed = check_expectation(expect, before, after, self.window_title)
+            except Exception as e:
+                print(f"[ExpectationChecker] could not check {expect}: {e}")
+                failed = []
+        count(expectations=1, divergences=1 if failed else 0)
+        if config.verbose:
+            print("[ExpectationChecker]", self.index, expect, failed or "ok")
+        self.on_event(
+            {
+                "type": "expectation",
+                "index": self.index,
+                "operation": operation.get("operation"),
+                "expect": expect,
+                "ok": not failed,
+                "failed": failed,
+                "seconds": round(time.monotonic() - started, 3),
+            }
+        )
+        if not failed:
+            return False
+        self.divergence = {
+            "index": self.index,
+            "operation": describe(action_signature([operation])),
+            "failed": failed,
+        }
+        return True
+
+    def _waited(self, operation):
+        waited = operation.get("waited")
+        if not waited or waited["held"] is None:
+            return False
+        self.on_event(
+            {
+                "type": "wait",
+                "index": self.index,
+                "held": waited["held"],
+                "failed": waited["failed"],
+                "seconds": waited["seconds"],
+                "polls": waited["polls"],
+            }
+        )
+        if waited["held"]:
+            return False
+        count(divergences=1)
+        self.divergence = {
+            "index": self.index,
+            "operation": describe(action_signature([operation])),
+            "failed": [f"it timed out after {waited['seconds']}s"] + waited["failed"],
+        }
+        return True
@@ -0,0 +1,444 @@
+"""
+Frames for the next request, captured while the last operations settle.
+
+Without the pipeline, every step waits a fixed second after its operations,
+then captures the screen, then encodes it. With the pipeline, the agent loop
+starts a `FramePrefetcher` as soon as the last operation has landed. It
+samples the screen every `SAMPLE_INTERVAL` seconds until `STABLE_SAMPLES`
+samples in a row look the same. It then encodes the latest frame in every
+format the model's request needs. The provider calls `next_frame()`, which
+returns that frame, so the request goes out as soon as the screen settles.
+The fixed second stays the upper bound.
+
+The first step of a run, captures that replay recorded frames, and
+`OPERATE_PIPELINE=0` use the fixed wait.
+
+Every frame a request gets also carries the window list of its screen, read
+once the screen has settled: the focused window's title, class and geometry
+and the other top-level windows. The prompt gets it as text, and the frame's
+fingerprint includes the focused window. `OPERATE_WINDOW_CONTEXT=0` turns
+this off.
+
+Every capture goes through `capture_frame`, which crops it to the capture
+scope (see `operate.utils.scope`).
+"""
+import base64
+import hashlib
+import io
+import os
+import threading
+import time
+
+from PIL import Image, ImageChops
+
+from operate.config import Config
+from operate.utils import tracing
+from operate.utils.action_timing import get_timing_profile
+from operate.utils.profiler import register_thread
+from operate.utils.scope import capture_scope, scope_box, to_screen
+from operate.utils.screenshot import (
+    capture_active_window,
+    capture_can_sample,
+    capture_windows,
+    grab_screen,
+    jpeg_bytes,
+    screen_size,
+)
+from operate.utils.timing import (
+    current_recorder,
+    settle,
+    stage,
+    start_recording,
+    stop_recording,
+)
+
+# Load configuration
+config = Config()
+
+# seconds between the last operation and the capture without the pipeline,
+# and the longest the pipeline waits for the screen to settle
+SETTLE = 1
+# seconds before a still screen counts as settled, so applications get to react
+MIN_SETTLE = 0.25
+SAMPLE_INTERVAL = 0.1
+STABLE_SAMPLES = 3
+# share of thumbnail pixels that may change between stable samples: enough
+# for a blinking caret, not for a spinner
+CHANGE_TOLERANCE = 0.0002
+THUMBNAIL_SCALE = 8
+# size and grey levels of the image hashed by `Frame.fingerprint`
+FINGERPRINT_SIZE = (32, 18)
+FINGERPRINT_LEVELS = 16
+# width of the frames sent to Claude, which limits images to 5MB
+CLAUDE_WIDTH = 2560
+
+# encodings the request of each model sends
+MODEL_ENCODINGS = {
+    "gpt-4": ("png",),
+    "gpt-4-with-ocr": ("png",),
+    "gpt-4-with-som": ("png",),
+    "o1-with-ocr": ("png",),
+    "qwen-vl": ("png", "jpeg"),
+    "claude-3": ("png", "claude"),
+    "gemini-pro-vision": ("png",),
+    "llava": ("png",),
+}
+
+_local = threading.local()
+
+
+def pipeline_enabled():
+    return os.getenv("OPERATE_PIPELINE", "1").lower() not in ("0", "false", "no", "off")
+
+
+def window_context_enabled():
+    return os.getenv("OPERATE_WINDOW_CONTEXT", "1").lower() not in (
+        "0",
+        "false",
+        "no",
+        "off",
+    )
+
+
+class Frame:
+    """
+    One capture of the screen and its encodings, each computed once
+    """
+
+    def __init__(self, image=None, data=None):
+        self.captured = time.time()
+        self._image = image
+        self._encoded = {}
+        if data is not None:
+            self._encoded["png"] = data
+        # windows of the screen, see `read_windows`
+        self.windows = None
+        # box of the screen the frame was cropped to and the screen's size
+        self.box = None
+        self.screen = None
+        self._lock = threading.Lock()
+
+    @property
+    def image(self):
+        if self._image is None:
+            image = Image.open(io.BytesIO(self._encoded["png"]))
+            image.load()
+            self._image = image
+        return self._image
+
+    def encoded(self, kind="png"):
+        """
+        Return the bytes of the frame encoded as `png`, `jpeg` or `claude`
+        """
+        with self._lock:
+            if kind not in self._encoded:
+                self._encoded[kind] = ENCODERS[kind](self.image)
+            return self._encoded[kind]
+
+    def base64(self, kind="png"):
+        key = ("base64", kind)
+        data = self.encoded(kind)
+        with self._lock:
+            if key not in self._encoded:
+                self._encoded[key] = base64.b64encode(data).decode("utf-8")
+            return self._encoded[key]
+
+    def save(self, file_path, kind="png"):
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, "wb") as file:
+            file.write(self.encoded(kind))
+
+    def thumbnail(self):
+        image = self.image
+        size = (
+            max(1, image.width // THUMBNAIL_SCALE),
+            max(1, image.height // THUMBNAIL_SCALE),
+        )
+        return image.convert("L").resize(size, Image.Resampling.BOX)
+
+    def signature(self):
+        """
+        Coarse, grey version of the frame as one hex digit per cell of
+        `FINGERPRINT_SIZE`, compared with `signature_distance`
+        """
+        if "signature" not in self._encoded:
+            coarse = self.thumbnail().resize(FINGERPRINT_SIZE, Image.Resampling.BOX)
+            step = 256 // FINGERPRINT_LEVELS
+            self._encoded["signature"] = "".join(
+                f"{value:x}" for value in coarse.point(lambda value: value // step).tobytes()
+            )
+        return self._encoded["signature"]
+
+    def fingerprint(self):
+        """
+        Hash of the signature and the focused window: equal for screens that
+        only differ by a caret or a few pixels
+        """
+        if "fingerprint" not in self._encoded:
+            window = self.active_window() or {}
+            key = "\n".join(
+                (self.signature(), str(window.get("title")), str(window.get("app")))
+            )
+            self._encoded["fingerprint"] = hashlib.sha1(
+                key.encode("utf-8")
+            ).hexdigest()[:16]
+        return self._encoded["fingerprint"]
+
+    def read_windows(self):
+        """
+        Read the windows of the screen the frame shows, when enabled
+        """
+        if window_context_enabled():
+            with stage("windows"):
+                self.windows = capture_windows()
+        return self.windows
+
+    def active_window(self):
+        return next((w for w in self.windows or () if w.get("active")), None)
+
+    def to_screen(self, x, y):
+        """
+        Map percentages of the frame to percentages of the screen
+        """
+        if self.box is None:
+            return x, y
+        return to_screen(self.box, self.screen, x, y)
+
+    def ocr(self):
+        """
+        EasyOCR results of the frame, read once and shared by the grounding
+        of every click and the checks of `operate.utils.expect`
+        """
+        with self._lock:
+            if "ocr" not in self._encoded:
+                import numpy as np
+
+                from operate.utils.ocr import get_ocr_reader
+
+                self._encoded["ocr"] = get_ocr_reader().readtext(
+                    np.asarray(self.image.convert("RGB"))
+                )
+            return self._encoded["ocr"]
+
+
+def _encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _encode_claude(image):
+    if image.mode == "RGBA":
+        image = image.convert("RGB")
+    # frames cropped to a window are not scaled up
+    width = min(CLAUDE_WIDTH, image.width)
+    height = int(width / (image.width / image.height))
+    return jpeg_bytes(image.resize((width, height), Image.Resampling.LANCZOS))
+
+
+ENCODERS = {"png": _encode_png, "jpeg": jpeg_bytes, "claude": _encode_claude}
+
+
+def capture_frame():
+    """
+    Capture the screen, cropped to the capture scope
+    """
+    scope = capture_scope() if capture_can_sample() else None
+    if scope is None:
+        return Frame(*grab_screen())
+    size = screen_size()
+    if size is None:
+        # the capture only writes files, so it is cropped once loaded
+        frame = Frame(*grab_screen())
+        size = frame.image.size
+        box = scope_box(scope, size, capture_active_window)
+        if box is None:
+            return frame
+        frame = Frame(frame.image.crop(box))
+    else:
+        box = scope_box(scope, size, capture_active_window)
+        frame = Frame(*grab_screen(box))
+        if box is None:
+            return frame
+    frame.box, frame.screen = box, size
+    return frame
+
+
+def changed_share(previous, current):
+    """
+    Share of the pixels that differ between two thumbnails
+    """
+    if previous.size != current.size:
+        return 1.0
+    histogram = ImageChops.difference(previous, current).histogram()
+    # ignore compression and dithering noise
+    return sum(histogram[8:]) / (current.width * current.height)
+
+
+def signature_distance(first, second):
+    """
+    Share of the cells of two signatures whose grey level differs by more
+    than one step
+    """
+    if not first or not second or len(first) != len(second):
+        return 1.0
+    differing = sum(abs(int(a, 16) - int(b, 16)) > 1 for a, b in zip(first, second))
+    return differing / len(first)
+
+
+class FramePrefetcher:
+    """
+    Samples the screen on a thread until it settles, then pre-encodes the
+    latest frame
+    """
+
+    def __init__(self, encodings=("png",), cancel_event=None, max_wait=SETTLE):
+        self.encodings = encodings
+        self.cancel_event = cancel_event
+        self.max_wait = max_wait
+        self.samples = 0
+        self.settled = False
+        self.frame = None
+        self.error = None
+        self.recorder = current_recorder()
+        self.span = tracing.current_span()
+        self._done = threading.Event()
+        self._thread = threading.Thread(
+            target=self._work, name="operate-frames", daemon=True
+        )
+        self._thread.start()
+
+    def result(self):
+        """
+        Wait for the settled frame
+        """
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.frame
+
+    def _work(self):
+        # `--profile` samples the capture and encode of this thread too
+        register_thread()
+        start_recording(self.recorder)
+        try:
+            with tracing.use_span(self.span):
+                self.frame = self._sample()
+                self.frame.read_windows()
+                with stage("encode", prefetched=True, kinds=",".join(self.encodings)):
+                    for kind in self.encodings:
+                        self.frame.base64(kind)
+        except Exception as e:
+            self.error = e
+        finally:
+            stop_recording()
+            self._done.set()
+
+    def _sample(self):
+        scale = get_timing_profile().settle_scale
+        started = time.monotonic()
+        earliest = started + MIN_SETTLE * scale
+        deadline = started + self.max_wait * scale
+        previous = None
+        still = 0
+        while True:
+            with stage("capture", sample=self.samples):
+                frame = capture_frame()
+                thumbnail = frame.thumbnail()
+            self.samples += 1
+            if previous is not None and changed_share(previous, thumbnail) <= CHANGE_TOLERANCE:
+                still += 1
+            else:
+                still = 0
+            previous = thumbnail
+            now = time.monotonic()
+            if still >= STABLE_SAMPLES - 1 and now >= earliest:
+                self.settled = True
+                break
+            if now >= deadline:
+                break
+            wait = min(SAMPLE_INTERVAL, deadline - now)
+            if self.cancel_event is not None:
+                if self.cancel_event.wait(wait):
+                    break
+            else:
+                time.sleep(wait)
+        if config.verbose:
+            print(
+                f"[FramePrefetcher] {self.samples} samples, settled={self.settled} "
+                f"after {time.monotonic() - started:.2f}s"
+            )
+        return frame
+
+
+def settled_frame(cancel_event=None):
+    """
+    Capture the screen once it has settled, without keeping a file
+    """
+    if not capture_can_sample():
+        settle(SETTLE, cancel_event)
+        with stage("capture"):
+            frame = capture_frame()
+        frame.read_windows()
+        return frame
+    return FramePrefetcher((), cancel_event=cancel_event).result()
+
+
+def prefetch_frame(model, cancel_event=None):
+    """
+    Start capturing the frame for the next request of `model` on this
+    thread. Does nothing when the pipeline is off or the capture cannot be
+    sampled.
+    """
+    discard_prefetched()
+    if not pipeline_enabled() or not capture_can_sample():
+        return None
+    _local.prefetcher = FramePrefetcher(
+        MODEL_ENCODINGS.get(model, ("png",)), cancel_event=cancel_event
+    )
+    return _local.prefetcher
+
+
+def discard_prefetched():
+    _local.prefetcher = None
+
+
+def next_frame(file_path, kind="png"):
+    """
+    Return the frame for the next request, saved to `file_path` as `kind`:
+    the one prefetched on this thread, or a capture after the fixed wait
+    """
+    prefetcher = getattr(_local, "prefetcher", None)
+    _local.prefetcher = None
+    if prefetcher is None:
+        settle(SETTLE)
+        with stage("capture"):
+            frame = capture_frame()
+            frame.save(file_path, kind)
+        frame.read_windows()
+    else:
+        with stage("settle", prefetched=True):
+            frame = prefetcher.result()
+        with stage("capture", prefetched=True, samples=prefetcher.samples):
+            frame.save(file_path, kind)
+    _local.frame = frame
+    return frame
+
+
+def current_frame():
+    """
+    Return the frame `next_frame` last returned on this thread, if it was
+    not taken yet
+    """
+    return getattr(_local, "frame", None)
+
+
+def take_last_frame():
+    """
+    Return the frame `next_frame` last returned on this thread, once
+    """
+    frame = getattr(_local, "frame", None)
+    _local.frame = None
+    return frame
@@ -0,0 +1,367 @@
+"""
+Shared OCR and YOLO inference.
+
+`operate inference` is a process that owns the EasyOCR reader and the YOLO
+detector for every session on the host. Sessions write the frame into a
+shared memory block and send a one-line JSON request over a Unix socket.
+The server collects the requests that arrive within a short window into
+one batch per model and answers each on its connection.
+
+When `OPERATE_INFERENCE` is set to the socket path, `get_ocr_reader()` and
+`get_yolo_model()` return the remote stand-ins defined here instead of
+loading the models, so the OCR and Set-of-Mark code paths are unchanged.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+DEFAULT_SOCKET = "/tmp/operate-inference.sock"
+DEFAULT_MAX_BATCH = 8
+DEFAULT_WINDOW = 0.01
+
+
+def inference_address():
+    """
+    Socket of the shared inference server, or `None` to load models locally
+    """
+    return os.getenv("OPERATE_INFERENCE") or None
+
+
+# Client side
+
+
+class InferenceClient:
+    def __init__(self, address, timeout=120):
+        self.address = address
+        self.timeout = timeout
+
+    def request(self, kind, image):
+        """
+        Send a PIL image and return the decoded result
+        """
+        import numpy as np
+
+        frame = np.asarray(image.convert("RGB"))
+        block = shared_memory.SharedMemory(create=True, size=max(1, frame.nbytes))
+        try:
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=block.buf)[:] = frame
+            message = {"kind": kind, "shm": block.name, "shape": list(frame.shape)}
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.settimeout(self.timeout)
+                connection.connect(self.address)
+                connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+                with connection.makefile("rb") as stream:
+                    line = stream.readline()
+        finally:
+            block.close()
+            block.unlink()
+        if not line:
+            raise RuntimeError(f"Inference server at {self.address} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise RuntimeError(f"Inference server error: {response['error']}")
+        return response["result"]
+
+    def ping(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(5)
+            connection.connect(self.address)
+            connection.sendall(b'{"kind": "ping"}\n')
+            with connection.makefile("rb") as stream:
+                return json.loads(stream.readline())
+
+
+class RemoteOCRReader:
+    """
+    Stand-in for `easyocr.Reader` answering `readtext` from the server
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def readtext(self, image):
+        from PIL import Image
+
+        if isinstance(image, str):
+            image = Image.open(image)
+        elif not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        return [
+            (box, text, confidence)
+            for box, text, confidence in self.client.request("ocr", image)
+        ]
+
+
+class RemoteYOLO:
+    """
+    Stand-in for `ultralytics.YOLO`: calling it returns results whose
+    `boxes` carry `xyxy`, the only part `add_labels` reads
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, image):
+        boxes = self.client.request("yolo", image)
+        return [_Result([_Detection(box) for box in boxes])]
+
+
+class _Result:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class _Detection:
+    def __init__(self, box):
+        self.xyxy = [_Coordinates(box)]
+
+
+class _Coordinates(list):
+    def tolist(self):
+        return list(self)
+
+
+# Server side
+
+
+class _Request:
+    def __init__(self, kind, image):
+        self.kind = kind
+        self.image = image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceBatcher:
+    """
+    Runs the models on one thread, in batches of the requests that arrive
+    within `window` seconds of each other
+    """
+
+    def __init__(self, max_batch=DEFAULT_MAX_BATCH, window=DEFAULT_WINDOW, verbose=False):
+        self.max_batch = max_batch
+        self.window = window
+        self.verbose = verbose
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, name="operate-inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, image):
+        request = _Request(kind, image)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            for kind, run in (("ocr", self._run_ocr), ("yolo", self._run_yolo)):
+                requests = [request for request in batch if request.kind == kind]
+                if not requests:
+                    continue
+                self.batches += 1
+                self.requests += len(requests)
+                if self.verbose:
+                    print(f"[InferenceBatcher] {kind} batch of {len(requests)}")
+                try:
+                    run(requests)
+                except Exception as e:
+                    for request in requests:
+                        request.error = e
+                for request in requests:
+                    request.done.set()
+
+    def _run_ocr(self, requests):
+        from operate.utils.ocr import load_ocr_reader
+
+        reader = load_ocr_reader()
+        # detection batches need frames of one size
+        shapes = {}
+        for request in requests:
+            shapes.setdefault(request.image.shape, []).append(request)
+        for group in shapes.values():
+            if len(group) == 1:
+                results = [reader.readtext(group[0].image)]
+            else:
+                results = reader.readtext_batched(
+                    [request.image for request in group], batch_size=len(group)
+                )
+            for request, result in zip(group, results):
+                request.result = [
+                    ([[int(x), int(y)] for x, y in box], text, float(confidence))
+                    for box, text, confidence in result
+                ]
+
+    def _run_yolo(self, requests):
+        from operate.utils.label import load_yolo_model
+
+        from PIL import Image
+
+        model = load_yolo_model()
+        # ultralytics reads numpy frames as BGR, PIL images as RGB
+        images = [Image.fromarray(request.image) for request in requests]
+        results = model(images, verbose=self.verbose)
+        for request, result in zip(requests, results):
+            request.result = [det.xyxy[0].tolist() for det in result.boxes]
+
+
+class InferenceHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                if message.get("kind") == "ping":
+                    response = {
+                        "result": "pong",
+                        "batches": self.server.batcher.batches,
+                        "requests": self.server.batcher.requests,
+                    }
+                else:
+                    image = _read_frame(message["shm"], message["shape"])
+                    response = {"result": self.server.batcher.submit(message["kind"], image)}
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, InferenceHandler)
+        self.batcher = batcher
+
+
+def _read_frame(name, shape):
+    """
+    Copy a frame out of the client's shared memory block. The client owns
+    and unlinks the block, so it is not tracked here.
+    """
+    import numpy as np
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(block._name, "shared_memory")
+        return np.ndarray(shape, dtype=np.uint8, buffer=block.buf).copy()
+    finally:
+        block.close()
+
+
+def wait_for_server(address, timeout=60):
+    """
+    Wait until a server answers on `address`
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return InferenceClient(address).ping()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def start_server(address, preload=("ocr",), log_path=None, verbose=False):
+    """
+    Start `operate inference` in a child process and wait until it answers
+    """
+    import subprocess
+    import sys
+
+    command = [
+        sys.executable,
+        "-m",
+        "operate.utils.inference",
+        "--socket",
+        address,
+        "--preload",
+        ",".join(preload),
+    ]
+    if verbose:
+        command.append("--verbose")
+    log = open(log_path, "a", encoding="utf-8") if log_path else subprocess.DEVNULL
+    process = subprocess.Popen(command, stdout=log, stderr=log)
+    try:
+        # loading the models takes a while
+        wait_for_server(address, timeout=300)
+    except OSError:
+        process.kill()
+        raise RuntimeError(f"Inference server did not start, see {log_path}")
+    return process
+
+
+def main_entry(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="operate inference",
+        description="Serve OCR and YOLO inference to every operate session on this host.",
+    )
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument(
+        "--preload",
+        help="Comma-separated models to load before serving: ocr, yolo",
+        default="ocr",
+    )
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument(
+        "--window",
+        help="Seconds to wait for more requests before running a batch",
+        type=float,
+        default=DEFAULT_WINDOW,
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    for name in filter(None, args.preload.split(",")):
+        if name == "ocr":
+            from operate.utils.ocr import load_ocr_reader
+
+            load_ocr_reader()
+        elif name == "yolo":
+            from operate.utils.label import load_yolo_model
+
+            load_yolo_model()
+        else:
+            parser.error(f"unknown model {name!r}")
+
+    server = InferenceServer(
+        args.socket, InferenceBatcher(args.max_batch, args.window, verbose=args.verbose)
+    )
+    print(f"[operate inference] listening on unix:{args.socket}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main_entry())
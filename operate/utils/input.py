@@ -0,0 +1,314 @@
+"""
+Input backends for `OperatingSystem`.
+
+`PyAutoGUIBackend` works everywhere, but pyautogui sleeps `PAUSE` (0.1 s)
+after every call. On Linux, `XTestBackend` sends synthetic events through the
+X server's XTEST extension instead. It has no pause and sends each batch of
+events with one round trip. Characters that are not on the keyboard are
+typed by mapping their keysym onto a spare keycode for the duration of the
+batch.
+
+`OPERATE_INPUT` selects the backend: `auto` (default, XTest when the display
+supports it), `xtest` or `pyautogui`.
+"""
+import os
+import platform
+import threading
+import time
+
+from operate.config import Config
+
+# Load configuration
+config = Config()
+
+# pyautogui key names -> X keysym names
+X_KEY_NAMES = {
+    "alt": "Alt_L",
+    "altleft": "Alt_L",
+    "altright": "Alt_R",
+    "backspace": "BackSpace",
+    "capslock": "Caps_Lock",
+    "cmd": "Super_L",
+    "command": "Super_L",
+    "ctrl": "Control_L",
+    "control": "Control_L",
+    "ctrlleft": "Control_L",
+    "ctrlright": "Control_R",
+    "del": "Delete",
+    "delete": "Delete",
+    "down": "Down",
+    "end": "End",
+    "enter": "Return",
+    "esc": "Escape",
+    "escape": "Escape",
+    "home": "Home",
+    "insert": "Insert",
+    "left": "Left",
+    "menu": "Menu",
+    "option": "Alt_L",
+    "pagedown": "Next",
+    "pageup": "Prior",
+    "pgdn": "Next",
+    "pgup": "Prior",
+    "printscreen": "Print",
+    "return": "Return",
+    "right": "Right",
+    "shift": "Shift_L",
+    "shiftleft": "Shift_L",
+    "shiftright": "Shift_R",
+    "space": "space",
+    "super": "Super_L",
+    "tab": "Tab",
+    "up": "Up",
+    "win": "Super_L",
+    "winleft": "Super_L",
+    "winright": "Super_R",
+}
+MOUSE_BUTTONS = {"left": 1, "middle": 2, "right": 3}
+# time applications get to read a temporary key mapping before it is reverted
+REMAP_SETTLE = 0.05
+MOVE_STEP = 1 / 60
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class PyAutoGUIBackend:
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+
+        from operate.utils.action_timing import get_timing_profile
+
+        pyautogui.PAUSE = get_timing_profile().pyautogui_pause
+        self._pyautogui = pyautogui
+
+    def screen_size(self):
+        return tuple(self._pyautogui.size())
+
+    def move(self, x, y, duration=0.0):
+        self._pyautogui.moveTo(x, y, duration=duration)
+
+    def click(self, x=None, y=None, button="left"):
+        self._pyautogui.click(x, y, button=button)
+
+    def key_down(self, key):
+        self._pyautogui.keyDown(key)
+
+    def key_up(self, key):
+        self._pyautogui.keyUp(key)
+
+    def press_key(self, key):
+        self._pyautogui.press(key)
+
+    def type_text(self, text):
+        # one call, so PAUSE is paid once instead of once per character
+        self._pyautogui.write(text)
+
+
+class XTestBackend:
+    name = "xtest"
+
+    def __init__(self, display_name=None):
+        from Xlib import XK, display
+        from Xlib.ext import xtest
+
+        self._XK = XK
+        self._xtest = xtest
+        self._display = display.Display(display_name)
+        if not self._display.has_extension("XTEST"):
+            self._display.close()
+            raise RuntimeError("the X server has no XTEST extension")
+        self._lock = threading.Lock()
+        # keycodes without symbols, used to type characters missing from the layout
+        first = self._display.display.info.min_keycode
+        count = self._display.display.info.max_keycode - first + 1
+        mapping = self._display.get_keyboard_mapping(first, count)
+        self._spare = [first + i for i, symbols in enumerate(mapping) if not any(symbols)]
+        self._held = {}
+        self._shift = self._display.keysym_to_keycode(XK.string_to_keysym("Shift_L"))
+
+    def screen_size(self):
+        screen = self._display.screen()
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def move(self, x, y, duration=0.0):
+        from Xlib import X
+
+        with self._lock:
+            steps = max(1, int(duration / MOVE_STEP)) if duration > 0 else 1
+            if steps > 1:
+                pointer = self._display.screen().root.query_pointer()
+                start_x, start_y = pointer.root_x, pointer.root_y
+            for step in range(1, steps + 1):
+                if steps > 1:
+                    fraction = step / steps
+                    target = (
+                        round(start_x + (x - start_x) * fraction),
+                        round(start_y + (y - start_y) * fraction),
+                    )
+                else:
+                    target = (round(x), round(y))
+                self._xtest.fake_input(
+                    self._display, X.MotionNotify, x=target[0], y=target[1]
+                )
+                self._display.sync()
+                if steps > 1:
+                    time.sleep(duration / steps)
+
+    def click(self, x=None, y=None, button="left"):
+        from Xlib import X
+
+        if x is not None and y is not None:
+            self.move(x, y)
+        with self._lock:
+            detail = MOUSE_BUTTONS[button]
+            self._xtest.fake_input(self._display, X.ButtonPress, detail)
+            self._xtest.fake_input(self._display, X.ButtonRelease, detail)
+            self._display.sync()
+
+    def key_down(self, key):
+        from Xlib import X
+
+        with self._lock:
+            keycode, shift, remapped = self._keycode(self._key_keysym(key), {})
+            if shift:
+                self._xtest.fake_input(self._display, X.KeyPress, self._shift)
+            self._xtest.fake_input(self._display, X.KeyPress, keycode)
+            self._display.sync()
+            self._held[key] = (keycode, shift, remapped)
+
+    def key_up(self, key):
+        from Xlib import X
+
+        with self._lock:
+            if key in self._held:
+                keycode, shift, remapped = self._held.pop(key)
+            else:
+                keycode, shift, remapped = self._keycode(self._key_keysym(key), {})
+            self._xtest.fake_input(self._display, X.KeyRelease, keycode)
+            if shift:
+                self._xtest.fake_input(self._display, X.KeyRelease, self._shift)
+            self._display.sync()
+            if remapped:
+                self._restore(remapped)
+
+    def press_key(self, key):
+        self.key_down(key)
+        self.key_up(key)
+
+    def type_text(self, text):
+        from Xlib import X
+
+        remapped_total = 0
+        with self._lock:
+            remapped = {}
+            for char in text:
+                keysym = self._char_keysym(char)
+                keycode, shift = self._layout_keycode(keysym)
+                if keycode is None:
+                    if keysym not in remapped and len(remapped) >= len(self._spare):
+                        # out of spare keycodes: let the batch be read, then reuse them
+                        self._display.sync()
+                        self._restore(remapped)
+                        remapped = {}
+                    keycode, shift, remapped = self._keycode(keysym, remapped)
+                    remapped_total += 1
+                if shift:
+                    self._xtest.fake_input(self._display, X.KeyPress, self._shift)
+                self._xtest.fake_input(self._display, X.KeyPress, keycode)
+                self._xtest.fake_input(self._display, X.KeyRelease, keycode)
+                if shift:
+                    self._xtest.fake_input(self._display, X.KeyRelease, self._shift)
+            self._display.sync()
+            if remapped:
+                self._restore(remapped)
+        if config.verbose:
+            print(
+                f"[XTestBackend][type_text] {len(text)} characters, {remapped_total} remapped"
+            )
+
+    def _layout_keycode(self, keysym):
+        """
+        Return `(keycode, shift)` of the key typing `keysym` in the current
+        layout, or `(None, False)`
+        """
+        for keycode, index in sorted(
+            self._display.keysym_to_keycodes(keysym), key=lambda item: item[1]
+        ):
+            if index in (0, 1):
+                return keycode, index == 1
+        return None, False
+
+    def _keycode(self, keysym, remapped):
+        """
+        Return `(keycode, shift, remapped)`, mapping `keysym` onto a spare
+        keycode when the layout has no key for it
+        """
+        if keysym in remapped:
+            return remapped[keysym], False, remapped
+        keycode, shift = self._layout_keycode(keysym)
+        if keycode is not None:
+            return keycode, shift, None
+        if len(remapped) >= len(self._spare):
+            raise RuntimeError(f"no key for keysym {keysym:#x} and no spare keycode")
+        keycode = self._spare[len(remapped)]
+        self._display.change_keyboard_mapping(keycode, [(keysym, keysym)])
+        remapped[keysym] = keycode
+        return keycode, False, remapped
+
+    def _restore(self, remapped):
+        time.sleep(REMAP_SETTLE)
+        for keycode in remapped.values():
+            self._display.change_keyboard_mapping(keycode, [(0, 0)])
+        self._display.sync()
+
+    def _key_keysym(self, key):
+        name = X_KEY_NAMES.get(key.lower(), key)
+        if len(name) == 1:
+            return self._char_keysym(name)
+        if name.lower().startswith("f") and name[1:].isdigit():
+            name = name.upper()
+        keysym = self._XK.string_to_keysym(name)
+        if not keysym:
+            raise ValueError(f"unknown key {key!r}")
+        return keysym
+
+    def _char_keysym(self, char):
+        if char in "\r\n":
+            return self._XK.string_to_keysym("Return")
+        if char == "\t":
+            return self._XK.string_to_keysym("Tab")
+        code = ord(char)
+        # Latin-1 keysyms equal their code points, the rest use the Unicode range
+        if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF:
+            return code
+        return 0x01000000 | code
+
+
+def get_input_backend(name=None):
+    """
+    Return the process's input backend, creating it on first use
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_input_backend(name)
+        return _backend
+
+
+def create_input_backend(name=None):
+    name = (name or os.getenv("OPERATE_INPUT") or "auto").lower()
+    if name not in ("auto", "xtest", "pyautogui"):
+        raise ValueError(f"unknown input backend {name!r}")
+    if name == "xtest" or (name == "auto" and platform.system() == "Linux"):
+        try:
+            return XTestBackend()
+        except Exception as e:
+            if name == "xtest":
+                raise
+            if config.verbose:
+                print("[create_input_backend] XTest unavailable, using pyautogui:", e)
+    return PyAutoGUIBackend()
+
@@ -4,8 +4,41 @@ import json
 import os
 import time
 import asyncio
+import threading
 from PIL import Image, ImageDraw
 
+_yolo_model = None
+_yolo_model_lock = threading.Lock()
+
+
+def get_yolo_model():
+    """
+    Return the shared YOLO button detector, or a stand-in for the host's
+    shared inference server when `OPERATE_INFERENCE` is set
+    """
+    from operate.utils.inference import InferenceClient, RemoteYOLO, inference_address
+
+    address = inference_address()
+    if address:
+        return RemoteYOLO(InferenceClient(address))
+    return load_yolo_model()
+
+
+def load_yolo_model():
+    """
+    Return the YOLO button detector of this process, loading it on first use
+    """
+    global _yolo_model
+    with _yolo_model_lock:
+        if _yolo_model is None:
+            import pkg_resources
+            from ultralytics import YOLO
+
+            _yolo_model = YOLO(
+                pkg_resources.resource_filename("operate.models.weights", "best.pt")
+            )
+    return _yolo_model
+
 
 def validate_and_extract_image_data(data):
     if not data or "messages" not in data:
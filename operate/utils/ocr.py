@@ -1,11 +1,46 @@
 from operate.config import Config
 from PIL import Image, ImageDraw
 import os
+import threading
 from datetime import datetime
 
 # Load configuration
 config = Config()
 
+_ocr_reader = None
+_ocr_reader_lock = threading.Lock()
+
+
+def get_ocr_reader():
+    """
+    Return the shared EasyOCR reader, or a stand-in for the host's shared
+    inference server when `OPERATE_INFERENCE` is set
+    """
+    from operate.utils.inference import (
+        InferenceClient,
+        RemoteOCRReader,
+        inference_address,
+    )
+
+    address = inference_address()
+    if address:
+        return RemoteOCRReader(InferenceClient(address))
+    return load_ocr_reader()
+
+
+def load_ocr_reader():
+    """
+    Return the EasyOCR reader of this process, loading it on first use.
+    Loading takes seconds, so it is done once per process.
+    """
+    global _ocr_reader
+    with _ocr_reader_lock:
+        if _ocr_reader is None:
+            import easyocr
+
+            _ocr_reader = easyocr.Reader(["en"])
+    return _ocr_reader
+
 
 def get_text_element(result, search_text, image_path):
     """
@@ -1,27 +1,98 @@
-import pyautogui
+import os
 import platform
 import time
 import math
 
+from operate.utils.action_timing import get_timing_profile
+from operate.utils.clipboard import read_clipboard, write_clipboard
+from operate.utils.input import get_input_backend
 from operate.utils.misc import convert_percent_to_decimal
+from operate.utils.windows import (
+    active_window_title,
+    focus_window,
+    launch_app,
+    list_windows,
+    open_url,
+)
+
+# `write` pastes text at least this long (and any non-ASCII text) through the
+# clipboard instead of typing it; a negative value always types
+PASTE_THRESHOLD = 100
+try:
+    PASTE_THRESHOLD = int(os.getenv("OPERATE_PASTE_THRESHOLD", PASTE_THRESHOLD))
+except ValueError:
+    print(
+        f"[OperatingSystem] invalid OPERATE_PASTE_THRESHOLD "
+        f"`{os.getenv('OPERATE_PASTE_THRESHOLD')}`, using {PASTE_THRESHOLD}"
+    )
+# time the focused application gets to read the clipboard before it is restored
+PASTE_SETTLE = 0.3
 
 
 class OperatingSystem:
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        """
+        The input backend, XTest or pyautogui (see `operate.utils.input`),
+        connected on first use
+        """
+        if self._backend is None:
+            self._backend = get_input_backend()
+        return self._backend
+
     def write(self, content):
         try:
             content = content.replace("\\n", "\n")
-            for char in content:
-                pyautogui.write(char)
+            self.insert_text(content)
         except Exception as e:
             print("[OperatingSystem][write] error:", e)
 
+    def insert_text(self, content):
+        """
+        Paste long or non-ASCII text, type the rest
+        """
+        if self.should_paste(content) and self.paste(content):
+            return "paste"
+        self.backend.type_text(content)
+        return "type"
+
+    def should_paste(self, content):
+        if PASTE_THRESHOLD < 0 or not content:
+            return False
+        return len(content) >= PASTE_THRESHOLD or not content.isascii()
+
+    def paste(self, content):
+        """
+        Paste `content` with the platform paste chord and restore the previous
+        clipboard. Trailing newlines are pressed as Enter, as typing would.
+        Returns `False` without side effects when the clipboard is unusable.
+        """
+        text = content.rstrip("\n")
+        if text:
+            previous = read_clipboard()
+            if not write_clipboard(text):
+                return False
+            chord = ["command", "v"] if platform.system() == "Darwin" else ["ctrl", "v"]
+            self.press(chord)
+            time.sleep(PASTE_SETTLE)
+            if read_clipboard() != text:
+                print("[OperatingSystem][paste] clipboard changed while pasting")
+            if previous is not None:
+                write_clipboard(previous)
+        for _ in range(len(content) - len(text)):
+            self.backend.press_key("enter")
+        return True
+
     def press(self, keys):
         try:
             for key in keys:
-                pyautogui.keyDown(key)
-            time.sleep(0.1)
+                self.backend.key_down(key)
+            time.sleep(get_timing_profile().key_hold)
             for key in keys:
-                pyautogui.keyUp(key)
+                self.backend.key_up(key)
         except Exception as e:
             print("[OperatingSystem][press] error:", e)
 
@@ -36,28 +107,57 @@ class OperatingSystem:
         except Exception as e:
             print("[OperatingSystem][mouse] error:", e)
 
+    def window_title(self):
+        """
+        Title of the focused window, or `None` when it cannot be read
+        """
+        return active_window_title()
+
+    def windows(self):
+        return list_windows()
+
+    def open_url(self, url):
+        """
+        Open `url` in the default browser. Like `launch_app` and
+        `focus_window`, returns a message and the windows afterwards.
+        """
+        return open_url(url)
+
+    def launch_app(self, name):
+        return launch_app(name)
+
+    def focus_window(self, query):
+        return focus_window(query)
+
     def click_at_percentage(
         self,
         x_percentage,
         y_percentage,
-        duration=0.2,
-        circle_radius=50,
-        circle_duration=0.5,
+        duration=None,
+        circle_radius=None,
+        circle_duration=None,
     ):
+        # unset arguments come from the timing profile
+        profile = get_timing_profile()
+        duration = profile.move_duration if duration is None else duration
+        circle_radius = profile.circle_radius if circle_radius is None else circle_radius
+        circle_duration = (
+            profile.circle_duration if circle_duration is None else circle_duration
+        )
         try:
-            screen_width, screen_height = pyautogui.size()
+            screen_width, screen_height = self.backend.screen_size()
             x_pixel = int(screen_width * float(x_percentage))
             y_pixel = int(screen_height * float(y_percentage))
 
-            pyautogui.moveTo(x_pixel, y_pixel, duration=duration)
+            self.backend.move(x_pixel, y_pixel, duration=duration)
 
             start_time = time.time()
             while time.time() - start_time < circle_duration:
                 angle = ((time.time() - start_time) / circle_duration) * 2 * math.pi
                 x = x_pixel + math.cos(angle) * circle_radius
                 y = y_pixel + math.sin(angle) * circle_radius
-                pyautogui.moveTo(x, y, duration=0.1)
+                self.backend.move(x, y, duration=0.1)
 
-            pyautogui.click(x_pixel, y_pixel)
+            self.backend.click(x_pixel, y_pixel)
         except Exception as e:
             print("[OperatingSystem][click_at_percentage] error:", e)
@@ -0,0 +1,249 @@
+"""
+Sampling profiler for whole sessions.
+
+A background thread snapshots the Python stacks of the profiled threads at a
+fixed interval. Every sample is attributed to the pipeline stage open on that
+thread (see `operate.utils.timing.stage`), so a slow step can be split into
+torch, PIL, base64, pyautogui pauses or waiting on the network.
+
+When the session ends the profile is written as collapsed stacks (for
+`flamegraph.pl` and similar tools) and as a speedscope file
+(https://www.speedscope.app), and a per-stage summary of the hottest
+functions is printed.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from operate.utils.style import ANSI_BLUE, ANSI_RESET
+from operate.utils.timing import STAGES, active_stage
+
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 10
+OTHER_STAGE = "other"
+
+# the profiler running in this process, see `register_thread`
+_active = None
+
+
+def register_thread():
+    """
+    Have the running profiler also sample the calling thread, e.g. a worker
+    started per step
+    """
+    profiler = _active
+    if profiler is not None:
+        profiler.add_thread(threading.get_ident())
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the given threads, or of every thread but the
+    excluded ones when `thread_ids` is `None`
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, thread_ids=None, exclude=(), max_depth=128):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.exclude = set(exclude)
+        self.max_depth = max_depth
+        # (stage, stack tuple) -> sampled seconds
+        self.stacks = defaultdict(float)
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+    def add_thread(self, thread_id):
+        if self.thread_ids is not None:
+            self.thread_ids.add(thread_id)
+
+    def start(self):
+        global _active
+        _active = self
+        self._stop.clear()
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="operate-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        global _active
+        if self._thread is None:
+            return self
+        if _active is self:
+            _active = None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.duration = time.perf_counter() - self._start_time
+        return self
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            # weight by the real gap so time spent holding the GIL is not lost
+            self._sample(now - last)
+            last = now
+
+    def _sample(self, weight):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or thread_id in self.exclude:
+                continue
+            if self.thread_ids is not None and thread_id not in self.thread_ids:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.reverse()
+            stage_name = active_stage(thread_id) or OTHER_STAGE
+            self.stacks[(stage_name, tuple(stack))] += weight
+            self.samples += 1
+
+    # Reports
+
+    def stage_totals(self):
+        totals = Counter()
+        for (stage_name, _), seconds in self.stacks.items():
+            totals[stage_name] += seconds
+        return totals
+
+    def summary(self, top=DEFAULT_TOP):
+        """
+        Per stage: sampled seconds and the `top` functions by self time
+        (the innermost frame) and by total time (anywhere on the stack)
+        """
+        self_time = defaultdict(Counter)
+        total_time = defaultdict(Counter)
+        for (stage_name, stack), seconds in self.stacks.items():
+            if not stack:
+                continue
+            self_time[stage_name][stack[-1]] += seconds
+            for name in set(stack):
+                total_time[stage_name][name] += seconds
+
+        result = {}
+        for stage_name, seconds in sorted(
+            self.stage_totals().items(), key=lambda item: _stage_order(item[0])
+        ):
+            result[stage_name] = {
+                "seconds": round(seconds, 4),
+                "self": [
+                    {"function": name, "seconds": round(value, 4)}
+                    for name, value in self_time[stage_name].most_common(top)
+                ],
+                "total": [
+                    {"function": name, "seconds": round(value, 4)}
+                    for name, value in total_time[stage_name].most_common(top)
+                ],
+            }
+        return result
+
+    def write_collapsed(self, path):
+        """
+        One `stage;frame;frame;... microseconds` line per distinct stack
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            for (stage_name, stack), seconds in sorted(self.stacks.items()):
+                frames = ";".join((f"[{stage_name}]",) + stack)
+                file.write(f"{frames} {max(1, int(seconds * 1e6))}\n")
+
+    def write_speedscope(self, path, name="operate"):
+        frames = []
+        index = {}
+
+        def frame_index(frame_name):
+            if frame_name not in index:
+                index[frame_name] = len(frames)
+                frames.append({"name": frame_name})
+            return index[frame_name]
+
+        samples = []
+        weights = []
+        for (stage_name, stack), seconds in self.stacks.items():
+            samples.append([frame_index(f"[{stage_name}]")] + [frame_index(f) for f in stack])
+            weights.append(seconds)
+
+        data = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "self-operating-computer",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+
+    def save(self, prefix, top=DEFAULT_TOP):
+        """
+        Write `<prefix>.collapsed.txt`, `<prefix>.speedscope.json` and
+        `<prefix>.summary.json`, and return their paths
+        """
+        directory = os.path.dirname(prefix)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        paths = {
+            "collapsed": f"{prefix}.collapsed.txt",
+            "speedscope": f"{prefix}.speedscope.json",
+            "summary": f"{prefix}.summary.json",
+        }
+        self.write_collapsed(paths["collapsed"])
+        self.write_speedscope(paths["speedscope"], name=os.path.basename(prefix))
+        with open(paths["summary"], "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "duration": round(self.duration, 4),
+                    "samples": self.samples,
+                    "interval": self.interval,
+                    "stages": self.summary(top),
+                },
+                file,
+                indent=2,
+            )
+        return paths
+
+
+def format_summary(summary, top=5, color=True):
+    lines = []
+    for stage_name, data in summary.items():
+        if color:
+            lines.append(f"{ANSI_BLUE}[profile] {stage_name}{ANSI_RESET} {data['seconds']:.2f}s")
+        else:
+            lines.append(f"[profile] {stage_name} {data['seconds']:.2f}s")
+        for entry in data["self"][:top]:
+            lines.append(f"  {entry['seconds']:8.3f}s  {entry['function']}")
+    return "\n".join(lines)
+
+
+def default_prefix(directory="profiles"):
+    return os.path.join(directory, time.strftime("operate-%Y%m%d-%H%M%S"))
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stage_order(name):
+    return (STAGES.index(name) if name in STAGES else len(STAGES), name)
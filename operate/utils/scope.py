@@ -0,0 +1,94 @@
+"""
+Capture scope: the part of the screen the model sees.
+
+`--capture` (`OPERATE_CAPTURE`) is one of
+
+    screen              the whole screen, the default
+    window              the focused window, looked up again for every capture
+    x,y,width,height    a fixed region, in screen pixels
+
+Frames are cropped to the scope when they are captured (see
+`operate.utils.frames.capture_frame`), so requests upload fewer pixels,
+cost fewer image tokens, and OCR has less to read. Every capture uses the
+scope, so the settle sampling, expectations, `wait_for` and skills compare
+frames of the same part of the screen. The model still answers in
+percentages of the image it saw. `to_screen` maps them back to the screen
+before a click. Captures that replay recorded frames are not cropped.
+"""
+import os
+import re
+
+SCOPES = ("screen", "window")
+
+_parsed = {}
+
+
+def parse_scope(value):
+    """
+    The scope `value` names: `None` for the whole screen, `"window"`, or a
+    region `(x, y, width, height)`. Raises `ValueError` for anything else.
+    """
+    value = (value or "screen").strip().lower()
+    if value == "screen":
+        return None
+    if value == "window":
+        return "window"
+    parts = [part for part in re.split(r"[,\s]+", value) if part]
+    try:
+        x, y, width, height = (int(float(part)) for part in parts)
+    except ValueError:
+        raise ValueError(
+            f"Unknown capture scope `{value}`: use screen, window or x,y,width,height"
+        )
+    if width <= 0 or height <= 0:
+        raise ValueError(f"The capture region `{value}` is empty")
+    return x, y, width, height
+
+
+def capture_scope():
+    """
+    The scope set with `OPERATE_CAPTURE`
+    """
+    value = os.getenv("OPERATE_CAPTURE", "screen")
+    if value not in _parsed:
+        try:
+            _parsed[value] = parse_scope(value)
+        except ValueError as e:
+            print(f"[scope] {e}, capturing the whole screen")
+            _parsed[value] = None
+    return _parsed[value]
+
+
+def scope_box(scope, size, active_window=None):
+    """
+    The box (left, top, right, bottom) of `scope` on a screen of `size`, or
+    `None` when it covers the whole screen. `active_window()` returns the
+    focused window for the `window` scope; without one it is the whole screen.
+    """
+    width, height = size
+    if scope is None:
+        return None
+    if scope == "window":
+        active = active_window() if active_window is not None else None
+        if not active or not active.get("width"):
+            return None
+        x, y, w, h = active["x"], active["y"], active["width"], active["height"]
+    else:
+        x, y, w, h = scope
+    left, top = max(int(x), 0), max(int(y), 0)
+    right, bottom = min(int(x + w), width), min(int(y + h), height)
+    if right <= left or bottom <= top or (left, top, right, bottom) == (0, 0, width, height):
+        return None
+    return left, top, right, bottom
+
+
+def to_screen(box, size, x, y):
+    """
+    Map the percentages `x`, `y` of a frame cropped to `box` to percentages
+    of a screen of `size`
+    """
+    left, top, right, bottom = box
+    return (
+        round((left + float(x) * (right - left)) / size[0], 4),
+        round((top + float(y) * (bottom - top)) / size[1], 4),
+    )
@@ -1,42 +1,179 @@
+import io
 import os
 import platform
 import subprocess
-import pyautogui
+import tempfile
 from PIL import Image, ImageDraw, ImageGrab
 import Xlib.display
 import Xlib.X
 import Xlib.Xutil  # not sure if Xutil is necessary
 
+try:
+    import pyautogui
+except Exception:  # pyautogui needs a display, which headless runs do not have
+    pyautogui = None
+
+# Optional replacement for the platform capture, e.g. a synthetic desktop
+_capture_backend = None
+# windows of the replacement's screen, see `capture_windows`
+_windows_backend = None
+# screen size of each X display, see `_x11_screen_size`
+_x11_sizes = {}
+
+
+def set_capture_backend(backend, windows=None):
+    """
+    Route `capture_screen_with_cursor` to `backend(file_path)` and
+    `capture_windows` to `windows()`. Pass `None` to go back to capturing
+    the real screen.
+    """
+    global _capture_backend, _windows_backend
+    _capture_backend = backend
+    _windows_backend = windows
+
+
+def capture_windows():
+    """
+    The windows of the captured screen, as `operate.utils.windows.list_windows`
+    returns them, or `None` when a replacement capture has no windows
+    """
+    if _capture_backend is not None:
+        return _windows_backend() if _windows_backend is not None else None
+    from operate.utils.windows import list_windows
+
+    return list_windows()
+
+
+def capture_active_window():
+    """
+    The focused window of the captured screen, see `capture_windows`. On
+    the real screen only that window is read, see
+    `operate.utils.windows.active_window`.
+    """
+    if _capture_backend is not None:
+        windows = _windows_backend() if _windows_backend is not None else None
+        return next((window for window in windows or () if window.get("active")), None)
+    from operate.utils.windows import active_window
+
+    return active_window()
+
+
+def capture_screen_with_cursor(file_path, box=None):
+    """
+    Capture the screen to `file_path`, only the `box` (left, top, right,
+    bottom) in screen pixels when given
+    """
+    if _capture_backend is not None:
+        _capture_backend(file_path)
+        if box is not None:
+            with Image.open(file_path) as image:
+                cropped = image.crop(box)
+            cropped.save(file_path)
+        return
 
-def capture_screen_with_cursor(file_path):
     user_platform = platform.system()
 
-    if user_platform == "Windows":
-        screenshot = pyautogui.screenshot()
-        screenshot.save(file_path)
-    elif user_platform == "Linux":
-        # Use xlib to prevent scrot dependency for Linux
-        screen = Xlib.display.Display().screen()
-        size = screen.width_in_pixels, screen.height_in_pixels
-        screenshot = ImageGrab.grab(bbox=(0, 0, size[0], size[1]))
-        screenshot.save(file_path)
+    if user_platform in ("Windows", "Linux"):
+        _grab_image(box).save(file_path)
     elif user_platform == "Darwin":  # (Mac OS)
         # Use the screencapture utility to capture the screen with the cursor
-        subprocess.run(["screencapture", "-C", file_path])
+        command = ["screencapture", "-C"]
+        if box is not None:
+            left, top, right, bottom = box
+            command += ["-R", f"{left},{top},{right - left},{bottom - top}"]
+        subprocess.run(command + [file_path])
     else:
         print(f"The platform you're using ({user_platform}) is not currently supported")
 
 
+def grab_screen(box=None):
+    """
+    Capture the screen without keeping a file, only the `box` (left, top,
+    right, bottom) in screen pixels when given. Returns `(image, data)`: the
+    PIL image, or the bytes of the file the capture wrote when it can only
+    capture to a file.
+    """
+    if _capture_backend is None and platform.system() in ("Windows", "Linux"):
+        return _grab_image(box), None
+    fd, file_path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+    try:
+        capture_screen_with_cursor(file_path, box)
+        with open(file_path, "rb") as file:
+            return None, file.read()
+    finally:
+        os.unlink(file_path)
+
+
+def screen_size():
+    """
+    Size of the screen in the units of window geometries and `grab_screen`
+    boxes, or `None` when a replacement capture is used
+    """
+    if _capture_backend is not None:
+        return None
+    if platform.system() == "Linux":
+        return _x11_screen_size()
+    if pyautogui is None:
+        return None
+    # on macOS in points, which `screencapture -R` also takes
+    width, height = pyautogui.size()
+    return width, height
+
+
+def capture_can_sample():
+    """
+    Whether the screen may be captured several times per step. Backends that
+    replay recorded frames set `sampling = False`, since every capture
+    advances them.
+    """
+    return getattr(_capture_backend, "sampling", True)
+
+
+def _grab_image(box=None):
+    if platform.system() == "Windows":
+        if box is None:
+            return pyautogui.screenshot()
+        left, top, right, bottom = box
+        return pyautogui.screenshot(region=(left, top, right - left, bottom - top))
+    # Use xlib to prevent scrot dependency for Linux
+    if box is None:
+        size = _x11_screen_size()
+        box = (0, 0, size[0], size[1])
+    return ImageGrab.grab(bbox=box)
+
+
+def _x11_screen_size():
+    # read once per display: opening a connection for every capture costs a
+    # round trip to the X server
+    name = os.environ.get("DISPLAY")
+    if name not in _x11_sizes:
+        display = Xlib.display.Display()
+        try:
+            screen = display.screen()
+            _x11_sizes[name] = screen.width_in_pixels, screen.height_in_pixels
+        finally:
+            display.close()
+    return _x11_sizes[name]
+
+
 def compress_screenshot(raw_screenshot_filename, screenshot_filename):
     with Image.open(raw_screenshot_filename) as img:
-        # Check if the image has an alpha channel (transparency)
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            # Create a white background image
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            # Paste the image onto the background, using the alpha channel as mask
-            background.paste(img, mask=img.split()[3])  # 3 is the alpha channel
-            # Save the result as JPEG
-            background.save(screenshot_filename, 'JPEG', quality=85)  # Adjust quality as needed
-        else:
-            # If no alpha channel, simply convert and save
-            img.convert('RGB').save(screenshot_filename, 'JPEG', quality=85)
+        with open(screenshot_filename, "wb") as file:
+            file.write(jpeg_bytes(img))
+
+
+def jpeg_bytes(img, quality=85):
+    """
+    Encode a screenshot as JPEG, flattening transparency onto white
+    """
+    # Check if the image has an alpha channel (transparency)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Create a white background image
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        # Paste the image onto the background, using the alpha channel as mask
+        background.paste(img, mask=img.convert('RGBA').split()[3])
+        img = background
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, 'JPEG', quality=quality)  # Adjust quality as needed
+    return buffer.getvalue()
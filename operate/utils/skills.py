@@ -0,0 +1,436 @@
+"""
+Skill library: verified action traces replayed for repeated objectives.
+
+When `OPERATE_SKILLS` (`--skills`) names a JSON file, every run that ends
+with `done` is stored in it as a skill. A skill holds the objective and one
+entry per step: the signature of the frame the step started from (see
+`operate.utils.frames.Frame.signature`), the focused window's title and
+class and the operations that ran, with the text or label each click was grounded on.
+Text the run typed that also appears in the objective becomes a parameter,
+so "Search for the weather in Paris" also serves "Search for the weather in
+Rome".
+
+Before the first model call, a run looks for a skill whose objective
+matches. Skills recorded in the application that has the focus come first.
+Each step of the skill is replayed only after local checks:
+- the focused application and the screen match the step's title, window
+  class and signature;
+- the text of every click is found again with OCR;
+- the operations' expectations hold (see `operate.utils.expect`).
+The first failed check hands the run to the model, which continues from the
+current screen. The run is then stored again: it replaces the skill when it
+started in the same application, and adds a variant of it otherwise.
+"""
+import copy
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from operate.models.prompts import OPERATE_SKILL_HINT
+from operate.utils.frames import signature_distance
+from operate.utils.screenshot import capture_can_sample
+
+# share of signature cells that may differ from the recorded frame
+SIGNATURE_TOLERANCE = 0.05
+# similarity of objectives without parameters that counts as the same
+MATCH_THRESHOLD = 0.9
+# typed text shorter than this is not turned into a parameter
+MIN_PARAMETER = 3
+# keys of an operation kept in a skill
+OPERATION_KEYS = (
+    "thought",
+    "operation",
+    "keys",
+    "content",
+    "text",
+    "label",
+    "x",
+    "y",
+    "expect",
+    "changed",
+    "title",
+    "timeout",
+    "url",
+    "app",
+    "window",
+    "summary",
+)
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def skills_path():
+    return os.getenv("OPERATE_SKILLS") or None
+
+
+def get_skill_library():
+    """
+    The library at `OPERATE_SKILLS`, or `None` when skills are off
+    """
+    path = skills_path()
+    if not path:
+        return None
+    with _libraries_lock:
+        if path not in _libraries:
+            _libraries[path] = SkillLibrary(path)
+        return _libraries[path]
+
+
+def application(title):
+    """
+    The application part of a window title, e.g. `Google Chrome` for
+    `New Tab - Google Chrome`
+    """
+    if not title:
+        return None
+    return title.rsplit(" - ", 1)[-1].strip() or None
+
+
+def _normalize(text):
+    return " ".join(str(text).lower().split())
+
+
+def parameterize(objective, steps):
+    """
+    Turn the text typed by `steps` that also appears in `objective` into
+    parameters. Returns the objective template, the parameter values and
+    the steps with `{0}`, `{1}`, ... in place of the values.
+    """
+    parameters = []
+    for step in steps:
+        for operation in step["operations"]:
+            if operation.get("operation") != "write":
+                continue
+            content = str(operation.get("content") or "").strip()
+            if len(content) < MIN_PARAMETER:
+                continue
+            start = objective.lower().find(content.lower())
+            value = objective[start : start + len(content)] if start >= 0 else None
+            if value and value.lower() not in (p.lower() for p in parameters):
+                parameters.append(value)
+    # longest first, so a value inside another one is not split
+    order = sorted(range(len(parameters)), key=lambda i: -len(parameters[i]))
+    template = objective
+    steps = copy.deepcopy(steps)
+    for index in order:
+        pattern = re.compile(re.escape(parameters[index]), re.IGNORECASE)
+        template = pattern.sub(f"{{{index}}}", template)
+        for step in steps:
+            for operation in step["operations"]:
+                if operation.get("operation") == "write" and operation.get("content"):
+                    operation["content"] = pattern.sub(
+                        f"{{{index}}}", operation["content"]
+                    )
+    return template, parameters, steps
+
+
+def match_template(template, objective):
+    """
+    The parameter values that turn `template` into `objective`, or `None`
+    """
+    parts = re.split(r"(\{\d+\})", _normalize(template))
+    if len(parts) == 1:
+        ratio = difflib.SequenceMatcher(None, parts[0], _normalize(objective)).ratio()
+        return [] if ratio >= MATCH_THRESHOLD else None
+    pattern = "".join(
+        f"(?P<p{part[1:-1]}>.+?)" if re.fullmatch(r"\{\d+\}", part) else re.escape(part)
+        for part in parts
+    )
+    found = re.fullmatch(pattern, _normalize(objective))
+    if found is None:
+        return None
+    # the values keep the casing of the new objective
+    lowered = objective.lower()
+    values = {}
+    for name, value in found.groupdict().items():
+        start = lowered.find(value)
+        values[int(name[1:])] = objective[start : start + len(value)] if start >= 0 else value
+    return [values[index] for index in sorted(values)]
+
+
+def locate_text(frame, text):
+    """
+    Center of the OCR element containing `text` on `frame`, picked like
+    `operate.utils.ocr.get_text_element` does. In percentages of the frame,
+    which covers only the capture scope when one is set: `Frame.to_screen`
+    maps them to the screen.
+    """
+    box = None
+    for element in frame.ocr():
+        if text in element[1]:
+            box = element[0]
+    if box is None:
+        return None
+    width, height = frame.image.size
+    x = (min(point[0] for point in box) + max(point[0] for point in box)) / 2
+    y = (min(point[1] for point in box) + max(point[1] for point in box)) / 2
+    return round(x / width, 3), round(y / height, 3)
+
+
+def fill(operation, parameters):
+    operation = dict(operation)
+    if operation.get("operation") == "write" and operation.get("content"):
+        content = operation["content"]
+        for index, value in enumerate(parameters):
+            content = content.replace(f"{{{index}}}", value)
+        operation["content"] = content
+    return operation
+
+
+class SkillLibrary:
+    """
+    The skills stored in one JSON file. Every change reads the file again,
+    so processes sharing it see each other's skills.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file).get("skills", [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"[SkillLibrary] could not read {self.path}: {e}")
+            return []
+
+    def _save(self, skills):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"version": 1, "skills": skills}, file, indent=1)
+        os.replace(temporary, self.path)
+
+    def _update(self, change):
+        with self._lock:
+            skills = self.load()
+            change(skills)
+            self._save(skills)
+
+    def match(self, objective, title=None):
+        """
+        Return a `SkillReplay` of the best skill for `objective`, or `None`
+        """
+        app = application(title)
+        candidates = []
+        for skill in self.load():
+            parameters = match_template(skill["template"], objective)
+            if parameters is None or len(parameters) != len(skill["parameters"]):
+                continue
+            candidates.append(
+                (
+                    (
+                        app is not None and skill.get("app") == app,
+                        skill.get("verified", 0) - skill.get("failures", 0),
+                        skill.get("updated", ""),
+                    ),
+                    skill,
+                    parameters,
+                )
+            )
+        if not candidates:
+            return None
+        _, skill, parameters = max(candidates, key=lambda candidate: candidate[0])
+        return SkillReplay(skill, parameters)
+
+    def store(self, objective, model, steps):
+        """
+        Store the steps of a successful run, replacing the skill with the
+        same objective template that starts in the same application
+        """
+        template, parameters, steps = parameterize(objective, steps)
+        app = application(steps[0].get("title"))
+        key = f"{_normalize(template)}\n{app}"
+        skill_id = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+        def change(skills):
+            previous = next((s for s in skills if s["id"] == skill_id), {})
+            skills[:] = [s for s in skills if s["id"] != skill_id]
+            skills.append(
+                {
+                    "id": skill_id,
+                    "objective": objective,
+                    "template": template,
+                    "parameters": parameters,
+                    "app": app,
+                    "model": model,
+                    "steps": steps,
+                    "created": previous.get("created", now),
+                    "updated": now,
+                    "replays": previous.get("replays", 0),
+                    "verified": previous.get("verified", 0),
+                    "failures": previous.get("failures", 0),
+                }
+            )
+
+        self._update(change)
+        return skill_id
+
+    def record_replay(self, skill_id, verified):
+        def change(skills):
+            for skill in skills:
+                if skill["id"] == skill_id:
+                    skill["replays"] = skill.get("replays", 0) + 1
+                    key = "verified" if verified else "failures"
+                    skill[key] = skill.get(key, 0) + 1
+
+        self._update(change)
+
+
+class SkillReplay:
+    """
+    The steps of a skill, filled in with the parameters of a new objective
+    """
+
+    def __init__(self, skill, parameters):
+        self.skill = skill
+        self.id = skill["id"]
+        self.parameters = parameters
+        self.steps = skill["steps"]
+        self.index = 0
+
+    def next_step(self, frame, title=None):
+        """
+        Check `frame` and the focused window's `title` against the next
+        step. Returns `(operations, None)`, or `(None, reason)` when the step
+        cannot be replayed.
+        """
+        if self.index >= len(self.steps):
+            return None, "the stored steps ran out"
+        step = self.steps[self.index]
+        expected, app = application(step.get("title")), application(title)
+        # screens of one layout have close signatures, their windows differ
+        if expected is not None and app is not None and expected != app:
+            return None, f"the focused window is `{app}`, not `{expected}`"
+        # the window class also tells apart windows whose titles look alike
+        window = frame.active_window() or {}
+        if step.get("window") and window.get("app") and step["window"] != window["app"]:
+            return None, f"the focused window is a `{window['app']}` window, not `{step['window']}`"
+        distance = signature_distance(step.get("signature"), frame.signature())
+        if distance > SIGNATURE_TOLERANCE:
+            return None, f"the screen differs from the stored step {self.index + 1} ({distance:.0%} of it)"
+        operations = []
+        for operation in step["operations"]:
+            operation = fill(operation, self.parameters)
+            if operation.get("operation") == "click" and operation.get("text"):
+                found = locate_text(frame, operation["text"])
+                if found is None:
+                    return None, f"the text `{operation['text']}` is not on the screen"
+                operation["x"], operation["y"] = found
+            operations.append(operation)
+        self.index += 1
+        return operations, None
+
+    def hint(self, reason):
+        return OPERATE_SKILL_HINT.format(steps=self.index, reason=reason)
+
+
+class SkillRecorder:
+    """
+    Collects the steps of a run, to store them once it is done
+    """
+
+    def __init__(self, objective, model):
+        self.objective = objective
+        self.model = model
+        self.steps = []
+        # a step without a frame cannot be verified on replay
+        self.complete = True
+
+    def step(self, frame, title, operations, diverged=False):
+        """
+        Record the `operations` that ran from `frame`. When the last of them
+        `diverged` from its expectation, the expectation is not kept.
+        """
+        if frame is None:
+            self.complete = False
+            return
+        operations = [
+            {key: operation[key] for key in OPERATION_KEYS if key in operation}
+            for operation in operations
+        ]
+        if diverged and operations:
+            operations[-1].pop("expect", None)
+        window = frame.active_window() or {}
+        self.steps.append(
+            {
+                "signature": frame.signature(),
+                "title": title,
+                "window": window.get("app"),
+                "operations": operations,
+            }
+        )
+
+    def save(self, library):
+        if not self.complete or not self.steps:
+            return None
+        return library.store(self.objective, self.model, self.steps)
+
+
+class SkillRun:
+    """
+    The skills side of one run: replays the matching skill, records the
+    steps that ran and stores them once the run is done
+    """
+
+    def __init__(self, library, objective, model, title=None):
+        self.library = library
+        self.recorder = SkillRecorder(objective, model)
+        # every capture advances a replayed cassette, so its runs only record
+        self.replay = library.match(objective, title) if capture_can_sample() else None
+        self.fallback = None
+        self.stored = None
+
+    @property
+    def replaying(self):
+        return self.replay is not None and self.fallback is None
+
+    def next_step(self, frame, title=None):
+        """
+        The operations of the next stored step, or `None` once the run is
+        handed to the model (see `hint`)
+        """
+        operations, reason = self.replay.next_step(frame, title)
+        if operations is None:
+            self.stop(reason)
+        return operations
+
+    def stop(self, reason):
+        self.fallback = reason
+        self.library.record_replay(self.replay.id, verified=False)
+
+    def hint(self):
+        return self.replay.hint(self.fallback)
+
+    def finish(self, result):
+        if result["outcome"] != "done":
+            return
+        if self.replaying:
+            self.library.record_replay(self.replay.id, verified=True)
+        else:
+            self.stored = self.recorder.save(self.library)
+
+    def to_dict(self):
+        """
+        The skill that was `replayed` and for how many `steps`, why it
+        stopped (`fallback`) and the skill the run was `stored` as
+        """
+        if self.replay is None and self.stored is None:
+            return None
+        return {
+            "replayed": self.replay.id if self.replay is not None else None,
+            "steps": self.replay.index if self.replay is not None else 0,
+            "fallback": self.fallback,
+            "stored": self.stored,
+        }
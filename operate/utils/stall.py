@@ -0,0 +1,153 @@
+"""
+Loop and stall detection.
+
+`StallDetector` remembers the recent steps of a run as (actions, screen)
+pairs: the operations the model planned and the fingerprint of the frame it
+saw (see `operate.utils.frames.Frame.fingerprint`). It reports a stall when
+
+- the screen did not change over the last `STREAK` steps, or
+- the same actions were planned on the same screen `REPEATS` times within
+  the last `WINDOW` steps, which also catches cycles such as A, B, A, B.
+
+Each stall escalates the response:
+1. The next prompt gets a corrective hint.
+2. The run switches to a stronger mode, when `ESCALATIONS` has one, along
+   with the hint.
+3. The run is aborted with the `stalled` outcome.
+
+The operations of a stalled step are not executed. After `STREAK`
+productive steps the escalation starts over. `OPERATE_STALL_DETECTION=0`
+turns detection off.
+"""
+import os
+
+from operate.models.prompts import OPERATE_STALL_HINT
+
+STREAK = 3
+REPEATS = 3
+WINDOW = 12
+
+# stronger mode to switch to, with the same API key and message format
+ESCALATIONS = {
+    "gpt-4": "o1-with-ocr",
+    "gpt-4-with-ocr": "o1-with-ocr",
+    "gpt-4-with-som": "o1-with-ocr",
+}
+
+
+def stall_detection_enabled():
+    return os.getenv("OPERATE_STALL_DETECTION", "1").lower() not in (
+        "0",
+        "false",
+        "no",
+        "off",
+    )
+
+
+def action_signature(operations):
+    """
+    What the operations do and to which target, without their thoughts
+    """
+    signature = []
+    for operation in operations:
+        operate_type = str(operation.get("operation", "")).lower()
+        if operate_type == "click":
+            target = (
+                operation.get("text")
+                or operation.get("label")
+                or (str(operation.get("x")), str(operation.get("y")))
+            )
+        elif operate_type in ("press", "hotkey"):
+            target = tuple(operation.get("keys") or ())
+        elif operate_type == "write":
+            target = operation.get("content")
+        elif operate_type == "wait_for":
+            target = (
+                operation.get("text")
+                or operation.get("title")
+                or operation.get("changed")
+            )
+        elif operate_type in ("open_url", "launch_app", "focus_window"):
+            target = (
+                operation.get("url") or operation.get("app") or operation.get("window")
+            )
+        else:
+            target = None
+        signature.append((operate_type, str(target)))
+    return tuple(signature)
+
+
+def describe(signature):
+    return ", ".join(
+        f"{operate_type} {target}" if target != "None" else operate_type
+        for operate_type, target in signature
+    )
+
+
+class StallDetector:
+    def __init__(self, model, streak=STREAK, repeats=REPEATS, window=WINDOW):
+        self.model = model
+        self.streak_limit = streak
+        self.repeats_limit = repeats
+        self.window = window
+        self.level = 0
+        # every stall reported, for the result of the run
+        self.stalls = []
+        self._history = []
+        self._last_fingerprint = None
+        self._streak = 0
+        self._productive = 0
+
+    def observe(self, step, operations, fingerprint):
+        """
+        Record the operations planned at `step` on the screen with `fingerprint`.
+        Returns `None`, or a dict with the `action` to take (`hint`,
+        `escalate` or `abort`), the `reason`, the `hint` for the next prompt
+        and the `model` to continue with.
+        """
+        if fingerprint is None or any(
+            str(operation.get("operation", "")).lower() == "done"
+            for operation in operations
+        ):
+            return None
+        signature = action_signature(operations)
+        unchanged = fingerprint == self._last_fingerprint
+        self._last_fingerprint = fingerprint
+        self._streak = self._streak + 1 if unchanged else 0
+        self._history = (self._history + [(signature, fingerprint)])[-self.window :]
+        repeats = self._history.count((signature, fingerprint))
+
+        if repeats >= self.repeats_limit:
+            reason = f"You have planned `{describe(signature)}` on the same screen {repeats} times"
+        elif self._streak >= self.streak_limit:
+            reason = f"The screen has not changed over your last {self._streak} steps"
+        else:
+            if not unchanged and repeats == 1:
+                self._productive += 1
+                if self._productive >= self.streak_limit:
+                    self.level = 0
+            return None
+
+        # the next stall needs new evidence; the skipped step changes nothing
+        self.level += 1
+        self._history = []
+        self._last_fingerprint = None
+        self._streak = 0
+        self._productive = 0
+        stronger = ESCALATIONS.get(self.model)
+        if self.level >= 3:
+            action = "abort"
+        elif self.level == 2 and stronger:
+            action = "escalate"
+            self.model = stronger
+        else:
+            action = "hint"
+        self.stalls.append(
+            {"step": step, "action": action, "reason": reason, "model": self.model}
+        )
+        return {
+            "action": action,
+            "reason": reason,
+            "hint": OPERATE_STALL_HINT.format(reason=reason),
+            "model": self.model,
+        }
@@ -0,0 +1,161 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from operate.utils import tracing
+from operate.utils.action_timing import get_timing_profile
+
+# Pipeline stages, in the order a step goes through them
+STAGES = [
+    "capture",
+    "windows",  # reading the window list that goes with a frame
+    "encode",
+    "compaction",  # preparing the message history for the request
+    "model_wait",
+    "parse",
+    "ocr",
+    "yolo",
+    "grounding",
+    "execution",
+    "settle",
+    "verify",  # checking the expected result of an operation
+    "wait_for",
+]
+
+_local = threading.local()
+# thread id -> names of the stages open on that thread, read by the sampling profiler
+_active = {}
+
+
+class StageRecorder:
+    """
+    Collects the duration of every `stage()` block run on the threads it is
+    attached to, and counters such as the tokens used
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration):
+        with self._lock:
+            self.durations.setdefault(name, []).append(duration)
+
+    def count(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                if isinstance(value, (int, float)):
+                    self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        return {
+            name: summarize(durations)
+            for name, durations in sorted(
+                self.durations.items(), key=lambda item: _stage_order(item[0])
+            )
+        }
+
+
+def start_recording(recorder=None):
+    """
+    Attach a recorder to the current thread and return it
+    """
+    recorder = recorder or StageRecorder()
+    _local.recorder = recorder
+    return recorder
+
+
+def stop_recording():
+    recorder = getattr(_local, "recorder", None)
+    _local.recorder = None
+    return recorder
+
+
+def current_recorder():
+    return getattr(_local, "recorder", None)
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Time a pipeline stage and trace it as a span when tracing is on.
+    When nothing is recording it costs two clock reads and the push and pop
+    of the stage name on the thread's open stages, for the profiler.
+    """
+    start_time = time.perf_counter()
+    span = tracing.start_span(name, **attributes)
+    active = _active.setdefault(threading.get_ident(), [])
+    active.append(name)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        active.pop()
+        if not active:
+            # threads come and go (executor, prefetch, serve), so their
+            # entries do not outlive their outermost stage
+            _active.pop(threading.get_ident(), None)
+        recorder = getattr(_local, "recorder", None)
+        if recorder is not None:
+            recorder.add(name, time.perf_counter() - start_time)
+        tracing.end_span(span, error)
+
+
+def count(**values):
+    """
+    Add to the counters of the recorder attached to the current thread, if any
+    """
+    recorder = getattr(_local, "recorder", None)
+    if recorder is not None:
+        recorder.count(**values)
+
+
+def active_stage(thread_id):
+    """
+    Return the innermost stage open on another thread, or `None`
+    """
+    try:
+        return _active.get(thread_id, [])[-1]
+    except IndexError:
+        return None
+
+
+def settle(seconds, cancel_event=None):
+    """
+    `time.sleep` that is accounted as the `settle` stage, scaled by the
+    timing profile (see `operate.utils.action_timing`). With `cancel_event`
+    the wait ends early when it is set; returns whether it was.
+    """
+    seconds *= get_timing_profile().settle_scale
+    with stage("settle", seconds=seconds):
+        if cancel_event is not None:
+            return cancel_event.wait(seconds)
+        time.sleep(seconds)
+    return False
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    count = len(ordered)
+    return {
+        "count": count,
+        "total": round(sum(ordered), 6),
+        "mean": round(sum(ordered) / count, 6) if count else 0.0,
+        "p50": round(_percentile(ordered, 0.5), 6),
+        "p95": round(_percentile(ordered, 0.95), 6),
+    }
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _stage_order(name):
+    return (STAGES.index(name) if name in STAGES else len(STAGES), name)
@@ -0,0 +1,402 @@
+"""
+Structured tracing for the agent loop.
+
+Every objective, step and pipeline stage becomes a span. Finished spans are
+written as one JSON object per line to a rotating log file and, when an OTLP
+endpoint is configured and `opentelemetry-sdk` is installed, exported to a
+collector as well.
+
+Tracing is off unless `configure()` is called (`operate --trace`) or the
+`OPERATE_TRACE` / `OPERATE_TRACE_OTLP` environment variables are set. While
+it is off every helper returns after a single global check.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+_tracer = None
+_local = threading.local()
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.status = "ok"
+        self.error = None
+        self._start_time = time.perf_counter()
+        self._otel = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, duration):
+        record = {
+            "type": "span",
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration": round(duration, 6),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+        if self.error:
+            record["error"] = self.error
+        return record
+
+
+class Tracer:
+    """
+    Writes finished spans to a rotating JSONL file and optionally to OTLP
+    """
+
+    def __init__(
+        self,
+        path=None,
+        otlp_endpoint=None,
+        max_bytes=DEFAULT_MAX_BYTES,
+        backup_count=DEFAULT_BACKUP_COUNT,
+        verbose=False,
+    ):
+        self.path = path
+        self.verbose = verbose
+        self._logger = None
+        self._otel = None
+        self._otel_provider = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"operate.trace.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+        if otlp_endpoint:
+            self._otel_provider, self._otel = _otel_tracer(otlp_endpoint)
+
+    def start_span(self, name, parent=None, **attributes):
+        if parent is None:
+            parent = current_span()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        else:
+            span = Span(name, uuid.uuid4().hex, None, attributes)
+        if self._otel is not None:
+            from opentelemetry import trace
+
+            context = (
+                trace.set_span_in_context(parent._otel)
+                if parent is not None and parent._otel is not None
+                else None
+            )
+            span._otel = self._otel.start_span(name, context=context)
+        _stack().append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        duration = time.perf_counter() - span._start_time
+        if error is not None:
+            span.status = "error"
+            span.error = f"{type(error).__name__}: {error}"
+        stack = _stack()
+        if span in stack:
+            # drop spans left open by an exception as well
+            del stack[stack.index(span) :]
+        self.emit(span.to_dict(duration))
+        if span._otel is not None:
+            _end_otel_span(span)
+
+    def event(self, name, **attributes):
+        """
+        Write a point-in-time record attached to the current span
+        """
+        span = current_span()
+        self.emit(
+            {
+                "type": "event",
+                "name": name,
+                "trace_id": span.trace_id if span else None,
+                "span_id": span.span_id if span else None,
+                "time": round(time.time(), 6),
+                "attributes": attributes,
+            }
+        )
+
+    def emit(self, record):
+        if self._logger is None:
+            return
+        try:
+            self._logger.info(json.dumps(record, default=str, ensure_ascii=False))
+        except Exception as e:
+            if self.verbose:
+                print("[Tracer][emit] error:", e)
+
+    def close(self):
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                handler.close()
+                self._logger.removeHandler(handler)
+        if self._otel_provider is not None:
+            self._otel_provider.shutdown()
+
+
+def configure(path=None, otlp_endpoint=None, **kwargs):
+    """
+    Turn tracing on for the whole process and return the tracer
+    """
+    global _tracer
+    shutdown()
+    if path or otlp_endpoint:
+        _tracer = Tracer(path, otlp_endpoint, **kwargs)
+    return _tracer
+
+
+def configure_from_env():
+    path = os.getenv("OPERATE_TRACE")
+    otlp_endpoint = os.getenv("OPERATE_TRACE_OTLP")
+    if _tracer is None and (path or otlp_endpoint):
+        return configure(path, otlp_endpoint)
+    return _tracer
+
+
+def shutdown():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def current_span():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Open a span without a `with` block. Returns `None` when tracing is off;
+    `end_span` accepts that.
+    """
+    if _tracer is None:
+        return None
+    return _tracer.start_span(name, parent, **attributes)
+
+
+def end_span(span, error=None, **attributes):
+    if span is None or _tracer is None:
+        return
+    span.set(**attributes)
+    _tracer.end_span(span, error)
+
+
+@contextmanager
+def span(name, **attributes):
+    if _tracer is None:
+        yield None
+        return
+    current = _tracer.start_span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        _tracer.end_span(current, e)
+        raise
+    else:
+        _tracer.end_span(current)
+
+
+@contextmanager
+def use_span(parent):
+    """
+    Make `parent`, opened on another thread, the current span of this
+    thread, so the spans started here become its children
+    """
+    if _tracer is None or parent is None:
+        yield parent
+        return
+    stack = _stack()
+    stack.append(parent)
+    try:
+        yield parent
+    finally:
+        if parent in stack:
+            del stack[stack.index(parent) :]
+
+
+def annotate(**attributes):
+    """
+    Add attributes to the innermost open span
+    """
+    if _tracer is None:
+        return
+    current = current_span()
+    if current is not None:
+        current.set(**attributes)
+
+
+def event(name, **attributes):
+    if _tracer is not None:
+        _tracer.event(name, **attributes)
+
+
+class TracedClient:
+    """
+    Proxy around a provider client that adds the request size and the token
+    usage of every request to the current span, normally `model_wait`, and
+    counts the tokens on the thread's stage recorder
+    """
+
+    def __init__(self, client, provider, path=()):
+        self._client = client
+        self._provider = provider
+        self._path = path
+
+    def __getattr__(self, name):
+        from operate.utils.cassette import PROVIDER_METHODS
+
+        path = self._path + (name,)
+        target = PROVIDER_METHODS[self._provider]
+        attribute = getattr(self._client, name)
+        if path == target:
+            return lambda *args, **kwargs: self._call(attribute, args, kwargs)
+        if path == target[: len(path)]:
+            return TracedClient(attribute, self._provider, path)
+        return attribute
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._client, name, value)
+
+    def _call(self, method, args, kwargs):
+        from operate.utils import timing
+
+        if _tracer is not None:
+            annotate(
+                provider=self._provider,
+                model=kwargs.get("model"),
+                request_bytes=payload_bytes([args, kwargs]),
+            )
+        response = method(*args, **kwargs)
+        usage = token_usage(self._provider, response)
+        annotate(**usage)
+        timing.count(requests=1, **usage)
+        return response
+
+
+def payload_bytes(value):
+    """
+    Approximate size of a request: text and base64 frames by length, image
+    paths by file size
+    """
+    if isinstance(value, str):
+        if value.lower().endswith((".png", ".jpg", ".jpeg")) and os.path.isfile(value):
+            return os.path.getsize(value)
+        return len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_bytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_bytes(item) for item in value)
+    if hasattr(value, "size") and isinstance(getattr(value, "size"), tuple):
+        # PIL image sent to Gemini
+        width, height = value.size
+        return width * height * 3
+    return 0
+
+
+def token_usage(provider, response):
+    try:
+        if provider in ("openai", "qwen"):
+            usage = response.usage
+            return {
+                "input_tokens": usage.prompt_tokens,
+                "output_tokens": usage.completion_tokens,
+            }
+        if provider == "anthropic":
+            usage = response.usage
+            return {
+                "input_tokens": usage.input_tokens,
+                "output_tokens": usage.output_tokens,
+            }
+        if provider == "ollama":
+            return {
+                "input_tokens": response["prompt_eval_count"],
+                "output_tokens": response["eval_count"],
+            }
+        if provider == "gemini":
+            usage = response.usage_metadata
+            return {
+                "input_tokens": usage.prompt_token_count,
+                "output_tokens": usage.candidates_token_count,
+            }
+    except (AttributeError, KeyError, TypeError):
+        pass
+    return {}
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _otel_tracer(endpoint):
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print(
+            "OTLP export requires the opentelemetry packages. Please install them using 'pip install -r requirements-otlp.txt'"
+        )
+        return None, None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "self-operating-computer"})
+    )
+    if not endpoint.rstrip("/").endswith("/v1/traces"):
+        endpoint = endpoint.rstrip("/") + "/v1/traces"
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    return provider, provider.get_tracer("operate")
+
+
+def _end_otel_span(span):
+    from opentelemetry.trace import Status, StatusCode
+
+    for key, value in span.attributes.items():
+        if isinstance(value, (str, bool, int, float)):
+            span._otel.set_attribute(key, value)
+        elif value is not None:
+            span._otel.set_attribute(key, json.dumps(value, default=str))
+    if span.error:
+        span._otel.set_status(Status(StatusCode.ERROR, span.error))
+    span._otel.end()
@@ -0,0 +1,136 @@
+"""
+Background warm-up of the first step.
+
+While the user types or speaks the objective, worker threads load the OCR and
+YOLO models (or reach the shared inference server), build the provider client and resolve its host, and take a first
+capture so the screen backend is initialised. The first step then finds
+everything loaded. The loaders are shared and locked, so a step that starts
+before its warm-up is done waits for it instead of loading a second copy.
+"""
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+from operate.config import Config
+from operate.utils.style import ANSI_BLUE, ANSI_RESET
+
+# Load configuration
+config = Config()
+
+# `Config.initialize_<provider>` used by each model
+MODEL_PROVIDERS = {
+    "gpt-4": "openai",
+    "gpt-4-with-som": "openai",
+    "gpt-4-with-ocr": "openai",
+    "o1-with-ocr": "openai",
+    "qwen-vl": "qwen",
+    "gemini-pro-vision": "google",
+    "llava": "ollama",
+    "claude-3": "anthropic",
+}
+OCR_MODELS = {"gpt-4-with-ocr", "o1-with-ocr", "qwen-vl", "claude-3"}
+YOLO_MODELS = {"gpt-4-with-som"}
+
+DEFAULT_HOSTS = {
+    "google": "https://generativelanguage.googleapis.com",
+    "ollama": "http://localhost:11434",
+}
+
+
+class WarmUp:
+    """
+    Runs each task in its own daemon thread as soon as it is added
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.results = {}
+        self._threads = []
+
+    def add(self, name, function):
+        thread = threading.Thread(
+            target=self._run, args=(name, function), name=f"warmup-{name}", daemon=True
+        )
+        self._threads.append(thread)
+        thread.start()
+        return self
+
+    def _run(self, name, function):
+        start_time = time.perf_counter()
+        try:
+            function()
+            self.results[name] = round(time.perf_counter() - start_time, 3)
+            if self.verbose:
+                print(
+                    f"{ANSI_BLUE}[warm_up]{ANSI_RESET} {name} ready in {self.results[name]:.2f}s"
+                )
+        except Exception as e:
+            # warm-up is best effort, the step reports real failures
+            self.results[name] = f"error: {e}"
+            if self.verbose:
+                print(f"{ANSI_BLUE}[warm_up]{ANSI_RESET} {name} failed:", e)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            thread.join(remaining)
+        return self.results
+
+
+def warm_up(model, verbose=False):
+    """
+    Start warming up everything the first step of `model` needs
+    """
+    warm = WarmUp(verbose=verbose)
+    provider = MODEL_PROVIDERS.get(model)
+    if provider:
+        warm.add("client", lambda: open_provider(provider))
+    from operate.utils.inference import InferenceClient, inference_address
+
+    address = inference_address()
+    if address and (model in OCR_MODELS or model in YOLO_MODELS):
+        # the models live in the shared inference server
+        warm.add("inference", InferenceClient(address).ping)
+    else:
+        if model in OCR_MODELS:
+            from operate.utils.ocr import get_ocr_reader
+
+            warm.add("ocr", get_ocr_reader)
+        if model in YOLO_MODELS:
+            from operate.utils.label import get_yolo_model
+
+            warm.add("yolo", get_yolo_model)
+    warm.add("capture", pre_capture)
+    return warm
+
+
+def open_provider(provider):
+    """
+    Build the shared provider client and resolve its host
+    """
+    client = getattr(config, f"initialize_{provider}")()
+    if config.is_replaying():
+        return
+    url = DEFAULT_HOSTS.get(provider)
+    if provider == "ollama" and config.ollama_host:
+        url = config.ollama_host
+    elif provider in ("openai", "qwen", "anthropic"):
+        url = str(client.base_url)
+    parsed = urlparse(url if "://" in url else f"http://{url}")
+    if parsed.hostname:
+        socket.getaddrinfo(
+            parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80)
+        )
+
+
+def pre_capture():
+    """
+    Take a throwaway capture so the display connection and image codecs are
+    loaded. The frame is not reused; the screen changes once the prompt closes.
+    It is kept in memory, so warming up writes nothing to the working directory.
+    """
+    from operate.utils.screenshot import grab_screen
+
+    grab_screen()
@@ -0,0 +1,541 @@
+"""
+The desktop's windows.
+
+On Linux the windows are read and focused through the EWMH properties of the
+root window (`_NET_CLIENT_LIST`, `_NET_ACTIVE_WINDOW`), with python3-xlib,
+which the capture already uses, and programs are started with `xdg-open` or
+their desktop entry. Windows goes through PyGetWindow and `start`, macOS
+through System Events (`osascript`) and `open`.
+
+`open_url`, `launch_app` and `focus_window` back the operations of the same
+names: one local action instead of the search chord, typing the name and
+pressing Enter over several model calls. Each returns a message and the
+window list afterwards.
+
+`describe_windows` turns a window list into the text the prompt gets with
+every frame (see `operate.utils.frames`).
+"""
+import configparser
+import glob
+import os
+import platform
+import re
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+import webbrowser
+
+# seconds `launch_app` and `open_url` wait for a window to show up
+LAUNCH_TIMEOUT = 10
+LAUNCH_INTERVAL = 0.25
+# windows listed in the prompt, focused first
+MAX_LISTED_WINDOWS = 12
+
+# connection to each X display that `active_window` keeps open
+_x11_displays = {}
+_x11_lock = threading.Lock()
+
+
+def active_window_title():
+    """
+    Title of the focused window, or `None` when it cannot be read
+    """
+    try:
+        if platform.system() == "Linux":
+            return _x11_active_window_title()
+        import pygetwindow
+
+        window = pygetwindow.getActiveWindow()
+        # the macOS implementation returns the title itself
+        if isinstance(window, str) or window is None:
+            return window
+        return window.title
+    except Exception:
+        return None
+
+
+def list_windows():
+    """
+    The top-level windows as dicts with their `id`, `title`, `app` (the
+    window class where there is one), geometry (`x`, `y`, `width`,
+    `height` in pixels) and whether they are `active`. Empty when the
+    windows cannot be read.
+    """
+    try:
+        if platform.system() == "Linux":
+            return _x11_list_windows()
+        return _pygetwindow_list_windows()
+    except Exception:
+        return []
+
+
+def active_window():
+    """
+    The focused window as `list_windows` describes it, with only its `id`
+    and geometry on Linux, or `None`. On Linux only `_NET_ACTIVE_WINDOW` is
+    read, over a connection kept open, so it is cheap enough for every
+    capture of the `window` scope.
+    """
+    if platform.system() != "Linux":
+        return next((window for window in list_windows() if window.get("active")), None)
+    try:
+        return _x11_active_window_geometry()
+    except Exception:
+        return None
+
+
+def find_window(windows, query):
+    """
+    The window of `windows` whose title or application matches `query`:
+    an exact match first, then the first one containing it
+    """
+    query = _normalize(query)
+    if not query:
+        return None
+    for window in windows:
+        if query in (_normalize(window.get("title")), _normalize(window.get("app"))):
+            return window
+    for window in windows:
+        if query in _normalize(window.get("title")) or query in _normalize(
+            window.get("app")
+        ):
+            return window
+    return None
+
+
+def focus_window(query):
+    """
+    Bring the window matching `query` to the front. Returns a message and
+    the windows afterwards.
+    """
+    windows = list_windows()
+    window = find_window(windows, query)
+    if window is None and platform.system() == "Darwin":
+        # the windows may not be readable, or the query names the
+        # application rather than a window
+        if subprocess.run(["open", "-a", str(query)], capture_output=True).returncode:
+            return f"no window matches `{query}`", windows
+        return f"activated `{query}`", list_windows()
+    if window is None:
+        return f"no window matches `{query}`", windows
+    try:
+        if platform.system() == "Linux":
+            _x11_activate(window["id"])
+        elif platform.system() == "Darwin":
+            _mac_activate(window)
+        else:
+            window["handle"].activate()
+    except Exception as e:
+        return f"could not focus `{window['title']}`: {e}", windows
+    windows = _wait_for_windows(lambda current: _is_active(current, window["id"]))
+    return f"focused `{window['title']}`", windows
+
+
+def launch_app(name):
+    """
+    Start the application `name`, or focus its window when it already has
+    one, and wait for its window. Returns a message and the windows
+    afterwards.
+    """
+    before = list_windows()
+    window = find_window(before, name)
+    if window is not None:
+        message, windows = focus_window(window["title"] or name)
+        return f"`{name}` was already open, {message}", windows
+    try:
+        command = _launch_command(name)
+        if command is None:
+            return f"no application named `{name}` was found", before
+        _run(command)
+    except Exception as e:
+        return f"could not launch `{name}`: {e}", before
+    known = {window["id"] for window in before}
+    windows = _wait_for_windows(
+        lambda current: any(window["id"] not in known for window in current)
+    )
+    opened = [window for window in windows if window["id"] not in known]
+    if not opened:
+        return f"launched `{name}`, no new window showed up yet", windows
+    if not opened[0].get("active"):
+        _, windows = focus_window(opened[0]["title"])
+    return f"launched `{name}`: `{opened[0]['title']}`", windows
+
+
+def open_url(url):
+    """
+    Open `url` with the default browser. Returns a message and the windows
+    afterwards.
+    """
+    url = str(url).strip()
+    if not re.match(r"^[a-zA-Z][a-zA-Z0-9+.-]*:", url):
+        url = f"https://{url}"
+    before = active_window_title()
+    try:
+        if platform.system() == "Linux" and shutil.which("xdg-open"):
+            _run(["xdg-open", url])
+        elif platform.system() == "Darwin":
+            _run(["open", url])
+        elif not webbrowser.open(url):
+            return f"could not open {url}", list_windows()
+    except Exception as e:
+        return f"could not open {url}: {e}", list_windows()
+    # the browser shows its window, or the page title in an open one
+    windows = _wait_for_windows(
+        lambda current: any(
+            window.get("active") and window["title"] != before for window in current
+        )
+    )
+    return f"opened {url}", windows
+
+
+def describe_windows(windows, limit=MAX_LISTED_WINDOWS):
+    """
+    `windows` as the compact text the prompt gets: the focused window with
+    its geometry, then the titles of the others
+    """
+    if not windows:
+        return "The open windows could not be read."
+
+    def name(window):
+        app = f" ({window['app']})" if window.get("app") else ""
+        return f"`{window.get('title') or ''}`{app}"
+
+    lines = []
+    active = next((window for window in windows if window.get("active")), None)
+    if active is not None:
+        geometry = ""
+        if active.get("width"):
+            geometry = (
+                f", {active['width']}x{active['height']} pixels"
+                f" at {active['x']}, {active['y']}"
+            )
+        lines.append(f"Focused window: {name(active)}{geometry}")
+    others = [window for window in windows if window is not active]
+    if others:
+        listed = ", ".join(name(window) for window in others[:limit])
+        more = f" and {len(others) - limit} more" if len(others) > limit else ""
+        lines.append(f"Other windows: {listed}{more}")
+    return "\n".join(lines)
+
+
+def _normalize(text):
+    return " ".join(str(text or "").lower().split())
+
+
+def _is_active(windows, window_id):
+    return any(window["id"] == window_id and window.get("active") for window in windows)
+
+
+def _wait_for_windows(ready, timeout=LAUNCH_TIMEOUT):
+    """
+    Poll the windows until `ready(windows)` or the timeout, and return them
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        windows = list_windows()
+        # windows that cannot be read will not show up either
+        if not windows or ready(windows) or time.monotonic() >= deadline:
+            return windows
+        time.sleep(LAUNCH_INTERVAL)
+
+
+def _run(command):
+    """
+    Start `command` detached from `operate`, so it outlives the run
+    """
+    options = {}
+    if platform.system() != "Windows":
+        options["start_new_session"] = True
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        **options,
+    )
+
+
+def _launch_command(name):
+    if platform.system() == "Darwin":
+        return ["open", "-a", name]
+    if platform.system() == "Windows":
+        return ["cmd", "/c", "start", "", name]
+    entry = _find_desktop_entry(name)
+    if entry is not None:
+        path, section = entry
+        if shutil.which("gtk-launch"):
+            return ["gtk-launch", os.path.basename(path)]
+        # field codes such as %U stand for files or URLs to open
+        return [
+            part
+            for part in shlex.split(section.get("Exec", ""))
+            if not re.fullmatch(r"%[a-zA-Z]", part)
+        ] or None
+    executable = shutil.which(name) or shutil.which(name.lower().replace(" ", "-"))
+    return [executable] if executable else None
+
+
+def _find_desktop_entry(name):
+    """
+    The desktop entry (`.desktop` file) whose name or file name matches
+    `name`, as its path and `Desktop Entry` section
+    """
+    home = os.getenv("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    directories = [home] + (
+        os.getenv("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+    ).split(":")
+    query = _normalize(name)
+    partial = None
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "applications", "*.desktop"))):
+            parser = configparser.ConfigParser(interpolation=None, strict=False)
+            try:
+                parser.read(path, encoding="utf-8")
+                section = parser["Desktop Entry"]
+            except Exception:
+                continue
+            if section.get("NoDisplay", "").lower() == "true" or not section.get("Exec"):
+                continue
+            names = (
+                _normalize(section.get("Name")),
+                _normalize(os.path.basename(path)[: -len(".desktop")]),
+            )
+            if query in names:
+                return path, section
+            if partial is None and any(query in candidate for candidate in names):
+                partial = path, section
+    return partial
+
+
+def _pygetwindow_list_windows():
+    if platform.system() == "Darwin":
+        return _mac_list_windows()
+    import pygetwindow
+
+    active = pygetwindow.getActiveWindow()
+    return [
+        {
+            "id": window._hWnd,
+            "title": window.title,
+            "app": None,
+            "x": window.left,
+            "y": window.top,
+            "width": window.width,
+            "height": window.height,
+            "active": active is not None and window._hWnd == active._hWnd,
+            "handle": window,
+        }
+        for window in pygetwindow.getAllWindows()
+        if window.title and window.visible
+    ]
+
+
+# one line per window: application, title, x, y, width, height and whether
+# it is the front window of the frontmost application
+_MAC_WINDOWS_SCRIPT = """
+set output to ""
+tell application "System Events"
+    repeat with proc in (processes whose background only is false)
+        set front_app to frontmost of proc
+        set index_ to 0
+        repeat with win in windows of proc
+            set index_ to index_ + 1
+            try
+                set {x_, y_} to position of win
+                set {w_, h_} to size of win
+                set output to output & (name of proc) & tab & (name of win) & tab & x_ & tab & y_ & tab & w_ & tab & h_ & tab & (front_app and index_ = 1) & linefeed
+            end try
+        end repeat
+    end repeat
+end tell
+return output
+"""
+
+
+def _mac_list_windows():
+    """
+    The windows of the visible applications, read through System Events,
+    which needs the accessibility permission `operate` already asks for
+    """
+    result = subprocess.run(
+        ["osascript", "-e", _MAC_WINDOWS_SCRIPT],
+        capture_output=True,
+        text=True,
+        timeout=5,
+    )
+    windows = []
+    for line in result.stdout.splitlines():
+        parts = line.split("\t")
+        if len(parts) != 7:
+            continue
+        app, title, x, y, width, height, active = parts
+        windows.append(
+            {
+                "id": f"{app}\t{title}",
+                "title": title,
+                "app": app,
+                "x": int(float(x)),
+                "y": int(float(y)),
+                "width": int(float(width)),
+                "height": int(float(height)),
+                "active": active == "true",
+            }
+        )
+    return windows
+
+
+def _mac_activate(window):
+    """
+    Bring the application of `window` to the front and raise the window
+    """
+    app = _applescript_string(window["app"])
+    title = _applescript_string(window["title"])
+    subprocess.run(
+        [
+            "osascript",
+            "-e",
+            f"tell application {app} to activate",
+            "-e",
+            f'tell application "System Events" to perform action "AXRaise" of '
+            f"(first window of process {app} whose name is {title})",
+        ],
+        capture_output=True,
+        timeout=5,
+    )
+
+
+def _applescript_string(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _x11_window_title(display, window):
+    name = window.get_full_property(
+        display.intern_atom("_NET_WM_NAME"), display.intern_atom("UTF8_STRING")
+    )
+    if name is not None and name.value:
+        value = name.value
+        return value.decode("utf-8", "replace") if isinstance(value, bytes) else value
+    return window.get_wm_name()
+
+
+def _x11_active_window(display):
+    import Xlib.X
+
+    active = display.screen().root.get_full_property(
+        display.intern_atom("_NET_ACTIVE_WINDOW"), Xlib.X.AnyPropertyType
+    )
+    if active is None or not active.value or not active.value[0]:
+        return None
+    return active.value[0]
+
+
+def _x11_active_window_title():
+    import Xlib.display
+
+    display = Xlib.display.Display()
+    try:
+        active = _x11_active_window(display)
+        if active is None:
+            return None
+        window = display.create_resource_object("window", active)
+        return _x11_window_title(display, window)
+    finally:
+        display.close()
+
+
+def _x11_active_window_geometry():
+    import Xlib.display
+    import Xlib.error
+
+    name = os.environ.get("DISPLAY")
+    with _x11_lock:
+        display = _x11_displays.get(name)
+        if display is None:
+            display = _x11_displays[name] = Xlib.display.Display()
+        try:
+            active = _x11_active_window(display)
+            if active is None:
+                return None
+            window = display.create_resource_object("window", active)
+            geometry = window.get_geometry()
+            origin = display.screen().root.translate_coords(window, 0, 0)
+        except Xlib.error.ConnectionClosedError:
+            # the next capture connects again
+            del _x11_displays[name]
+            raise
+    return {
+        "id": active,
+        "x": origin.x,
+        "y": origin.y,
+        "width": geometry.width,
+        "height": geometry.height,
+        "active": True,
+    }
+
+
+def _x11_list_windows():
+    import Xlib.display
+    import Xlib.X
+
+    display = Xlib.display.Display()
+    try:
+        root = display.screen().root
+        clients = root.get_full_property(
+            display.intern_atom("_NET_CLIENT_LIST"), Xlib.X.AnyPropertyType
+        )
+        active = _x11_active_window(display)
+        windows = []
+        for window_id in clients.value if clients is not None else ():
+            window = display.create_resource_object("window", window_id)
+            try:
+                geometry = window.get_geometry()
+                # the geometry is relative to the frame the window manager added
+                origin = root.translate_coords(window, 0, 0)
+                wm_class = window.get_wm_class()
+                windows.append(
+                    {
+                        "id": window_id,
+                        "title": _x11_window_title(display, window) or "",
+                        "app": wm_class[-1] if wm_class else None,
+                        "x": origin.x,
+                        "y": origin.y,
+                        "width": geometry.width,
+                        "height": geometry.height,
+                        "active": window_id == active,
+                    }
+                )
+            except Exception:
+                # the window closed while it was read
+                continue
+        return windows
+    finally:
+        display.close()
+
+
+def _x11_activate(window_id):
+    """
+    Ask the window manager to focus and raise the window, as a pager would
+    """
+    import Xlib.display
+    import Xlib.X
+    from Xlib.protocol import event
+
+    display = Xlib.display.Display()
+    try:
+        root = display.screen().root
+        window = display.create_resource_object("window", window_id)
+        message = event.ClientMessage(
+            window=window,
+            client_type=display.intern_atom("_NET_ACTIVE_WINDOW"),
+            # source 2: a pager, which window managers always obey
+            data=(32, [2, Xlib.X.CurrentTime, 0, 0, 0]),
+        )
+        root.send_event(
+            message,
+            event_mask=Xlib.X.SubstructureRedirectMask | Xlib.X.SubstructureNotifyMask,
+        )
+        display.flush()
+    finally:
+        display.close()
@@ -95,7 +95,13 @@ AVAILABLE ACTIONS:
 [{{ "thought": "I need to press Enter to search", "operation": "press", "keys": ["enter"] }}]
 ```
 
-4. done - Task completed:
+4. wait_for - Wait until text shows up or the screenshot changes, e.g. while a page loads:
+```
+[{{ "thought": "The results are still loading", "operation": "wait_for", "text": "百度一下", "timeout": 10 }}]
+```
+Use "changed": true instead of "text" to wait for any change. The timeout is in seconds, at most 60.
+
+5. done - Task completed:
 ```
 [{{ "thought": "I have finished the task", "operation": "done", "summary": "Successfully searched for weather" }}]
 ```
@@ -216,6 +222,12 @@ Provide your answer as a JSON array with a SINGLE action to take right now. Ensu
                             
                         normalized_op["keys"] = normalized_keys
                         
+                    # 处理等待操作
+                    elif normalized_op["operation"] == "wait_for":
+                        for key in ("text", "title", "changed", "timeout"):
+                            if key in op:
+                                normalized_op[key] = op[key]
+
                     # 处理完成操作
                     elif normalized_op["operation"] == "done":
                         normalized_op["summary"] = op.get("summary", "操作完成")
@@ -272,6 +284,11 @@ Provide your answer as a JSON array with a SINGLE action to take right now. Ensu
                 return f"按键 {'+'.join(map(str, keys))}"
             else:
                 return f"按键 {keys}"
+
+        elif op_type == "wait_for":
+            if "text" in op:
+                return f"等待文本 '{op.get('text')}'"
+            return "等待画面变化"
                 
         elif op_type == "done":
             return f"完成: {op.get('summary', '操作完成')}"
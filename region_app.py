@@ -9,7 +9,8 @@ import base64
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QComboBox, QLineEdit, QPushButton, QFrame, QGroupBox,
                              QRadioButton, QButtonGroup, QCheckBox, QFileDialog, QMessageBox,
-                             QDesktopWidget, QTabWidget, QTextEdit, QSplitter, QScrollArea)
+                             QDesktopWidget, QTabWidget, QTextEdit, QSplitter, QScrollArea,
+                             QSpinBox, QDoubleSpinBox)
 from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal, QThread, QTimer, QSize
 from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor, QScreen, QTextCursor, QFont
 
@@ -19,6 +20,10 @@ try:
     from operate.utils.operating_system import OperatingSystem
     from operate.models.apis import get_next_action
     from operate.models.prompts import get_system_prompt
+    # 性能剖析与本地等待依赖 prompt_toolkit、PIL 等第三方库
+    from operate.utils.profiler import SamplingProfiler, default_prefix, format_summary
+    from operate.utils.expect import wait_for
+    from operate.utils.frames import Frame
     # 添加特定模型的导入
     import easyocr
     HAS_OPERATE = True
@@ -26,6 +31,13 @@ except ImportError:
     print("警告: 无法导入 operate 模块，将使用简化版功能")
     HAS_OPERATE = False
 
+# 追踪、阶段计时、预算与窗口查询只依赖标准库，简化版中同样可用
+from operate.utils import tracing
+from operate.utils.timing import settle, stage, start_recording, stop_recording
+from operate.utils.budget import DEFAULT_MAX_STEPS, Budget
+from operate.utils.action_timing import TIMING_PROFILES, get_timing_profile, set_timing_profile
+from operate.utils.windows import active_window_title
+
 # 导入我们的区域截图功能
 from region_screenshot import capture_region, generate_screenshot_name
 
@@ -38,6 +50,16 @@ from qwen_api import QwenAPI
 # 全局变量 - 存储边框窗口实例
 border_frame = None
 
+
+def capture_region_frame(region):
+    """
+    截取区域并返回 Frame，供 wait_for 轮询
+    """
+    path = os.path.join("screenshots", "wait_for.png")
+    capture_region(region, path)
+    with open(path, "rb") as file:
+        return Frame(data=file.read())
+
 # 区域选择器类 (保持不变)
 class RegionSelector(QWidget):
     regionSelected = pyqtSignal(QRect)
@@ -244,12 +266,14 @@ class RegionLimitedOperatingSystem:
                 if self.debug:
                     print(f"[DEBUG] 限制后的全屏像素坐标: x={x_pixel_screen}, y={y_pixel_screen}")
                 
-                # 6. 直接使用PyAutoGUI按像素坐标点击
+                # 6. 通过输入后端（XTest 或 PyAutoGUI）按像素坐标点击
                 # 不再转换为百分比，而是直接使用像素坐标
-                import pyautogui
-                pyautogui.moveTo(x_pixel_screen, y_pixel_screen, duration=0.5)
-                time.sleep(0.2)  # 稍等一下，确保移动完成
-                pyautogui.click()
+                # 移动时长和点击前等待由操作速度（时序配置）决定
+                profile = get_timing_profile()
+                backend = self.original_os.backend
+                backend.move(x_pixel_screen, y_pixel_screen, duration=profile.move_duration)
+                time.sleep(profile.click_delay)  # 稍等一下，确保移动完成
+                backend.click()
                 
                 if self.debug:
                     print(f"[DEBUG] 执行点击: 位置=({x_pixel_screen}, {y_pixel_screen})")
@@ -293,9 +317,8 @@ class RegionLimitedOperatingSystem:
             if self.debug:
                 print(f"[DEBUG] 实际写入内容: '{actual_content}'")
             
-            # 使用pyautogui模拟键盘输入
-            import pyautogui
-            pyautogui.write(actual_content)
+            # 长文本和中文等非ASCII文本通过剪贴板粘贴，其余通过输入后端键入
+            self.original_os.insert_text(actual_content)
             
             if self.logger:
                 self.logger.log(f"输入文本: '{actual_content}'", "INFO")
@@ -359,24 +382,24 @@ class RegionLimitedOperatingSystem:
             if self.debug:
                 print(f"[DEBUG] 标准化后的按键: {normalized_keys}")
             
-            # 使用 pyautogui 按下并释放键
+            # 通过输入后端按下并释放键
             try:
-                import pyautogui
+                backend = self.original_os.backend
                 if len(normalized_keys) == 1:
                     # 单个按键
                     key = normalized_keys[0]
-                    pyautogui.press(key)
+                    backend.press_key(key)
                     if self.debug:
                         print(f"[DEBUG] 按下单个按键: {key}")
                 else:
                     # 组合键
                     for key in normalized_keys:
-                        pyautogui.keyDown(key)
+                        backend.key_down(key)
                     
-                    time.sleep(0.1)  # 短暂暂停
+                    time.sleep(get_timing_profile().key_hold)  # 短暂暂停
                     
                     for key in reversed(normalized_keys):
-                        pyautogui.keyUp(key)
+                        backend.key_up(key)
                     
                     if self.debug:
                         print(f"[DEBUG] 按下组合键: {'+'.join(normalized_keys)}")
@@ -510,6 +533,9 @@ class Logger:
         elif op_type == "press":
             keys = operation.get("keys", [])
             details = f"按键: {keys}"
+        elif op_type == "wait_for":
+            condition = {key: operation[key] for key in ("text", "title", "changed") if key in operation}
+            details = f"等待: {condition or '固定时长'}, 超时 {operation.get('timeout', '默认')} 秒"
         elif op_type == "done":
             summary = operation.get("summary", "")
             details = f"完成, 摘要: {summary}"
@@ -534,11 +560,12 @@ class OpenAIOperateThread(QThread):
     log_message = pyqtSignal(str, str)  # 消息, 类别
     operation_completed = pyqtSignal()
     
-    def __init__(self, objective, region, api_key, logger=None):
+    def __init__(self, objective, region, api_key, logger=None, budget=None):
         super().__init__()
         self.objective = objective
         self.region = region
         self.api_key = api_key
+        self.budget = budget or Budget()  # 步数、时间、令牌和成本上限
         self.running = True
         self.paused = False
         self.logger = logger
@@ -569,7 +596,7 @@ class OpenAIOperateThread(QThread):
         self.update_status.emit("已启动 OpenAI-OCR 模型")
         
         loop_count = 0
-        max_loops = 10
+        objective_span = tracing.start_span("objective", model="gpt-4-with-ocr", objective=self.objective)
         max_retries = 3
         
         # 初始化消息列表
@@ -577,17 +604,28 @@ class OpenAIOperateThread(QThread):
         system_prompt = get_system_prompt("gpt-4-with-ocr", self.objective)
         messages = [{"role": "system", "content": system_prompt}]
         
-        while self.running and loop_count < max_loops:
+        # 每个周期开始前检查预算，令牌用量由记录器统计
+        recorder = start_recording()
+        budget = self.budget.start("gpt-4-with-ocr", recorder)
+        while self.running:
             # 检查是否暂停
             while self.paused and self.running:
                 time.sleep(0.5)
                 
             if not self.running:
                 break
+            
+            exceeded = budget.exceeded(loop_count)
+            if exceeded is not None:
+                budget_msg = f"预算已用尽，停止执行: {exceeded[1]}"
+                self.update_status.emit(budget_msg)
+                self.log_message.emit(budget_msg, "WARNING")
+                break
                 
+            step_span = tracing.start_span("step", step=self.steps_count + 1)
             try:
                 self.steps_count += 1
-                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{max_loops}, 步骤 {self.steps_count})"
+                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{self.budget.max_steps or '不限'}, 步骤 {self.steps_count})"
                 self.update_status.emit(status_msg)
                 self.log_message.emit(status_msg, "INFO")
                 
@@ -602,7 +640,8 @@ class OpenAIOperateThread(QThread):
                 )
                 
                 # 捕获选定区域的截图
-                capture_region(self.region, screenshot_filename)
+                with stage("capture"):
+                    capture_region(self.region, screenshot_filename)
                 self.log_message.emit(f"已捕获区域截图: {screenshot_filename}", "INFO")
                 
                 # 使用OpenAI分析截图
@@ -699,7 +738,8 @@ class OpenAIOperateThread(QThread):
                                 # 初始化 EasyOCR Reader
                                 reader = easyocr.Reader(["en"])
                                 # 读取截图
-                                result = reader.readtext(screenshot_filename)
+                                with stage("ocr"):
+                                    result = reader.readtext(screenshot_filename)
                                 
                                 # 查找匹配的文本
                                 from operate.utils.ocr import get_text_element, get_text_coordinates
@@ -721,43 +761,73 @@ class OpenAIOperateThread(QThread):
                                 operation["x"] = "0.5"
                                 operation["y"] = "0.5"
                         
-                        self.operating_system.mouse(operation)
+                        with stage("execution", operation="click"):
+                            self.operating_system.mouse(operation)
                         
                         # 操作后等待并截图
-                        time.sleep(1.5)
+                        settle(1.5)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_click_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"点击后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "write":
                         content = operation.get("content", "")
-                        self.operating_system.write(content)
+                        with stage("execution", operation="write"):
+                            self.operating_system.write(content)
                         
                         # 输入后等待并截图
-                        time.sleep(1)
+                        settle(1)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_write_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"输入后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "press":
                         keys = operation.get("keys", [])
-                        self.operating_system.press(keys)
+                        with stage("execution", operation="press"):
+                            self.operating_system.press(keys)
                         
                         # 按键后等待并截图
-                        time.sleep(1.5)  # 按键后等待时间稍长，以便页面加载
+                        settle(1.5)  # 按键后等待时间稍长，以便页面加载
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_press_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"按键后截图: {after_action_screenshot}", "INFO")
                         
+                    elif operate_type == "wait_for":
+                        if not HAS_OPERATE:
+                            # 简化版无法在本地轮询，交给模型在下一步重新判断
+                            self.log_message.emit("operate 模块不可用，跳过 wait_for", "WARNING")
+                            break
+                        # 在本地轮询区域截图，直到文本出现或画面变化，期间不调用模型
+                        with stage("wait_for"):
+                            waited = wait_for(
+                                operation,
+                                capture=lambda: capture_region_frame(self.region),
+                                window_title=active_window_title,
+                                cancelled=lambda: not self.running,
+                            )
+                        if waited["held"]:
+                            self.log_message.emit(
+                                f"等待条件已满足: {waited['seconds']} 秒, {waited['polls']} 次截图", "INFO"
+                            )
+                        else:
+                            self.log_message.emit(
+                                f"等待超时: {waited['seconds']} 秒, {'; '.join(waited['failed'])}", "WARNING"
+                            )
+                            # 后续操作依赖未出现的界面，交给模型重新判断
+                            break
+
                     elif operate_type == "done":
                         complete_msg = f"任务完成: {operation.get('summary')}"
                         self.update_status.emit(complete_msg)
@@ -767,11 +837,13 @@ class OpenAIOperateThread(QThread):
                     else:
                         self.log_message.emit(f"未知操作类型: {operate_type}", "WARNING")
                         
-                    time.sleep(1)
+                    settle(1)
                     
+                tracing.end_span(step_span)
                 loop_count += 1
                 
             except Exception as e:
+                tracing.end_span(step_span, e)
                 error_msg = f"步骤 {self.steps_count} 发生错误: {str(e)}"
                 self.update_status.emit(error_msg)
                 self.log_message.emit(error_msg, "ERROR")
@@ -785,7 +857,8 @@ class OpenAIOperateThread(QThread):
                     "screenshots", 
                     f"step{self.steps_count}_error_{int(time.time())}.png"
                 )
-                capture_region(self.region, error_screenshot)
+                with stage("capture"):
+                    capture_region(self.region, error_screenshot)
                 self.log_message.emit(f"错误时的截图: {error_screenshot}", "INFO")
                 
                 # 打印堆栈到控制台
@@ -795,6 +868,15 @@ class OpenAIOperateThread(QThread):
                 self.log_message.emit("暂停3秒后继续尝试...", "INFO")
                 time.sleep(3)
                 
+        spent = budget.spent(loop_count)
+        stop_recording()
+        cost = f"${spent['cost']:.4f}" if spent["cost"] is not None else "未知"
+        self.log_message.emit(
+            f"用量: {spent['steps']} 个周期, {spent['seconds']:.1f} 秒, "
+            f"输入令牌 {spent['input_tokens']}, 输出令牌 {spent['output_tokens']}, 估算成本 {cost}",
+            "INFO",
+        )
+        tracing.end_span(objective_span, steps=self.steps_count)
         self.operation_completed.emit()
                 
     def pause(self):
@@ -815,11 +897,12 @@ class GeminiOperateThread(QThread):
     log_message = pyqtSignal(str, str)  # 消息, 类别
     operation_completed = pyqtSignal()
     
-    def __init__(self, objective, region, api_key, logger=None):
+    def __init__(self, objective, region, api_key, logger=None, budget=None):
         super().__init__()
         self.objective = objective
         self.region = region
         self.api_key = api_key
+        self.budget = budget or Budget()  # 步数、时间、令牌和成本上限
         self.running = True
         self.paused = False
         self.logger = logger
@@ -850,7 +933,7 @@ class GeminiOperateThread(QThread):
         self.update_status.emit("已启动 Gemini 模型")
         
         loop_count = 0
-        max_loops = 10
+        objective_span = tracing.start_span("objective", model="gemini-pro-vision", objective=self.objective)
         max_retries = 3
         
         # 导入Google Gemini
@@ -860,20 +943,32 @@ class GeminiOperateThread(QThread):
             genai.configure(api_key=self.api_key, transport="rest")
         except Exception as e:
             self.log_message.emit(f"初始化Gemini API失败: {str(e)}", "ERROR")
+            tracing.end_span(objective_span, steps=self.steps_count)
             self.operation_completed.emit()
             return
         
-        while self.running and loop_count < max_loops:
+        # 每个周期开始前检查预算，令牌用量由记录器统计
+        recorder = start_recording()
+        budget = self.budget.start("gemini-pro-vision", recorder)
+        while self.running:
             # 检查是否暂停
             while self.paused and self.running:
                 time.sleep(0.5)
                 
             if not self.running:
                 break
+            
+            exceeded = budget.exceeded(loop_count)
+            if exceeded is not None:
+                budget_msg = f"预算已用尽，停止执行: {exceeded[1]}"
+                self.update_status.emit(budget_msg)
+                self.log_message.emit(budget_msg, "WARNING")
+                break
                 
+            step_span = tracing.start_span("step", step=self.steps_count + 1)
             try:
                 self.steps_count += 1
-                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{max_loops}, 步骤 {self.steps_count})"
+                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{self.budget.max_steps or '不限'}, 步骤 {self.steps_count})"
                 self.update_status.emit(status_msg)
                 self.log_message.emit(status_msg, "INFO")
                 
@@ -888,7 +983,8 @@ class GeminiOperateThread(QThread):
                 )
                 
                 # 捕获选定区域的截图
-                capture_region(self.region, screenshot_filename)
+                with stage("capture"):
+                    capture_region(self.region, screenshot_filename)
                 self.log_message.emit(f"已捕获区域截图: {screenshot_filename}", "INFO")
                 
                 # 使用Gemini分析截图
@@ -904,11 +1000,12 @@ class GeminiOperateThread(QThread):
                         system_prompt = get_system_prompt("gemini-pro-vision", self.objective)
                         
                         # 创建Gemini模型
-                        model = genai.GenerativeModel("gemini-pro-vision")
+                        model = tracing.TracedClient(genai.GenerativeModel("gemini-pro-vision"), "gemini")
                         
                         # 调用Gemini API分析截图
                         from PIL import Image
-                        response = model.generate_content([system_prompt, Image.open(screenshot_filename)])
+                        with stage("model_wait"):
+                            response = model.generate_content([system_prompt, Image.open(screenshot_filename)])
                         content = response.text
                         
                         # 解析JSON
@@ -960,43 +1057,73 @@ class GeminiOperateThread(QThread):
                     
                     # 执行操作
                     if operate_type == "click":
-                        self.operating_system.mouse(operation)
+                        with stage("execution", operation="click"):
+                            self.operating_system.mouse(operation)
                         
                         # 操作后等待并截图
-                        time.sleep(1.5)
+                        settle(1.5)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_click_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"点击后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "write":
                         content = operation.get("content", "")
-                        self.operating_system.write(content)
+                        with stage("execution", operation="write"):
+                            self.operating_system.write(content)
                         
                         # 输入后等待并截图
-                        time.sleep(1)
+                        settle(1)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_write_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"输入后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "press":
                         keys = operation.get("keys", [])
-                        self.operating_system.press(keys)
+                        with stage("execution", operation="press"):
+                            self.operating_system.press(keys)
                         
                         # 按键后等待并截图
-                        time.sleep(1.5)  # 按键后等待时间稍长，以便页面加载
+                        settle(1.5)  # 按键后等待时间稍长，以便页面加载
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_press_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"按键后截图: {after_action_screenshot}", "INFO")
                         
+                    elif operate_type == "wait_for":
+                        if not HAS_OPERATE:
+                            # 简化版无法在本地轮询，交给模型在下一步重新判断
+                            self.log_message.emit("operate 模块不可用，跳过 wait_for", "WARNING")
+                            break
+                        # 在本地轮询区域截图，直到文本出现或画面变化，期间不调用模型
+                        with stage("wait_for"):
+                            waited = wait_for(
+                                operation,
+                                capture=lambda: capture_region_frame(self.region),
+                                window_title=active_window_title,
+                                cancelled=lambda: not self.running,
+                            )
+                        if waited["held"]:
+                            self.log_message.emit(
+                                f"等待条件已满足: {waited['seconds']} 秒, {waited['polls']} 次截图", "INFO"
+                            )
+                        else:
+                            self.log_message.emit(
+                                f"等待超时: {waited['seconds']} 秒, {'; '.join(waited['failed'])}", "WARNING"
+                            )
+                            # 后续操作依赖未出现的界面，交给模型重新判断
+                            break
+
                     elif operate_type == "done":
                         complete_msg = f"任务完成: {operation.get('summary')}"
                         self.update_status.emit(complete_msg)
@@ -1006,11 +1133,13 @@ class GeminiOperateThread(QThread):
                     else:
                         self.log_message.emit(f"未知操作类型: {operate_type}", "WARNING")
                         
-                    time.sleep(1)
+                    settle(1)
                     
+                tracing.end_span(step_span)
                 loop_count += 1
                 
             except Exception as e:
+                tracing.end_span(step_span, e)
                 error_msg = f"步骤 {self.steps_count} 发生错误: {str(e)}"
                 self.update_status.emit(error_msg)
                 self.log_message.emit(error_msg, "ERROR")
@@ -1024,7 +1153,8 @@ class GeminiOperateThread(QThread):
                     "screenshots", 
                     f"step{self.steps_count}_error_{int(time.time())}.png"
                 )
-                capture_region(self.region, error_screenshot)
+                with stage("capture"):
+                    capture_region(self.region, error_screenshot)
                 self.log_message.emit(f"错误时的截图: {error_screenshot}", "INFO")
                 
                 # 打印堆栈到控制台
@@ -1034,6 +1164,15 @@ class GeminiOperateThread(QThread):
                 self.log_message.emit("暂停3秒后继续尝试...", "INFO")
                 time.sleep(3)
                 
+        spent = budget.spent(loop_count)
+        stop_recording()
+        cost = f"${spent['cost']:.4f}" if spent["cost"] is not None else "未知"
+        self.log_message.emit(
+            f"用量: {spent['steps']} 个周期, {spent['seconds']:.1f} 秒, "
+            f"输入令牌 {spent['input_tokens']}, 输出令牌 {spent['output_tokens']}, 估算成本 {cost}",
+            "INFO",
+        )
+        tracing.end_span(objective_span, steps=self.steps_count)
         self.operation_completed.emit()
                 
     def pause(self):
@@ -1054,11 +1193,12 @@ class ClaudeOperateThread(QThread):
     log_message = pyqtSignal(str, str)  # 消息, 类别
     operation_completed = pyqtSignal()
     
-    def __init__(self, objective, region, api_key, logger=None):
+    def __init__(self, objective, region, api_key, logger=None, budget=None):
         super().__init__()
         self.objective = objective
         self.region = region
         self.api_key = api_key
+        self.budget = budget or Budget()  # 步数、时间、令牌和成本上限
         self.running = True
         self.paused = False
         self.logger = logger
@@ -1089,15 +1229,16 @@ class ClaudeOperateThread(QThread):
         self.update_status.emit("已启动 Claude-3 模型")
         
         loop_count = 0
-        max_loops = 10
+        objective_span = tracing.start_span("objective", model="claude-3", objective=self.objective)
         max_retries = 3
         
         # 导入Anthropic包
         try:
             import anthropic
-            client = anthropic.Anthropic(api_key=self.api_key)
+            client = tracing.TracedClient(anthropic.Anthropic(api_key=self.api_key), "anthropic")
         except Exception as e:
             self.log_message.emit(f"初始化Claude API失败: {str(e)}", "ERROR")
+            tracing.end_span(objective_span, steps=self.steps_count)
             self.operation_completed.emit()
             return
         
@@ -1106,17 +1247,28 @@ class ClaudeOperateThread(QThread):
         system_prompt = get_system_prompt("claude-3", self.objective)
         messages = [{"role": "system", "content": system_prompt}]
         
-        while self.running and loop_count < max_loops:
+        # 每个周期开始前检查预算，令牌用量由记录器统计
+        recorder = start_recording()
+        budget = self.budget.start("claude-3", recorder)
+        while self.running:
             # 检查是否暂停
             while self.paused and self.running:
                 time.sleep(0.5)
                 
             if not self.running:
                 break
+            
+            exceeded = budget.exceeded(loop_count)
+            if exceeded is not None:
+                budget_msg = f"预算已用尽，停止执行: {exceeded[1]}"
+                self.update_status.emit(budget_msg)
+                self.log_message.emit(budget_msg, "WARNING")
+                break
                 
+            step_span = tracing.start_span("step", step=self.steps_count + 1)
             try:
                 self.steps_count += 1
-                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{max_loops}, 步骤 {self.steps_count})"
+                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{self.budget.max_steps or '不限'}, 步骤 {self.steps_count})"
                 self.update_status.emit(status_msg)
                 self.log_message.emit(status_msg, "INFO")
                 
@@ -1131,7 +1283,8 @@ class ClaudeOperateThread(QThread):
                 )
                 
                 # 捕获选定区域的截图
-                capture_region(self.region, screenshot_filename)
+                with stage("capture"):
+                    capture_region(self.region, screenshot_filename)
                 self.log_message.emit(f"已捕获区域截图: {screenshot_filename}", "INFO")
                 
                 # 使用Claude分析截图
@@ -1196,12 +1349,13 @@ class ClaudeOperateThread(QThread):
                         }
                         
                         # 调用Claude API
-                        response = client.messages.create(
-                            model="claude-3-opus-20240229",
-                            max_tokens=3000,
-                            system=system_message,
-                            messages=[user_message],
-                        )
+                        with stage("model_wait"):
+                            response = client.messages.create(
+                                model="claude-3-opus-20240229",
+                                max_tokens=3000,
+                                system=system_message,
+                                messages=[user_message],
+                            )
                         
                         content = response.content[0].text
                         
@@ -1267,7 +1421,8 @@ class ClaudeOperateThread(QThread):
                                 # 初始化 EasyOCR Reader
                                 reader = easyocr.Reader(["en"])
                                 # 读取截图
-                                result = reader.readtext(screenshot_filename)
+                                with stage("ocr"):
+                                    result = reader.readtext(screenshot_filename)
                                 
                                 # 查找匹配的文本
                                 from operate.utils.ocr import get_text_element, get_text_coordinates
@@ -1289,43 +1444,73 @@ class ClaudeOperateThread(QThread):
                                 operation["x"] = "0.5"
                                 operation["y"] = "0.5"
                         
-                        self.operating_system.mouse(operation)
+                        with stage("execution", operation="click"):
+                            self.operating_system.mouse(operation)
                         
                         # 操作后等待并截图
-                        time.sleep(1.5)
+                        settle(1.5)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_click_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"点击后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "write":
                         content = operation.get("content", "")
-                        self.operating_system.write(content)
+                        with stage("execution", operation="write"):
+                            self.operating_system.write(content)
                         
                         # 输入后等待并截图
-                        time.sleep(1)
+                        settle(1)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_write_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"输入后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "press":
                         keys = operation.get("keys", [])
-                        self.operating_system.press(keys)
+                        with stage("execution", operation="press"):
+                            self.operating_system.press(keys)
                         
                         # 按键后等待并截图
-                        time.sleep(1.5)  # 按键后等待时间稍长，以便页面加载
+                        settle(1.5)  # 按键后等待时间稍长，以便页面加载
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_press_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"按键后截图: {after_action_screenshot}", "INFO")
                         
+                    elif operate_type == "wait_for":
+                        if not HAS_OPERATE:
+                            # 简化版无法在本地轮询，交给模型在下一步重新判断
+                            self.log_message.emit("operate 模块不可用，跳过 wait_for", "WARNING")
+                            break
+                        # 在本地轮询区域截图，直到文本出现或画面变化，期间不调用模型
+                        with stage("wait_for"):
+                            waited = wait_for(
+                                operation,
+                                capture=lambda: capture_region_frame(self.region),
+                                window_title=active_window_title,
+                                cancelled=lambda: not self.running,
+                            )
+                        if waited["held"]:
+                            self.log_message.emit(
+                                f"等待条件已满足: {waited['seconds']} 秒, {waited['polls']} 次截图", "INFO"
+                            )
+                        else:
+                            self.log_message.emit(
+                                f"等待超时: {waited['seconds']} 秒, {'; '.join(waited['failed'])}", "WARNING"
+                            )
+                            # 后续操作依赖未出现的界面，交给模型重新判断
+                            break
+
                     elif operate_type == "done":
                         complete_msg = f"任务完成: {operation.get('summary')}"
                         self.update_status.emit(complete_msg)
@@ -1335,11 +1520,13 @@ class ClaudeOperateThread(QThread):
                     else:
                         self.log_message.emit(f"未知操作类型: {operate_type}", "WARNING")
                         
-                    time.sleep(1)
+                    settle(1)
                     
+                tracing.end_span(step_span)
                 loop_count += 1
                 
             except Exception as e:
+                tracing.end_span(step_span, e)
                 error_msg = f"步骤 {self.steps_count} 发生错误: {str(e)}"
                 self.update_status.emit(error_msg)
                 self.log_message.emit(error_msg, "ERROR")
@@ -1353,7 +1540,8 @@ class ClaudeOperateThread(QThread):
                     "screenshots", 
                     f"step{self.steps_count}_error_{int(time.time())}.png"
                 )
-                capture_region(self.region, error_screenshot)
+                with stage("capture"):
+                    capture_region(self.region, error_screenshot)
                 self.log_message.emit(f"错误时的截图: {error_screenshot}", "INFO")
                 
                 # 打印堆栈到控制台
@@ -1363,6 +1551,15 @@ class ClaudeOperateThread(QThread):
                 self.log_message.emit("暂停3秒后继续尝试...", "INFO")
                 time.sleep(3)
                 
+        spent = budget.spent(loop_count)
+        stop_recording()
+        cost = f"${spent['cost']:.4f}" if spent["cost"] is not None else "未知"
+        self.log_message.emit(
+            f"用量: {spent['steps']} 个周期, {spent['seconds']:.1f} 秒, "
+            f"输入令牌 {spent['input_tokens']}, 输出令牌 {spent['output_tokens']}, 估算成本 {cost}",
+            "INFO",
+        )
+        tracing.end_span(objective_span, steps=self.steps_count)
         self.operation_completed.emit()
                 
     def pause(self):
@@ -1383,18 +1580,20 @@ class QwenOperateThread(QThread):
     log_message = pyqtSignal(str, str)  # 消息, 类别
     operation_completed = pyqtSignal()
     
-    def __init__(self, objective, region, api_key, logger=None):
+    def __init__(self, objective, region, api_key, logger=None, budget=None):
         super().__init__()
         self.objective = objective
         self.region = region
         self.api_key = api_key
+        self.budget = budget or Budget()  # 步数、时间、令牌和成本上限
         self.running = True
         self.paused = False
         self.logger = logger
         self.steps_count = 0  # 步骤计数器
         
-        # 初始化Qwen API
+        # 初始化Qwen API，令牌用量计入预算
         self.qwen_api = QwenAPI(api_key, verbose=True)
+        self.qwen_api.client = tracing.TracedClient(self.qwen_api.client, "qwen")
         
         # 检查是否可以使用原框架
         if HAS_OPERATE:
@@ -1411,20 +1610,31 @@ class QwenOperateThread(QThread):
         self.update_status.emit("已启动 Qwen-VL 模型")
         
         loop_count = 0
-        max_loops = 10
+        objective_span = tracing.start_span("objective", model="qwen-vl", objective=self.objective)
         max_retries = 3
         
-        while self.running and loop_count < max_loops:
+        # 每个周期开始前检查预算，令牌用量由记录器统计
+        recorder = start_recording()
+        budget = self.budget.start("qwen-vl", recorder)
+        while self.running:
             # 检查是否暂停
             while self.paused and self.running:
                 time.sleep(0.5)
                 
             if not self.running:
                 break
+            
+            exceeded = budget.exceeded(loop_count)
+            if exceeded is not None:
+                budget_msg = f"预算已用尽，停止执行: {exceeded[1]}"
+                self.update_status.emit(budget_msg)
+                self.log_message.emit(budget_msg, "WARNING")
+                break
                 
+            step_span = tracing.start_span("step", step=self.steps_count + 1)
             try:
                 self.steps_count += 1
-                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{max_loops}, 步骤 {self.steps_count})"
+                status_msg = f"正在分析屏幕 (周期 {loop_count+1}/{self.budget.max_steps or '不限'}, 步骤 {self.steps_count})"
                 self.update_status.emit(status_msg)
                 self.log_message.emit(status_msg, "INFO")
                 
@@ -1439,7 +1649,8 @@ class QwenOperateThread(QThread):
                 )
                 
                 # 捕获选定区域的截图
-                capture_region(self.region, screenshot_filename)
+                with stage("capture"):
+                    capture_region(self.region, screenshot_filename)
                 self.log_message.emit(f"已捕获区域截图: {screenshot_filename}", "INFO")
                 
                 # 使用Qwen分析截图
@@ -1449,10 +1660,11 @@ class QwenOperateThread(QThread):
                 while retry_count < max_retries and operations is None:
                     try:
                         self.log_message.emit(f"使用Qwen-VL分析截图 (尝试 {retry_count+1}/{max_retries})", "INFO")
-                        operations = self.qwen_api.analyze_for_next_action(
-                            screenshot_filename, 
-                            self.objective
-                        )
+                        with stage("model_wait"):
+                            operations = self.qwen_api.analyze_for_next_action(
+                                screenshot_filename, 
+                                self.objective
+                            )
                         
                         if not operations or not isinstance(operations, list):
                             raise Exception("Qwen返回的操作格式不正确")
@@ -1494,43 +1706,73 @@ class QwenOperateThread(QThread):
                     # 执行操作
                     if operate_type == "click":
                         # 执行点击操作
-                        self.operating_system.mouse(operation)
+                        with stage("execution", operation="click"):
+                            self.operating_system.mouse(operation)
                         
                         # 操作后等待并截图
-                        time.sleep(1.5)
+                        settle(1.5)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_click_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"点击后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "write":
                         content = operation.get("content", "")
-                        self.operating_system.write(content)
+                        with stage("execution", operation="write"):
+                            self.operating_system.write(content)
                         
                         # 输入后等待并截图
-                        time.sleep(1)
+                        settle(1)
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_write_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"输入后截图: {after_action_screenshot}", "INFO")
                         
                     elif operate_type == "press":
                         keys = operation.get("keys", [])
-                        self.operating_system.press(keys)
+                        with stage("execution", operation="press"):
+                            self.operating_system.press(keys)
                         
                         # 按键后等待并截图
-                        time.sleep(1.5)  # 按键后等待时间稍长，以便页面加载
+                        settle(1.5)  # 按键后等待时间稍长，以便页面加载
                         after_action_screenshot = os.path.join(
                             screenshots_dir, 
                             f"step{self.steps_count}_after_press_{int(time.time())}.png"
                         )
-                        capture_region(self.region, after_action_screenshot)
+                        with stage("capture"):
+                            capture_region(self.region, after_action_screenshot)
                         self.log_message.emit(f"按键后截图: {after_action_screenshot}", "INFO")
                         
+                    elif operate_type == "wait_for":
+                        if not HAS_OPERATE:
+                            # 简化版无法在本地轮询，交给模型在下一步重新判断
+                            self.log_message.emit("operate 模块不可用，跳过 wait_for", "WARNING")
+                            break
+                        # 在本地轮询区域截图，直到文本出现或画面变化，期间不调用模型
+                        with stage("wait_for"):
+                            waited = wait_for(
+                                operation,
+                                capture=lambda: capture_region_frame(self.region),
+                                window_title=active_window_title,
+                                cancelled=lambda: not self.running,
+                            )
+                        if waited["held"]:
+                            self.log_message.emit(
+                                f"等待条件已满足: {waited['seconds']} 秒, {waited['polls']} 次截图", "INFO"
+                            )
+                        else:
+                            self.log_message.emit(
+                                f"等待超时: {waited['seconds']} 秒, {'; '.join(waited['failed'])}", "WARNING"
+                            )
+                            # 后续操作依赖未出现的界面，交给模型重新判断
+                            break
+
                     elif operate_type == "done":
                         complete_msg = f"任务完成: {operation.get('summary')}"
                         self.update_status.emit(complete_msg)
@@ -1540,11 +1782,13 @@ class QwenOperateThread(QThread):
                     else:
                         self.log_message.emit(f"未知操作类型: {operate_type}", "WARNING")
                         
-                    time.sleep(1)
+                    settle(1)
                     
+                tracing.end_span(step_span)
                 loop_count += 1
                 
             except Exception as e:
+                tracing.end_span(step_span, e)
                 error_msg = f"步骤 {self.steps_count} 发生错误: {str(e)}"
                 self.update_status.emit(error_msg)
                 self.log_message.emit(error_msg, "ERROR")
@@ -1558,7 +1802,8 @@ class QwenOperateThread(QThread):
                     "screenshots", 
                     f"step{self.steps_count}_error_{int(time.time())}.png"
                 )
-                capture_region(self.region, error_screenshot)
+                with stage("capture"):
+                    capture_region(self.region, error_screenshot)
                 self.log_message.emit(f"错误时的截图: {error_screenshot}", "INFO")
                 
                 # 打印堆栈到控制台
@@ -1568,6 +1813,15 @@ class QwenOperateThread(QThread):
                 self.log_message.emit("暂停3秒后继续尝试...", "INFO")
                 time.sleep(3)
                 
+        spent = budget.spent(loop_count)
+        stop_recording()
+        cost = f"${spent['cost']:.4f}" if spent["cost"] is not None else "未知"
+        self.log_message.emit(
+            f"用量: {spent['steps']} 个周期, {spent['seconds']:.1f} 秒, "
+            f"输入令牌 {spent['input_tokens']}, 输出令牌 {spent['output_tokens']}, 估算成本 {cost}",
+            "INFO",
+        )
+        tracing.end_span(objective_span, steps=self.steps_count)
         self.operation_completed.emit()
                 
     def pause(self):
@@ -1592,6 +1846,7 @@ class RegionOperateApp(QMainWindow):
         
         self.selected_region = None
         self.operate_thread = None
+        self.profiler = None
         self.selector = None
         self.preview_window = None
         self.border_frame = None
@@ -1751,6 +2006,57 @@ class RegionOperateApp(QMainWindow):
         self.task_input.setPlaceholderText("例如: 在百度搜索框中输入'天气'并点击搜索")
         task_layout.addWidget(self.task_input)
         
+        # 性能剖析开关
+        self.profile_checkbox = QCheckBox("性能剖析 (结束时保存火焰图和各阶段热点函数)")
+        self.profile_checkbox.setEnabled(HAS_OPERATE)
+        task_layout.addWidget(self.profile_checkbox)
+        
+        # 操作速度（时序配置）: demo 演示, normal 正常, fast 快速（无动画，直接移动指针）
+        timing_layout = QHBoxLayout()
+        timing_layout.addWidget(QLabel("操作速度:"))
+        self.timing_combo = QComboBox()
+        self.timing_combo.addItems(list(TIMING_PROFILES))
+        self.timing_combo.setCurrentText(get_timing_profile().name)
+        timing_layout.addWidget(self.timing_combo)
+        task_layout.addLayout(timing_layout)
+        
+        # 预算: 任一上限用尽即停止任务，0 表示不限
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("最大周期:"))
+        self.max_steps_input = QSpinBox()
+        self.max_steps_input.setRange(0, 1000)
+        self.max_steps_input.setValue(DEFAULT_MAX_STEPS)
+        self.max_steps_input.setSpecialValueText("不限")
+        budget_layout.addWidget(self.max_steps_input)
+        budget_layout.addWidget(QLabel("最长时间(秒):"))
+        self.max_seconds_input = QSpinBox()
+        self.max_seconds_input.setRange(0, 86400)
+        self.max_seconds_input.setSpecialValueText("不限")
+        budget_layout.addWidget(self.max_seconds_input)
+        budget_layout.addWidget(QLabel("最大成本($):"))
+        self.max_cost_input = QDoubleSpinBox()
+        self.max_cost_input.setRange(0, 1000)
+        self.max_cost_input.setDecimals(2)
+        self.max_cost_input.setSingleStep(0.1)
+        self.max_cost_input.setSpecialValueText("不限")
+        budget_layout.addWidget(self.max_cost_input)
+        task_layout.addLayout(budget_layout)
+        
+        token_layout = QHBoxLayout()
+        token_layout.addWidget(QLabel("输入令牌上限:"))
+        self.max_input_tokens_input = QSpinBox()
+        self.max_input_tokens_input.setRange(0, 100000000)
+        self.max_input_tokens_input.setSingleStep(10000)
+        self.max_input_tokens_input.setSpecialValueText("不限")
+        token_layout.addWidget(self.max_input_tokens_input)
+        token_layout.addWidget(QLabel("输出令牌上限:"))
+        self.max_output_tokens_input = QSpinBox()
+        self.max_output_tokens_input.setRange(0, 100000000)
+        self.max_output_tokens_input.setSingleStep(1000)
+        self.max_output_tokens_input.setSpecialValueText("不限")
+        token_layout.addWidget(self.max_output_tokens_input)
+        task_layout.addLayout(token_layout)
+        
         # 控制按钮
         btn_layout = QHBoxLayout()
         
@@ -1929,6 +2235,15 @@ class RegionOperateApp(QMainWindow):
         
         # 切换到日志选项卡
         self.tabs.setCurrentIndex(1)  # 索引1是日志选项卡
+        
+        # 读取预算设置，0 表示不限
+        budget = Budget(
+            max_steps=self.max_steps_input.value(),
+            max_seconds=self.max_seconds_input.value(),
+            max_input_tokens=self.max_input_tokens_input.value(),
+            max_output_tokens=self.max_output_tokens_input.value(),
+            max_cost=self.max_cost_input.value(),
+        )
             
         # 根据选择的模型创建并启动相应的操作线程
         if selected_id == 1:  # Qwen-VL
@@ -1936,33 +2251,45 @@ class RegionOperateApp(QMainWindow):
                 objective=self.task_input.text(),
                 region=self.selected_region,
                 api_key=api_key,
-                logger=self.logger
+                logger=self.logger,
+                budget=budget
             )
         elif selected_id == 2:  # OpenAI-OCR
             self.operate_thread = OpenAIOperateThread(
                 objective=self.task_input.text(),
                 region=self.selected_region,
                 api_key=api_key,
-                logger=self.logger
+                logger=self.logger,
+                budget=budget
             )
         elif selected_id == 3:  # Gemini
             self.operate_thread = GeminiOperateThread(
                 objective=self.task_input.text(),
                 region=self.selected_region,
                 api_key=api_key,
-                logger=self.logger
+                logger=self.logger,
+                budget=budget
             )
         elif selected_id == 4:  # Claude-3
             self.operate_thread = ClaudeOperateThread(
                 objective=self.task_input.text(),
                 region=self.selected_region,
                 api_key=api_key,
-                logger=self.logger
+                logger=self.logger,
+                budget=budget
             )
         
         self.operate_thread.update_status.connect(self.update_status)
         self.operate_thread.log_message.connect(self.add_log)
         self.operate_thread.operation_completed.connect(self.on_operation_completed)
+        
+        # 应用所选的操作速度
+        set_timing_profile(self.timing_combo.currentText())
+        
+        # 采样除界面线程以外的所有线程
+        if self.profile_checkbox.isChecked() and HAS_OPERATE:
+            self.profiler = SamplingProfiler(exclude=[threading.get_ident()]).start()
+        
         self.operate_thread.start()
         
         # 更新按钮状态
@@ -1972,7 +2299,7 @@ class RegionOperateApp(QMainWindow):
         self.stop_btn.setEnabled(True)
         
         if self.logger:
-            self.logger.log(f"开始操作 - 模型: {model_name}, 任务: {self.task_input.text()}", "INFO")
+            self.logger.log(f"开始操作 - 模型: {model_name}, 操作速度: {self.timing_combo.currentText()}, 预算: {budget}, 任务: {self.task_input.text()}", "INFO")
         
         
     def pause_operation(self):
@@ -2004,6 +2331,18 @@ class RegionOperateApp(QMainWindow):
         self.resume_btn.setEnabled(False)
         self.stop_btn.setEnabled(False)
         self.update_status("操作已完成")
+        self.save_profile()
+        
+    def save_profile(self):
+        """停止性能剖析并保存结果"""
+        if self.profiler is None:
+            return
+        profiler = self.profiler
+        self.profiler = None
+        profiler.stop()
+        paths = profiler.save(default_prefix())
+        self.add_log(format_summary(profiler.summary(), color=False), "INFO")
+        self.add_log(f"性能剖析已保存: {paths['speedscope']}, {paths['collapsed']}", "INFO")
             
     def update_status(self, message):
         """更新状态标签"""
@@ -2046,6 +2385,7 @@ class RegionOperateApp(QMainWindow):
             if reply == QMessageBox.Yes:
                 self.operate_thread.stop()
                 self.operate_thread.wait()
+                self.save_profile()
                 event.accept()
             else:
                 event.ignore()
@@ -2054,6 +2394,7 @@ class RegionOperateApp(QMainWindow):
 
 # 主函数
 def main():
+    tracing.configure_from_env()
     app = QApplication(sys.argv)
     window = RegionOperateApp()
     window.show()
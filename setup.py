@@ -16,11 +16,14 @@ setup(
     entry_points={
         "console_scripts": [
             "operate=operate.main:main_entry",
+            "operate-mock-llm=operate.mock.server:main_entry",
         ],
     },
     package_data={
         # Include the file in the operate.models.weights package
         "operate.models.weights": ["best.pt"],
+        # Scenarios for the synthetic desktop
+        "operate.mock": ["scenarios/*.json"],
     },
     long_description=long_description,  # Add project description here
     long_description_content_type="text/markdown",  # Specify Markdown format